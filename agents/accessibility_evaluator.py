@@ -1,6 +1,8 @@
 from crewai import Agent
 from typing import Any
 
+from core.config import CREW_VERBOSE
+
 def create_accessibility_evaluator(llm: Any = None) -> Agent:
     """
     Creates an Accessibility Evaluator agent that specializes in identifying accessibility issues.
@@ -17,7 +19,7 @@ def create_accessibility_evaluator(llm: Any = None) -> Agent:
              'Evaluate against WCAG standards and provide specific recommendations for improvements.',
         backstory='You are an accessibility consultant with expertise in WCAG guidelines and assistive technologies. '
                  'You help organizations make their digital content accessible to all users, including those with disabilities.',
-        verbose=True,
+        verbose=CREW_VERBOSE,
         llm=llm,
         max_iters=1
     )
\ No newline at end of file
@@ -1,6 +1,8 @@
 from crewai import Agent
 from typing import Any
 
+from core.config import CREW_VERBOSE
+
 def create_html_evaluator(llm: Any = None) -> Agent:
     """
     Creates an HTML Evaluator agent that specializes in identifying HTML structure and semantic issues.
@@ -19,7 +21,7 @@ def create_html_evaluator(llm: Any = None) -> Agent:
         backstory='You are an experienced front-end developer who specializes in HTML semantics and structure. '
                  'You have a keen eye for proper document structure and can identify issues that might affect '
                  'SEO, accessibility, or future maintainability.',
-        verbose=True,
+        verbose=CREW_VERBOSE,
         llm=llm,
         max_iters=1
     )
\ No newline at end of file
@@ -1,6 +1,8 @@
 from crewai import Agent
 from typing import Any
 
+from core.config import CREW_VERBOSE
+
 def create_performance_evaluator(llm: Any = None) -> Agent:
     """
     Creates a Performance Evaluator agent that specializes in identifying performance issues.
@@ -18,7 +20,7 @@ def create_performance_evaluator(llm: Any = None) -> Agent:
         backstory='You are a web performance engineer who has helped numerous companies optimize their '
                  'websites for speed and efficiency. You can identify performance issues by examining '
                  'HTML structure, resource loading, and code patterns.',
-        verbose=True,
+        verbose=CREW_VERBOSE,
         llm=llm,
         max_iters=1
     )
\ No newline at end of file
@@ -1,6 +1,8 @@
 from crewai import Agent
 from typing import Any
 
+from core.config import CREW_VERBOSE
+
 
 def create_ux_evaluator(llm: Any = None) -> Agent:
     """
@@ -20,7 +22,7 @@ def create_ux_evaluator(llm: Any = None) -> Agent:
              'including navigation, layout clarity, and visual accessibility. Identify potential areas for improvement.',
         backstory='You are a seasoned UX expert who reviews websites for usability issues. '
                  'Your recommendations should be actionable and improve the overall user experience.',
-        verbose=True,
+        verbose=CREW_VERBOSE,
         llm=llm,
         max_iters=1
     )
\ No newline at end of file
@@ -0,0 +1,141 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, HttpUrl, Field
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import httpx
+import json
+import time
+
+from api.endpoints import (
+    AnalyzeResponse, prepare, analyze_page, fetch_page, remember_page, fetch_error, request_deadline
+)
+from core.config import BATCH_MAX_URLS, BATCH_MAX_CONCURRENT, OPENAI_MODEL as model_name
+from crew.pipeline import analysis_cache_key
+from utils.fetcher import PageFetcher, PageTooLargeError, page_fetcher
+from utils.sitemap import parse_sitemap
+
+
+class BatchAnalyzeRequest(BaseModel):
+    urls: List[HttpUrl] = Field(default_factory=list, description="URLs of the web pages to analyze")
+    sitemap: Optional[HttpUrl] = Field(None, description="URL of a sitemap.xml whose pages are analyzed too")
+
+class BatchItem(BaseModel):
+    url: str
+    result: Optional[AnalyzeResponse] = None
+    error: Optional[str] = None
+    status_code: Optional[int] = None
+    duplicate_of: Optional[str] = Field(None, description="URL of the page with identical content that was analyzed instead")
+
+
+router = APIRouter(prefix="/api", tags=["analysis"])
+
+
+async def expand_sitemap(fetcher: PageFetcher, sitemap_url: str, limit: int) -> List[str]:
+    """
+    Returns the page URLs listed in a sitemap, following sitemap indexes.
+
+    Args:
+        fetcher: Fetcher used to download the sitemaps
+        sitemap_url: URL of the sitemap or sitemap index
+        limit: Maximum number of page URLs to return
+
+    Returns:
+        List[str]: Page URLs, in sitemap order
+
+    Raises:
+        PageTooLargeError: If a sitemap is larger than the fetcher's byte limit
+    """
+    urls: List[str] = []
+    queue = [sitemap_url]
+    seen = set()
+    while queue and len(urls) < limit:
+        current = queue.pop(0)
+        if current in seen:
+            continue
+        seen.add(current)
+        # Sitemaps are held to the same byte limit as pages
+        fetched = await fetcher.fetch(current)
+        pages, sitemaps = parse_sitemap(fetched.text)
+        urls.extend(pages[:limit - len(urls)])
+        queue.extend(sitemaps)
+    return urls
+
+
+@router.post("/analyze/batch")
+async def analyze_batch(request: BatchAnalyzeRequest):
+    """
+    Analyzes many pages and streams one JSON line per page as each one finishes.
+
+    Pages are fetched through the shared pooled fetcher with its per-host limit,
+    at most BATCH_MAX_CONCURRENT at a time. Pages with identical cleaned content
+    are analyzed once; the others are reported with duplicate_of set.
+    """
+    urls = [str(url) for url in request.urls]
+    try:
+        if request.sitemap:
+            urls.extend(await expand_sitemap(page_fetcher, str(request.sitemap), BATCH_MAX_URLS))
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=e.response.status_code,
+                            detail=f"HTTP error while fetching sitemap: {str(e)}")
+    except PageTooLargeError as e:
+        raise HTTPException(status_code=422, detail=f"Sitemap too large: {str(e)}")
+    except (httpx.RequestError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=f"Could not read sitemap: {str(e)}")
+
+    # Drop repeated URLs, keeping the first occurrence
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        raise HTTPException(status_code=422, detail="No URLs to analyze")
+    if len(urls) > BATCH_MAX_URLS:
+        raise HTTPException(status_code=422,
+                            detail=f"Too many URLs: {len(urls)} (maximum {BATCH_MAX_URLS})")
+
+    semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENT)
+    # Analysis in flight for each content hash, with the URL it was started for
+    in_flight: Dict[str, Tuple[str, asyncio.Task]] = {}
+
+    async def analyze_one(url: str) -> BatchItem:
+        async with semaphore:
+            start_time = time.time()
+            # Each page gets the server's time budget, from when its turn comes
+            request_deadline()
+            try:
+                fetched, unchanged = await fetch_page(url, start_time)
+                if unchanged is not None:
+                    return BatchItem(url=url, result=unchanged)
+                page = await prepare(fetched.text)
+                if not page.chunks:
+                    return BatchItem(url=url, error="Retrieved empty content from URL", status_code=422)
+
+                # Identical cleaned content can still differ in the markup the rules check
+                key = analysis_cache_key(page, model_name) + json.dumps(page.rule_issues)
+                if key in in_flight:
+                    first_url, analysis = in_flight[key]
+                    result = await asyncio.shield(analysis)
+                    return BatchItem(url=url, result=result.model_copy(update={"url": url}),
+                                     duplicate_of=first_url)
+
+                analysis = asyncio.ensure_future(analyze_page(url, page, start_time))
+                in_flight[key] = (url, analysis)
+                result = await analysis
+                remember_page(fetched, result)
+                return BatchItem(url=url, result=result)
+            except (httpx.HTTPError, PageTooLargeError) as e:
+                error = fetch_error(e)
+                return BatchItem(url=url, error=error.detail, status_code=error.status_code)
+            except HTTPException as e:
+                return BatchItem(url=url, error=str(e.detail), status_code=e.status_code)
+
+    async def stream() -> AsyncIterator[str]:
+        tasks = [asyncio.ensure_future(analyze_one(url)) for url in urls]
+        try:
+            for next_item in asyncio.as_completed(tasks):
+                item = await next_item
+                yield item.model_dump_json() + "\n"
+        finally:
+            # The client went away or every page is done: stop what is left
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
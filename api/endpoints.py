@@ -1,34 +1,57 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel, HttpUrl, Field
-from typing import List, Optional, Dict, Any
+from typing import Callable, List, Optional, Dict, Any, Tuple
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
 import httpx
+import logging
+import sqlite3
+import threading
 import time
 import os
 import uuid
 # Import Utils
-from utils.clean_html import clean_html
+from utils.chunk_html import token_budget_for
+from utils.prepare_page import PageSnapshot
+from utils.fetcher import FetchedPage, PageTooLargeError, page_fetcher
 
-# Import LLM
-from core.llm import llm_gpt
+# The LLM and the agents are imported on first use, see core.startup
+from core.config import OPENAI_MODEL as model_name
+from core.startup import analysis_loaded, ensure_analysis_loaded
 
-# Import crew and agent factories
-from agents.ux_evaluator import create_ux_evaluator
-from agents.accessibility_evaluator import create_accessibility_evaluator
-from agents.html_evaluator import create_html_evaluator
-from agents.performance_evaluator import create_performance_evaluator
+# Import crew pipeline
+from crew.pipeline import (
+    EVALUATORS, EVALUATOR_VIEWS, run_analysis, analysis_cache_key, choose_evaluators, content_hash, is_complete
+)
+from crew.selection import EvaluatorChoice
 
-# Import task factories
-from tasks.analyze_ux import create_analyze_ux_task
-from tasks.analyze_accessibility import create_analyze_accessibility_task
-from tasks.analyze_html import create_analyze_html_task
-from tasks.analyze_performance import create_analyze_performance_task
+# Import result cache
+from core.cache import result_cache, section_cache, page_store
 
-# Import crew
-from crew.qa_analyzer import QAAnalyzerCrew
+# Import concurrency limiter
+from core.concurrency import AnalysisLimiter, analysis_limiter, AnalysisQueueFullError, AnalysisQueueTimeoutError
+
+# Import analysis history
+from core.history import history_store
+
+# Import preprocessing pool
+from core.preprocess import preprocess_pool
+
+# Import deadlines
+from core.config import ANALYSIS_DEADLINE
+from core.deadline import Deadline, current_deadline, start_deadline
+
+# Import instrumentation
+from core.metrics import StageTimings, collect_timings, span
 
 # Pydantic models for request and response validation
 class AnalyzeRequest(BaseModel):
     url: HttpUrl = Field(..., description="URL of the web page to analyze")
+    timings: bool = Field(False, description="Include the seconds spent in each stage in the response")
+    evaluators: Optional[List[str]] = Field(None, description="Evaluators to run (ux, accessibility, html, "
+                                            "performance); by default they are chosen from the page's content")
+    timeout: Optional[float] = Field(None, gt=0, description="Seconds the analysis may take, at most the server's "
+                                     "limit; the issues found by then are returned with partial set")
 
 class QualityIssue(BaseModel):
     id: str = Field(..., description="Unique identifier for the issue")
@@ -38,85 +61,399 @@ class QualityIssue(BaseModel):
     element: Optional[str] = Field(None, description="Affected HTML element")
     line: Optional[int] = Field(None, description="Line number where the issue occurs")
 
+class EvaluatorRun(BaseModel):
+    name: str = Field(..., description="Name of the evaluator")
+    ran: bool = Field(..., description="Whether the evaluator analyzed the page")
+    reason: str = Field(..., description="Why it ran, was scaled down or was skipped")
+
 class AnalyzeResponse(BaseModel):
     url: HttpUrl
     issues: List[QualityIssue]
     analysis_time: float
+    cached: bool = False
+    timings: Optional[Dict[str, float]] = Field(None, description="Seconds spent in each stage, when requested")
+    evaluators: List[EvaluatorRun] = Field(default_factory=list, description="Evaluators run on the page and why")
+    partial: bool = Field(False, description="Whether the deadline stopped evaluators before they finished, "
+                                             "whose issues are then missing")
+
+logger = logging.getLogger(__name__)
 
 # Create the router
 router = APIRouter(prefix="/api", tags=["analysis"])
 
+# Seconds between two checks of whether the client of /api/analyze went away
+DISCONNECT_POLL_INTERVAL = 0.5
 
-@router.post("/analyze", response_model=AnalyzeResponse)
-async def analyze_webpage(request: AnalyzeRequest):
-    start_time = time.time()
-    
-    # Fetch HTML content
+
+def to_quality_issues(issues_data: List[Dict]) -> List[QualityIssue]:
+    """
+    Converts issues parsed from agent output to QualityIssue models.
+
+    Raises:
+        pydantic.ValidationError: If an issue lacks a required field
+    """
+    issues = []
+    for issue_data in issues_data:
+        # Ensure the issue has required fields
+        if not issue_data.get('id'):
+            issue_data['id'] = f"auto_{uuid.uuid4().hex[:6]}"
+        issues.append(QualityIssue(**issue_data))
+    return issues
+
+
+async def fetch_page(url: str, start_time: float,
+                     revalidate: bool = True) -> Tuple[FetchedPage, Optional[AnalyzeResponse]]:
+    """
+    Fetches a page through the shared fetcher, revalidating the last copy analyzed.
+
+    A result reused because the page is unchanged is recorded in the history.
+
+    Args:
+        url: URL of the web page
+        start_time: time.time() at which handling of the page started
+        revalidate: Whether the stored result may be reused; off for requests
+            whose result would differ from the stored one (e.g. other evaluators)
+
+    Returns:
+        Tuple[FetchedPage, Optional[AnalyzeResponse]]: The page and, when the
+        server reports it unchanged since its last complete analysis, the result
+        of that analysis, in which case the page has no content
+
+    Raises:
+        PageTooLargeError: If the page is larger than FETCH_MAX_BYTES
+        httpx.HTTPStatusError: If the server answered with an error status
+        httpx.RequestError: If the request itself failed
+    """
+    stored = page_store.get(url) if revalidate else None
+    with span("fetch"):
+        fetched = await page_fetcher.fetch(url, etag=stored["etag"] if stored else None,
+                                           last_modified=stored["last_modified"] if stored else None)
+    if fetched.not_modified and stored is not None:
+        result = AnalyzeResponse(**{**stored["result"], "url": url,
+                                    "analysis_time": time.time() - start_time, "cached": True})
+        # Same content as the last run of the URL, whose hash the history reuses
+        await record_history(result)
+        return fetched, result
+    return fetched, None
+
+
+def remember_page(fetched: FetchedPage, result: AnalyzeResponse) -> None:
+    """
+    Keeps a complete result with the page's validators, for fetch_page to revalidate.
+    """
+    if not (fetched.etag or fetched.last_modified):
+        return
+    if not is_complete([issue.model_dump() for issue in result.issues]):
+        return
+    page_store.set(fetched.url, {"etag": fetched.etag, "last_modified": fetched.last_modified,
+                                 "result": result.model_dump(mode="json", exclude={"timings"})})
+
+
+async def record_history(result: AnalyzeResponse, page_hash: Optional[str] = None) -> None:
+    """
+    Adds a result to the analysis history, see core.history, off the event
+    loop. Failing to is logged, not raised.
+
+    Args:
+        result: The result
+        page_hash: content_hash of the page analyzed, that of the last run of
+            the URL if the page is unchanged
+    """
+    if history_store is None:
+        return
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(str(request.url))
-            response.raise_for_status()
-            html_content = clean_html(response.text)
-    except httpx.HTTPStatusError as e:
-        raise HTTPException(status_code=e.response.status_code, 
-                            detail=f"HTTP error while fetching URL: {str(e)}")
-    except httpx.RequestError as e:
-        raise HTTPException(status_code=500, 
-                            detail=f"Request error while fetching URL: {str(e)}")
-    
-    # Check if content was retrieved
-    if not html_content:
-        raise HTTPException(status_code=422, detail="Retrieved empty content from URL")
+        await asyncio.to_thread(history_store.record, result.model_dump(mode="json", exclude={"timings"}),
+                                page_hash)
+    except sqlite3.Error as e:
+        logger.warning("Could not record the analysis of %s in the history: %s", result.url, e)
+
+
+def fetch_error(e: Exception) -> HTTPException:
+    """
+    Converts an error raised by fetch_page to the HTTPException reported to clients.
+    """
+    if isinstance(e, httpx.HTTPStatusError):
+        return HTTPException(status_code=e.response.status_code,
+                             detail=f"HTTP error while fetching URL: {str(e)}")
+    if isinstance(e, PageTooLargeError):
+        return HTTPException(status_code=422, detail=f"Page too large: {str(e)}")
+    return HTTPException(status_code=500, detail=f"Request error while fetching URL: {str(e)}")
+
+
+def with_timings(result: AnalyzeResponse, timings: Optional[StageTimings]) -> AnalyzeResponse:
+    """
+    Returns the result with the stage timings of the request, if they were collected.
+    """
+    if timings is None:
+        return result
+    return result.model_copy(update={"timings": {**timings.as_dict(), "total": result.analysis_time}})
+
+
+def request_deadline(timeout: Optional[float] = None) -> Deadline:
+    """
+    Starts the deadline of the current request, see core.deadline.
+
+    Args:
+        timeout: Seconds asked for by the client, capped at ANALYSIS_DEADLINE
+    """
+    limits = [limit for limit in (timeout, ANALYSIS_DEADLINE) if limit]
+    return start_deadline(min(limits) if limits else None)
+
+
+async def watch_disconnect(request: Request, deadline: Deadline) -> None:
+    """
+    Cancels the deadline when the client disconnects, until the deadline is cancelled.
+    """
+    while not deadline.cancelled:
+        if await request.is_disconnected():
+            deadline.cancel("disconnect")
+            return
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+
+async def prepare(html: str) -> PageSnapshot:
+    """
+    Parses a fetched page and runs the rule engine on it, large pages in the
+    preprocessing process pool (see core.preprocess).
+
+    Raises:
+        HTTPException: 503 if the preprocessing worker died, 422 if the page
+            could not be prepared
+    """
+    try:
+        return await preprocess_pool.prepare(html, token_budget_for(model_name), EVALUATOR_VIEWS)
+    except BrokenProcessPool as e:
+        raise HTTPException(status_code=503, detail=f"Preprocessing worker failed, please retry: {str(e)}")
+    except Exception as e:
+        logger.warning("Could not prepare a page of %d characters", len(html), exc_info=True)
+        raise HTTPException(status_code=422, detail=f"Could not process the page content: {str(e)}")
+
+
+def select(page: PageSnapshot, requested: Optional[List[str]] = None) -> List[EvaluatorChoice]:
+    """
+    Chooses the evaluators run on a page, see crew.pipeline.choose_evaluators.
+
+    Raises:
+        HTTPException: 422 if requested names an unknown evaluator
+    """
+    try:
+        return choose_evaluators(page, requested)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+class ReportedIssues:
+    """
+    Passes the issues reported during an analysis on to a progress callback,
+    counting those of each evaluator so that a cached result can be replayed
+    the same way (see replay_issues).
+    """
+
+    def __init__(self, on_issues: Optional[Callable[[str, List[Dict]], None]] = None):
+        self.on_issues = on_issues
+        self._counts: Dict[str, int] = {}
+        # Evaluators report from the threads of their tasks
+        self._lock = threading.Lock()
+
+    def add(self, evaluator: str, issues: List[Dict]) -> None:
+        with self._lock:
+            self._counts[evaluator] = self._counts.get(evaluator, 0) + len(issues)
+        if self.on_issues is not None:
+            self.on_issues(evaluator, issues)
+
+    def counts(self, selection: List[EvaluatorChoice]) -> List[Tuple[str, int]]:
+        """
+        Returns the number of issues of each evaluator that ran, in the order
+        run_analysis lists them.
+        """
+        choices = {choice.name: choice for choice in selection}
+        with self._lock:
+            return [(name, self._counts.get(name, 0)) for name, _, _, _ in EVALUATORS if choices[name].run]
+
+
+def replay_issues(cached: Dict[str, Any], on_issues: Callable[[str, List[Dict]], None],
+                  on_done: Optional[Callable[[str], None]] = None) -> None:
+    """
+    Reports the issues of a cached result one evaluator at a time, as
+    ReportedIssues counted them. Results cached without the counts report nothing.
+    """
+    position = 0
+    for evaluator, count in cached.get("evaluators", []):
+        on_issues(evaluator, cached["issues"][position:position + count])
+        position += count
+        if on_done is not None:
+            on_done(evaluator)
+
+
+async def analyze_page(url: str, page: PageSnapshot, start_time: float,
+                       on_issues: Optional[Callable[[str, List[Dict]], None]] = None,
+                       on_start: Optional[Callable[[str], None]] = None,
+                       selection: Optional[List[EvaluatorChoice]] = None,
+                       limiter: Optional[AnalysisLimiter] = None,
+                       on_done: Optional[Callable[[str], None]] = None) -> AnalyzeResponse:
+    """
+    Analyzes a prepared page, answering from the result cache when possible.
+
+    The issues of the rule engine come first, followed by those of the agents.
+    Only the agents' issues are cached: the rules are cheap to run again and
+    look at markup that cleaning drops from the cache key. Rules of an
+    evaluator that does not run are left out too.
+
+    Args:
+        url: URL of the web page
+        page: The page, see prepare
+        start_time: time.time() at which handling of the page started
+        on_issues: Progress callback passed on to run_analysis. It runs on the
+            analysis thread. For a result served from the cache, it is called
+            once per evaluator with all of the evaluator's issues, from a
+            worker thread.
+        on_start: Progress callback passed on to run_analysis, like on_issues
+        selection: Evaluators to run, chosen by the selection policy by default
+            (see select)
+        limiter: Where the analysis runs, the shared analysis_limiter by default
+        on_done: Called with an evaluator name after on_issues got the cached
+            issues of the evaluator, for results served from the cache only
+
+    The analysis stops at the deadline of the request (see request_deadline),
+    and when the caller stops waiting for it. Issues of the evaluators that
+    finished are returned, with partial set. The result is recorded in the
+    history, see record_history.
+
+    Returns:
+        AnalyzeResponse: Issues found in the page
+
+    Raises:
+        HTTPException: When the analysis cannot be queued or fails
+    """
+    selection = selection or select(page)
+    # Rules stand in for their evaluator, so they are left out with it
+    skipped = {choice.name for choice in selection if not choice.run}
+    rule_issues = to_quality_issues([dict(issue) for issue in page.rule_issues if issue["type"] not in skipped])
+    evaluators = [EvaluatorRun(name=choice.name, ran=choice.run, reason=choice.reason) for choice in selection]
+
+    # Return the stored result if this exact content was analyzed before
+    cache_key = analysis_cache_key(page, model_name, selection)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        if on_issues is not None:
+            await asyncio.to_thread(replay_issues, cached, on_issues, on_done)
+        result = AnalyzeResponse(
+            url=url,
+            issues=rule_issues + cached["issues"],
+            analysis_time=time.time() - start_time,
+            cached=True,
+            evaluators=evaluators
+        )
+        await record_history(result, content_hash(page))
+        return result
     
-    print(html_content)
     # Initialize LLM
     try:
+        await ensure_analysis_loaded()
+        from core.llm import llm_gpt
         llm = llm_gpt
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"LLM configuration error: {str(e)}")
     
-    # Create agents
-    ux_agent = create_ux_evaluator(llm)
-    accessibility_agent = create_accessibility_evaluator(llm)
-    html_agent = create_html_evaluator(llm)
-    performance_agent = create_performance_evaluator(llm)
-    
-    # Create tasks
-    ux_task = create_analyze_ux_task(ux_agent, html_content, str(request.url))
-    accessibility_task = create_analyze_accessibility_task(accessibility_agent, html_content, str(request.url))
-    html_task = create_analyze_html_task(html_agent, html_content, str(request.url))
-    performance_task = create_analyze_performance_task(performance_agent, html_content, str(request.url))
-    
-    # Create and run crew
-    crew = QAAnalyzerCrew(
-        agents=[ux_agent, accessibility_agent, html_agent, performance_agent],
-        tasks=[ux_task, accessibility_task, html_task, performance_task]
-    )
-    
+    limiter = limiter or analysis_limiter
+    deadline = current_deadline() or start_deadline()
+    reported = ReportedIssues(on_issues)
     try:
-        issues_data = crew.analyze()
+        # Run the crew off the event loop so other requests keep being served
+        issues_data = await limiter.run(run_analysis, llm, page, url, model_name,
+                                        reported.add, on_start, selection)
         
         # Convert to Pydantic models
-        issues = []
-        for issue_data in issues_data:
-            # Ensure the issue has required fields
-            if not issue_data.get('id'):
-                issue_data['id'] = f"auto_{uuid.uuid4().hex[:6]}"
-            issues.append(QualityIssue(**issue_data))
+        issues = to_quality_issues(issues_data)
+    except asyncio.CancelledError:
+        # Nobody waits for the result any more, the analysis thread stops too
+        deadline.cancel("disconnect")
+        raise
+    except AnalysisQueueFullError as e:
+        raise HTTPException(status_code=429,
+                            detail=f"Too many analyses in progress: {str(e)}",
+                            headers={"Retry-After": str(int(limiter.queue_timeout))})
+    except AnalysisQueueTimeoutError as e:
+        raise HTTPException(status_code=503,
+                            detail=f"Analysis capacity exhausted: {str(e)}",
+                            headers={"Retry-After": str(int(limiter.queue_timeout))})
     except Exception as e:
         raise HTTPException(status_code=500, 
                            detail=f"Error during CrewAI analysis: {str(e)}")
     
+    # Only cache complete results, a timed out evaluator may succeed next time
+    if is_complete(issues_data):
+        result_cache.set(cache_key, {"issues": [issue.model_dump() for issue in issues],
+                                     "evaluators": reported.counts(selection)})
+    
     # Calculate analysis time
     analysis_time = time.time() - start_time
     
     # Return response
-    return AnalyzeResponse(
-        url=request.url,
-        issues=issues,
-        analysis_time=analysis_time
+    result = AnalyzeResponse(
+        url=url,
+        issues=rule_issues + issues,
+        analysis_time=analysis_time,
+        evaluators=evaluators,
+        partial=deadline.cancelled and not is_complete(issues_data)
     )
+    await record_history(result, content_hash(page))
+    return result
+
+
+@router.post("/analyze", response_model=AnalyzeResponse)
+async def analyze_webpage(request: AnalyzeRequest, http_request: Request):
+    start_time = time.time()
+    url = str(request.url)
+    timings = collect_timings() if request.timings else None
+    deadline = request_deadline(request.timeout)
+    watcher = asyncio.ensure_future(watch_disconnect(http_request, deadline))
+    try:
+        return await analyze_url(request, url, start_time, timings)
+    finally:
+        watcher.cancel()
+
+
+async def analyze_url(request: AnalyzeRequest, url: str, start_time: float,
+                      timings: Optional[StageTimings]) -> AnalyzeResponse:
+    """
+    Fetches, prepares and analyzes the page of a request, see analyze_webpage.
+    """
+    # Results of hand-picked evaluators are neither reused nor stored for revalidation
+    default_selection = request.evaluators is None
+    
+    # Fetch HTML content
+    try:
+        fetched, unchanged = await fetch_page(url, start_time, revalidate=default_selection)
+    except (httpx.HTTPError, PageTooLargeError) as e:
+        raise fetch_error(e)
+    
+    # The page has not changed since it was last analyzed
+    if unchanged is not None:
+        return with_timings(unchanged, timings)
+    
+    # Check if content was retrieved
+    page = await prepare(fetched.text)
+    if not page.chunks:
+        raise HTTPException(status_code=422, detail="Retrieved empty content from URL")
+    
+    result = await analyze_page(url, page, start_time, selection=select(page, request.evaluators))
+    if default_selection:
+        remember_page(fetched, result)
+    return with_timings(result, timings)
+
+def llm_cache_stats() -> Optional[Dict[str, Any]]:
+    """
+    Returns the stats of the LLM response cache, None until the LLM is loaded.
+    """
+    if not analysis_loaded():
+        return None
+    from core.llm import CachingLLM, llm_gpt
+    return llm_gpt.stats() if isinstance(llm_gpt, CachingLLM) else None
+
 
 @router.get("/health")
 async def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy", "analysis_loaded": analysis_loaded(),
+            "cache": result_cache.stats(), "section_cache": section_cache.stats(),
+            "page_store": page_store.stats(), "llm_cache": llm_cache_stats()}
\ No newline at end of file
@@ -0,0 +1,158 @@
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
+import datetime
+import time
+
+from api.endpoints import AnalyzeResponse, QualityIssue
+from core.history import DAY, HistoryStore, history_store, site_of
+
+
+class HistoryRun(BaseModel):
+    id: int
+    url: str
+    content_hash: Optional[str] = Field(None, description="Hash of the page content the run analyzed")
+    created_at: float
+    partial: bool = Field(..., description="Whether the deadline stopped evaluators before they finished")
+    cached: bool
+    issues: Dict[str, int] = Field(..., description="Number of issues of each severity")
+
+class LatestResponse(BaseModel):
+    run: HistoryRun
+    result: AnalyzeResponse
+
+class HistoryIssue(QualityIssue):
+    fingerprint: str = Field(..., description="Identifies the issue across runs")
+
+class DiffResponse(BaseModel):
+    url: str
+    before: HistoryRun
+    after: HistoryRun
+    content_changed: bool = Field(..., description="Whether the page content differs between the runs")
+    new: List[HistoryIssue] = Field(..., description="Issues of the later run missing from the earlier one")
+    resolved: List[HistoryIssue] = Field(..., description="Issues of the earlier run missing from the later one")
+    unchanged: int = Field(..., description="Number of issues found by both runs")
+    not_compared: List[str] = Field(default_factory=list,
+                                    description="Evaluators that ran in only one of the runs, whose issues are "
+                                                "left out of the diff")
+
+class TrendPoint(BaseModel):
+    day: str = Field(..., description="Day, UTC")
+    urls: int = Field(..., description="Pages of the site analyzed that day")
+    issues: Dict[str, int] = Field(..., description="Issues of each severity on those pages, as of their last run "
+                                                    "of the day")
+
+class TrendResponse(BaseModel):
+    site: str
+    evaluator: Optional[str] = None
+    points: List[TrendPoint]
+
+
+router = APIRouter(prefix="/api/history", tags=["history"])
+
+
+def store() -> HistoryStore:
+    if history_store is None:
+        raise HTTPException(status_code=404, detail="The analysis history is disabled")
+    return history_store
+
+
+def get_run(run_id: int, url: str) -> Dict[str, Any]:
+    run = store().run(run_id)
+    if run is None or run["url"] != url:
+        raise HTTPException(status_code=404, detail=f"Run {run_id} of {url} not found")
+    return run
+
+
+def ran_evaluators(run: Dict[str, Any]) -> Dict[str, bool]:
+    """
+    Returns whether each evaluator of a run analyzed the page.
+    """
+    return {evaluator["name"]: evaluator["ran"] for evaluator in run["result"].get("evaluators", [])}
+
+
+@router.get("/latest", response_model=LatestResponse)
+def latest_result(url: str = Query(..., description="URL of the page")):
+    """
+    Returns the last result of a page, without analyzing it.
+    """
+    run = store().latest(url)
+    if run is None:
+        raise HTTPException(status_code=404, detail=f"No analysis of {url} in the history")
+    return LatestResponse(run=HistoryRun(**run), result=AnalyzeResponse(**run["result"]))
+
+
+@router.get("/runs", response_model=List[HistoryRun])
+def list_runs(url: str = Query(..., description="URL of the page"),
+              limit: int = Query(20, ge=1, le=1000)):
+    """
+    Lists the runs of a page, the most recent first.
+    """
+    return [HistoryRun(**run) for run in store().runs(url, limit)]
+
+
+@router.get("/diff", response_model=DiffResponse)
+def diff_runs(url: str = Query(..., description="URL of the page"),
+              before: Optional[int] = Query(None, description="Id of the earlier run"),
+              after: Optional[int] = Query(None, description="Id of the later run, the last complete one "
+                                                             "by default"),
+              since: Optional[float] = Query(None, description="Without before, compare with the last complete "
+                                                               "run at or before this Unix time instead of "
+                                                               "the previous one")):
+    """
+    Returns the issues that appeared and disappeared on a page between two runs.
+
+    Issues are matched by fingerprint (see core.history.issue_fingerprint).
+    Runs the deadline cut short are only compared when asked for by id.
+    """
+    history = store()
+    if after is None:
+        runs = history.runs(url, limit=1, complete=True)
+        if not runs:
+            raise HTTPException(status_code=404, detail=f"No complete analysis of {url} in the history")
+        after = runs[0]["id"]
+    after_run = get_run(after, url)
+    if before is None:
+        cutoff = min(since, after_run["created_at"]) if since is not None else after_run["created_at"]
+        earlier = [run for run in history.runs(url, limit=2, before=cutoff, complete=True) if run["id"] != after]
+        if not earlier:
+            raise HTTPException(status_code=404, detail=f"No earlier complete analysis of {url} to compare with")
+        before = earlier[0]["id"]
+    before_run = get_run(before, url)
+
+    before_ran, after_ran = ran_evaluators(before_run), ran_evaluators(after_run)
+    not_compared = sorted(name for name in set(before_ran) | set(after_ran)
+                          if not (before_ran.get(name) and after_ran.get(name)))
+    before_issues = {fingerprint: issue for fingerprint, issue in history.issues(before).items()
+                     if issue["type"] not in not_compared}
+    after_issues = {fingerprint: issue for fingerprint, issue in history.issues(after).items()
+                    if issue["type"] not in not_compared}
+    return DiffResponse(
+        url=url,
+        before=HistoryRun(**before_run),
+        after=HistoryRun(**after_run),
+        content_changed=before_run["content_hash"] != after_run["content_hash"],
+        new=[HistoryIssue(**issue, fingerprint=fingerprint) for fingerprint, issue in after_issues.items()
+             if fingerprint not in before_issues],
+        resolved=[HistoryIssue(**issue, fingerprint=fingerprint) for fingerprint, issue in before_issues.items()
+                  if fingerprint not in after_issues],
+        unchanged=len(before_issues.keys() & after_issues.keys()),
+        not_compared=not_compared
+    )
+
+
+@router.get("/trend", response_model=TrendResponse)
+def severity_trend(site: str = Query(..., description="Host name of the site, or any URL of it"),
+                   days: int = Query(30, ge=1, le=3650),
+                   evaluator: Optional[str] = Query(None, description="Only the issues of this evaluator")):
+    """
+    Returns the issues of a site by day and severity, see HistoryStore.trend.
+    """
+    site = site_of(site) if "://" in site else site.lower()
+    today = int(time.time() // DAY)
+    points = store().trend(site, (today - days + 1) * DAY, evaluator)
+    return TrendResponse(site=site, evaluator=evaluator, points=[
+        TrendPoint(day=datetime.datetime.fromtimestamp(point["day"] * DAY, datetime.timezone.utc).date().isoformat(),
+                   urls=point["urls"], issues=point["issues"])
+        for point in points
+    ])
@@ -0,0 +1,196 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, HttpUrl, Field
+from typing import Any, Dict, List, Optional
+import asyncio
+import httpx
+import logging
+import time
+
+from api.endpoints import (
+    AnalyzeResponse, QualityIssue, prepare, analyze_page, to_quality_issues, fetch_page, remember_page,
+    fetch_error, request_deadline
+)
+from core.config import JOB_WORKERS, JOB_POLL_INTERVAL, JOB_WEBHOOK_ATTEMPTS
+from core.jobs import JobStore, job_store
+from utils.fetcher import PageTooLargeError, create_client
+
+logger = logging.getLogger(__name__)
+
+
+class JobRequest(BaseModel):
+    url: HttpUrl = Field(..., description="URL of the web page to analyze")
+    webhook: Optional[HttpUrl] = Field(None, description="URL that receives the job as JSON when it finishes")
+
+class JobResponse(BaseModel):
+    id: str
+    url: str
+    status: str = Field(..., description="queued, running, done or failed")
+    issues: List[QualityIssue] = Field(default_factory=list, description="Issues found so far")
+    result: Optional[AnalyzeResponse] = None
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+
+
+router = APIRouter(prefix="/api", tags=["jobs"])
+
+
+class JobWorkerPool:
+    """
+    Workers that run queued analysis jobs inside the application's event loop.
+
+    Each worker claims a job from the store, fetches and analyzes the page, records
+    partial issues as evaluators finish and notifies the job's webhooks at the end.
+    The store is only used from worker threads, never on the event loop.
+    """
+
+    def __init__(self, store: JobStore, workers: int, poll_interval: float):
+        """
+        Initialize the pool.
+
+        Args:
+            store: Store the jobs are claimed from
+            workers: Number of jobs run at the same time by this process
+            poll_interval: Seconds between polls of an empty queue
+        """
+        self.store = store
+        self.workers = max(0, workers)
+        self.poll_interval = poll_interval
+        self._tasks: List[asyncio.Task] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def start(self) -> None:
+        """
+        Starts the workers. Must be called from the running event loop.
+        """
+        self._wake = asyncio.Event()
+        self._client = create_client()
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """
+        Stops the workers. Jobs they were running are picked up again once their lease expires.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._client is not None:
+            await self._client.aclose()
+
+    def wake(self) -> None:
+        """
+        Tells idle workers that a job was queued.
+        """
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _run(self) -> None:
+        while True:
+            job = await asyncio.to_thread(self.store.claim)
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                continue
+            try:
+                await self._process(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await asyncio.to_thread(self.store.fail, job["id"], f"Unexpected error: {str(e)}")
+                await self._notify(job["id"])
+
+    async def _heartbeat(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.store.lease / 3)
+            await asyncio.to_thread(self.store.heartbeat, job_id)
+
+    async def _process(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+
+        def on_issues(evaluator: str, issues: List[Dict]) -> None:
+            # Runs on the analysis thread, the store is thread-safe
+            try:
+                partial = to_quality_issues([dict(issue) for issue in issues])
+            except Exception:
+                return
+            self.store.add_issues(job_id, [issue.model_dump() for issue in partial])
+
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        start_time = time.time()
+        # Jobs have no client waiting, only the server's time budget applies
+        request_deadline()
+        try:
+            fetched, unchanged = await fetch_page(job["url"], start_time)
+            if unchanged is not None:
+                # The page has not changed since it was last analyzed
+                await asyncio.to_thread(self.store.complete, job_id, unchanged.model_dump(mode="json"))
+            else:
+                page = await prepare(fetched.text)
+                if not page.chunks:
+                    await asyncio.to_thread(self.store.fail, job_id, "Retrieved empty content from URL")
+                else:
+                    await asyncio.to_thread(on_issues, "rules", page.rule_issues)
+                    result = await analyze_page(job["url"], page, start_time, on_issues)
+                    remember_page(fetched, result)
+                    await asyncio.to_thread(self.store.complete, job_id, result.model_dump(mode="json"))
+        except HTTPException as e:
+            if e.status_code in (429, 503):
+                # No analysis capacity right now: give the job back and back off
+                await asyncio.to_thread(self.store.requeue, job_id)
+                await asyncio.sleep(self.poll_interval)
+                return
+            await asyncio.to_thread(self.store.fail, job_id, str(e.detail))
+        except (httpx.HTTPError, PageTooLargeError) as e:
+            await asyncio.to_thread(self.store.fail, job_id, fetch_error(e).detail)
+        finally:
+            heartbeat.cancel()
+        await self._notify(job_id)
+
+    async def _notify(self, job_id: str) -> None:
+        """
+        Posts the finished job to each of its webhooks, retrying with backoff.
+        """
+        webhooks = await asyncio.to_thread(self.store.webhooks, job_id)
+        if not webhooks:
+            return
+        payload = JobResponse(**await asyncio.to_thread(self.store.get, job_id)).model_dump(mode="json")
+        for webhook in webhooks:
+            for attempt in range(JOB_WEBHOOK_ATTEMPTS):
+                try:
+                    response = await self._client.post(webhook, json=payload)
+                    response.raise_for_status()
+                    break
+                except httpx.HTTPError as e:
+                    if attempt == JOB_WEBHOOK_ATTEMPTS - 1:
+                        logger.warning("Webhook %s for job %s failed: %s", webhook, job_id, e)
+                    else:
+                        await asyncio.sleep(2 ** attempt)
+
+
+job_workers = JobWorkerPool(job_store, JOB_WORKERS, JOB_POLL_INTERVAL)
+
+
+@router.post("/jobs", response_model=JobResponse, status_code=202)
+async def submit_job(request: JobRequest):
+    """
+    Queues an analysis and returns its job right away.
+
+    Submitting a URL that already has a queued or running job returns that job.
+    """
+    job, _ = await asyncio.to_thread(job_store.submit, str(request.url),
+                                     str(request.webhook) if request.webhook else None)
+    job_workers.wake()
+    return JobResponse(**job)
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return JobResponse(**job)
@@ -0,0 +1,64 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from typing import Iterable, Tuple
+import asyncio
+
+from core.cache import result_cache, section_cache, page_store
+from api.endpoints import llm_cache_stats
+from core.concurrency import analysis_limiter
+from core.metrics import metrics, shared_metrics
+from core.preprocess import preprocess_pool
+
+router = APIRouter(tags=["monitoring"])
+
+# Caches reported by qa_cache_requests_total, by name
+CACHES = {"result": result_cache, "section": section_cache, "page": page_store}
+
+
+def cache_requests() -> Iterable[Tuple[Tuple[str, str], float]]:
+    """
+    Returns the hits and misses of every cache, the LLM response cache included.
+    """
+    for name, cache in CACHES.items():
+        stats = cache.stats()
+        yield (name, "hit"), stats["hits"]
+        yield (name, "miss"), stats["misses"]
+    stats = llm_cache_stats()
+    if stats is not None:
+        yield ("llm", "hit"), stats["hits"]
+        yield ("llm", "coalesced"), stats["coalesced"]
+        yield ("llm", "miss"), stats["calls"] - stats["hits"] - stats["coalesced"]
+
+
+def llm_tokens_saved() -> Iterable[Tuple[Tuple[()], float]]:
+    """
+    Returns the tokens the LLM response cache kept from reaching the provider.
+    """
+    stats = llm_cache_stats()
+    if stats is not None:
+        yield (), stats["tokens_saved"]
+
+
+metrics.callback("qa_cache_requests_total", "Cache lookups by cache and outcome",
+                 ["cache", "outcome"], cache_requests, kind="counter")
+metrics.callback("qa_llm_tokens_saved_total", "Estimated tokens answered by the LLM response cache",
+                 [], llm_tokens_saved, kind="counter")
+metrics.callback("qa_analyses_running", "Analyses running on the analysis thread pool",
+                 [], lambda: [((), analysis_limiter.running)])
+metrics.callback("qa_analyses_queued", "Analyses waiting for a free analysis slot",
+                 [], lambda: [((), analysis_limiter.queued)])
+metrics.callback("qa_preprocess_running", "Pages being prepared by a preprocessing process",
+                 [], lambda: [((), preprocess_pool.running)])
+metrics.callback("qa_preprocess_queued", "Pages waiting for a free preprocessing process",
+                 [], lambda: [((), preprocess_pool.queued)])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Returns the metrics in the Prometheus text format: those of every worker
+    process when they share them (see core.metrics.SharedMetrics), else those
+    of the process answering.
+    """
+    text = await asyncio.to_thread(shared_metrics.render) if shared_metrics is not None else metrics.render()
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4; charset=utf-8")
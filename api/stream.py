@@ -0,0 +1,168 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from typing import Any, AsyncIterator, Dict, List
+import asyncio
+import httpx
+import json
+import time
+
+from api.endpoints import (
+    AnalyzeRequest, QualityIssue, prepare, analyze_page, fetch_page, remember_page, fetch_error, request_deadline,
+    select
+)
+from core.config import CHUNK_MAX_CHUNKS
+from crew.pipeline import EVALUATORS
+from utils.fetcher import PageTooLargeError
+
+router = APIRouter(prefix="/api", tags=["analysis"])
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """
+    Formats one Server-Sent Event.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def validated_issues(issues: List[Dict]) -> List[Dict]:
+    """
+    Returns the issues that are valid QualityIssues, as plain dicts.
+    """
+    valid = []
+    for issue in issues:
+        try:
+            valid.append(QualityIssue(**issue).model_dump())
+        except Exception:
+            continue
+    return valid
+
+
+@router.post("/analyze/stream")
+async def analyze_webpage_stream(request: AnalyzeRequest):
+    """
+    Analyzes a web page and streams its progress as Server-Sent Events.
+
+    Events, in order: fetched, cleaned (with the evaluators that run and why),
+    issues of the rule engine (evaluator "rules"), then evaluator_started,
+    issues and evaluator_done for each evaluator as it works through the page
+    (all of its issues in one event when the result comes from the cache),
+    and finally
+    summary with the complete AnalyzeResponse and stage timings. Any failure
+    ends the stream with an error event instead. When the page has not changed
+    since it was last analyzed, fetched (status_code 304) is followed directly
+    by the summary of that analysis.
+    """
+    url = str(request.url)
+
+    async def stream() -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+        start_time = time.time()
+        timings: Dict[str, float] = {}
+        request_deadline(request.timeout)
+
+        # Fetch HTML content
+        try:
+            fetched, unchanged = await fetch_page(url, start_time, revalidate=request.evaluators is None)
+        except (httpx.HTTPError, PageTooLargeError) as e:
+            error = fetch_error(e)
+            yield sse_event("error", {"status_code": error.status_code, "detail": error.detail})
+            return
+        timings["fetch"] = time.time() - start_time
+        yield sse_event("fetched", {"url": url, "status_code": fetched.status_code,
+                                    "bytes": fetched.size, "elapsed": timings["fetch"]})
+        if unchanged is not None:
+            yield sse_event("summary", {"result": unchanged.model_dump(mode="json"),
+                                        "issue_count": len(unchanged.issues),
+                                        "timings": timings})
+            return
+
+        try:
+            page = await prepare(fetched.text)
+        except HTTPException as e:
+            yield sse_event("error", {"status_code": e.status_code, "detail": e.detail})
+            return
+        chunks = page.chunks
+        timings["clean"] = time.time() - start_time - timings["fetch"]
+        if not chunks:
+            yield sse_event("error", {"status_code": 422, "detail": "Retrieved empty content from URL"})
+            return
+        try:
+            selection = select(page, request.evaluators)
+        except HTTPException as e:
+            yield sse_event("error", {"status_code": e.status_code, "detail": e.detail})
+            return
+        yield sse_event("cleaned", {"chunks": len(chunks), "elapsed": timings["clean"],
+                                    "evaluators": [{"name": choice.name, "ran": choice.run,
+                                                    "reason": choice.reason} for choice in selection]})
+        skipped = {choice.name for choice in selection if not choice.run}
+        yield sse_event("issues", {"evaluator": "rules", "issues": validated_issues(
+            [issue for issue in page.rule_issues if issue["type"] not in skipped])})
+
+        # Callbacks run on the analysis thread: hand their events to the loop
+        choices = {choice.name: choice for choice in selection}
+        remaining = {name: min(len(page.view(view)), choices[name].max_chunks, CHUNK_MAX_CHUNKS)
+                     for name, view, _, _ in EVALUATORS if choices[name].run}
+        started = set()
+        done = set()
+        # An evaluator with no chunk to read sends nothing: it is done already
+        for evaluator in [name for name, count in remaining.items() if count == 0]:
+            started.add(evaluator)
+            done.add(evaluator)
+            yield sse_event("evaluator_started", {"evaluator": evaluator})
+            yield sse_event("evaluator_done", {"evaluator": evaluator, "elapsed": 0.0})
+
+        def on_start(evaluator: str) -> None:
+            loop.call_soon_threadsafe(events.put_nowait, ("start", evaluator, None))
+
+        def on_issues(evaluator: str, issues: List[Dict]) -> None:
+            loop.call_soon_threadsafe(events.put_nowait, ("issues", evaluator, issues))
+
+        def on_done(evaluator: str) -> None:
+            loop.call_soon_threadsafe(events.put_nowait, ("done", evaluator, None))
+
+        analysis_start = time.time()
+        analysis = asyncio.ensure_future(
+            analyze_page(url, page, start_time, on_issues=on_issues, on_start=on_start,
+                         selection=selection, on_done=on_done))
+        analysis.add_done_callback(lambda _: events.put_nowait(("finished", None, None)))
+
+        try:
+            while True:
+                kind, evaluator, issues = await events.get()
+                if kind == "finished":
+                    break
+                if kind == "start" and evaluator not in started:
+                    started.add(evaluator)
+                    yield sse_event("evaluator_started", {"evaluator": evaluator})
+                elif kind == "issues" and evaluator not in done:
+                    if evaluator not in started:
+                        # Chunks served from the section cache never start
+                        started.add(evaluator)
+                        yield sse_event("evaluator_started", {"evaluator": evaluator})
+                    yield sse_event("issues", {"evaluator": evaluator, "issues": validated_issues(issues)})
+                    remaining[evaluator] -= 1
+                # Results served from the cache report all the issues of an
+                # evaluator at once, then say it is done
+                if evaluator not in done and (kind == "done" or remaining[evaluator] == 0):
+                    done.add(evaluator)
+                    yield sse_event("evaluator_done", {"evaluator": evaluator,
+                                                       "elapsed": time.time() - analysis_start})
+
+            try:
+                result = analysis.result()
+            except HTTPException as e:
+                yield sse_event("error", {"status_code": e.status_code, "detail": e.detail})
+                return
+            timings["analysis"] = time.time() - analysis_start
+            if request.evaluators is None:
+                remember_page(fetched, result)
+            yield sse_event("summary", {"result": result.model_dump(mode="json"),
+                                        "issue_count": len(result.issues),
+                                        "timings": timings})
+        finally:
+            # The client went away before the end: stop the analysis
+            analysis.cancel()
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
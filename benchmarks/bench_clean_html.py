@@ -0,0 +1,91 @@
+"""
+Compares the single-pass clean_html against the previous multi-pass version.
+
+Run with: python -m benchmarks.bench_clean_html [--repeat N] [--parser NAME ...]
+"""
+from bs4 import BeautifulSoup, Comment
+from typing import Callable, Dict, List
+import argparse
+import gc
+import time
+import tracemalloc
+
+from benchmarks.fixtures import load_fixtures
+from utils.clean_html import clean_html, resolve_parser
+
+
+def legacy_clean_html(html_content: str, parser: str = "html.parser") -> str:
+    """
+    The previous clean_html, kept as the benchmark baseline.
+
+    Its comment filter tested text.startswith("<!--"), which never matches a
+    Comment node, so comments were never removed. The filter below removes them
+    as documented so that outputs can be compared.
+    """
+    soup = BeautifulSoup(html_content, parser)
+
+    for tag in soup(["iframe", "script", "noscript", "style", "meta", "link"]):
+        tag.decompose()
+
+    for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
+        comment.extract()
+
+    for tag in soup.find_all(["div", "span"]):
+        if not tag.text.strip():
+            tag.decompose()
+
+    for tag in soup.find_all(style=True):
+        if "display: none" in tag["style"] or "visibility: hidden" in tag["style"]:
+            tag.decompose()
+
+    return str(soup.prettify())
+
+
+def measure(func: Callable[[], str], repeat: int) -> Dict[str, float]:
+    """
+    Returns the best wall time and the peak traced memory of func.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": best, "peak_mb": peak / 1_000_000}
+
+
+def main(argv: List[str] = None) -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--parser", action="append",
+                            help="Parser backends to compare (default: html.parser, lxml, html5lib)")
+    args = arg_parser.parse_args(argv)
+
+    parsers = []
+    for name in args.parser or ["html.parser", "lxml", "html5lib"]:
+        if resolve_parser(name) == name:
+            parsers.append(name)
+        else:
+            print(f"skipping {name}: not installed")
+
+    fixtures = load_fixtures()
+    print(f"{'fixture':<8} {'size':>9} {'parser':<12} {'legacy s':>9} {'new s':>8} {'speedup':>8} "
+          f"{'legacy MB':>10} {'new MB':>8} {'same':>5}")
+    for name, page in fixtures.items():
+        for parser in parsers:
+            same = clean_html(page, parser) == legacy_clean_html(page, parser)
+            legacy = measure(lambda: legacy_clean_html(page, parser), args.repeat)
+            new = measure(lambda: clean_html(page, parser), args.repeat)
+            print(f"{name:<8} {len(page):>9} {parser:<12} {legacy['seconds']:>9.3f} {new['seconds']:>8.3f} "
+                  f"{legacy['seconds'] / new['seconds']:>7.1f}x {legacy['peak_mb']:>10.1f} "
+                  f"{new['peak_mb']:>8.1f} {str(same):>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Measures the analysis history store (core.history) once it holds a lot of runs.
+
+Fills a store in a temporary directory with --urls pages spread over --sites
+sites, each analyzed --runs times over the last --days days, with --issues
+issues per run that change a little from one run to the next. Then reports
+the time of the queries behind the history endpoints, of recording one more
+run, and of a compaction, and the size of the database before and after it.
+
+Run with: python -m benchmarks.bench_history [--urls N] [--runs N] [--issues N] [--output FILE]
+"""
+from typing import Any, Callable, Dict, List
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.results import save_results
+from core.history import DAY, HistoryStore
+
+SEVERITIES = ["info", "warning", "critical"]
+EVALUATORS = ["ux", "accessibility", "html", "performance"]
+
+
+def make_result(url: str, issues: int, rng: random.Random) -> Dict[str, Any]:
+    """
+    Returns an AnalyzeResponse as JSON whose issues mostly repeat from run to run.
+    """
+    return {
+        "url": url,
+        "issues": [{"id": f"issue-{index}", "type": EVALUATORS[index % len(EVALUATORS)],
+                    "severity": SEVERITIES[index % len(SEVERITIES)],
+                    # One issue in ten differs from the previous run
+                    "message": f"Issue {index} variant {rng.randrange(3) if index % 10 == 0 else 0}",
+                    "element": f"<div id='e{index}'>", "line": index}
+                   for index in range(issues)],
+        "analysis_time": 1.0,
+        "evaluators": [{"name": name, "ran": True, "reason": "default"} for name in EVALUATORS],
+    }
+
+
+def database_mb(path: str) -> float:
+    """
+    Returns the size of a SQLite database with its write-ahead log, in MB.
+    """
+    return sum(os.path.getsize(file) for file in (path, path + "-wal") if os.path.exists(file)) / 1_000_000
+
+
+def measure(func: Callable[[], Any], repeat: int) -> float:
+    """
+    Returns the median wall time of func, in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2]
+
+
+def main(argv: List[str] = None) -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--urls", type=int, default=500)
+    arg_parser.add_argument("--sites", type=int, default=10)
+    arg_parser.add_argument("--runs", type=int, default=80, help="Runs per URL")
+    arg_parser.add_argument("--days", type=int, default=40, help="Days the runs are spread over")
+    arg_parser.add_argument("--retention", type=int, default=30, help="Days a run is kept")
+    arg_parser.add_argument("--issues", type=int, default=20, help="Issues per run")
+    arg_parser.add_argument("--repeat", type=int, default=50)
+    arg_parser.add_argument("--output", help="Write the results to this JSON file")
+    args = arg_parser.parse_args(argv)
+
+    rng = random.Random(0)
+    now = time.time()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "history.sqlite3")
+        # Recording never compacts, compaction is measured on its own
+        store = HistoryStore(path, retention=args.retention * DAY, max_runs_per_url=200, compact_after=7 * DAY,
+                             compact_interval=DAY)
+        urls = [f"https://site{index % args.sites}.example/page{index}" for index in range(args.urls)]
+        start = time.perf_counter()
+        for run in range(args.runs):
+            created_at = now - args.days * DAY * (1 - run / args.runs)
+            for url in urls:
+                store.record(make_result(url, args.issues, rng), content_hash=f"{url}:{run // 5}", now=created_at)
+        fill = time.perf_counter() - start
+        total = args.urls * args.runs
+        size_mb = database_mb(path)
+        print(f"{total} runs of {args.issues} issues recorded in {fill:.1f}s, {size_mb:.1f} MB")
+
+        url = urls[len(urls) // 2]
+
+        def diff() -> None:
+            after, before = store.runs(url, limit=2, complete=True)
+            store.run(after["id"]), store.run(before["id"])
+            store.issues(after["id"]).keys() - store.issues(before["id"]).keys()
+
+        queries = {
+            "latest": lambda: store.latest(url),
+            "runs": lambda: store.runs(url, limit=20),
+            "diff": diff,
+            "trend-30d": lambda: store.trend("site0.example", now - 30 * DAY),
+            "trend-30d-evaluator": lambda: store.trend("site0.example", now - 30 * DAY, "accessibility"),
+            "record": lambda: store.record(make_result(url, args.issues, rng)),
+        }
+        results: Dict[str, Dict[str, float]] = {}
+        print(f"{'query':<20} {'ms':>8}")
+        for name, query in queries.items():
+            seconds = measure(query, args.repeat)
+            results[name] = {"wall_s": seconds}
+            print(f"{name:<20} {seconds * 1000:>8.2f}")
+
+        start = time.perf_counter()
+        deleted = store.compact(now)
+        compact = time.perf_counter() - start
+        compacted_mb = database_mb(path)
+        results["compact"] = {"wall_s": compact, "deleted": deleted, "size_before_mb": size_mb,
+                              "size_after_mb": compacted_mb}
+        print(f"compaction: {deleted} runs deleted in {compact:.2f}s, {size_mb:.1f} MB -> {compacted_mb:.1f} MB")
+
+    if args.output:
+        save_results(args.output, "bench_history", args, results)
+        print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Microbenchmarks of the preprocessing stages, on every page of the fixture corpus.
+
+Stages: parse (parse_html), rules (rule engine), clean (clean_soup), one chunk
+stage per view (chunk_html), prepare (prepare_page plus every view, all a
+request does before the agents) and cache_key (analysis_cache_key). No LLM is
+involved.
+
+Run with: python -m benchmarks.bench_pipeline [--repeat N] [--sizes small,medium]
+    [--parser NAME] [--output FILE]
+"""
+from typing import Any, Callable, Dict, List
+import argparse
+import gc
+import statistics
+import time
+import tracemalloc
+
+from benchmarks.fixtures import FIXTURE_SIZES, load_corpus
+from benchmarks.results import save_results
+from crew.pipeline import EVALUATORS, analysis_cache_key
+from rules.engine import rule_engine
+from utils.chunk_html import chunk_html, token_budget_for
+from utils.clean_html import clean_soup, parse_html, resolve_parser
+from utils.prepare_page import prepare_page
+from utils.views import VIEWS
+
+MODEL = "gpt-3.5-turbo"
+
+
+def measure(func: Callable[[], Any], repeat: int, memory: bool = False) -> Dict[str, float]:
+    """
+    Returns the best and median wall time of func and, optionally, its peak traced memory.
+    """
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    result = {"best_s": min(times), "median_s": statistics.median(times)}
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["peak_mb"] = peak / 1_000_000
+    return result
+
+
+def bench_page(html: str, parser: str, repeat: int) -> Dict[str, Dict[str, float]]:
+    """
+    Returns the measurements of every stage on one page.
+    """
+    budget = token_budget_for(MODEL)
+    soup = parse_html(html, parser)
+    views = list(dict.fromkeys(view for _, view, _, _ in EVALUATORS))
+
+    def prepare() -> None:
+        page = prepare_page(html, budget, parser=parser)
+        for view in views:
+            page.view(view)
+
+    page = prepare_page(html, budget, parser=parser)
+    # The key is computed once every view is chunked, as in analyze_page
+    analysis_cache_key(page, MODEL)
+    stages = {
+        "parse": measure(lambda: parse_html(html, parser), repeat),
+        "rules": measure(lambda: rule_engine.run(soup), repeat),
+        "clean": measure(lambda: clean_soup(html, parser), repeat),
+    }
+    for view in views:
+        stages[f"chunk_{view}"] = measure(lambda: chunk_html(soup, budget, VIEWS[view]), repeat)
+    stages["prepare"] = measure(prepare, repeat, memory=True)
+    stages["cache_key"] = measure(lambda: analysis_cache_key(page, MODEL), repeat)
+    return stages
+
+
+def main(argv: List[str] = None) -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    arg_parser.add_argument("--sizes", default=",".join(FIXTURE_SIZES),
+                            help="Comma separated size names of the fixtures to run")
+    arg_parser.add_argument("--parser", default="html.parser")
+    arg_parser.add_argument("--output", help="Write the results to this JSON file")
+    args = arg_parser.parse_args(argv)
+
+    parser = resolve_parser(args.parser)
+    sizes = {name: FIXTURE_SIZES[name] for name in args.sizes.split(",")}
+    results: Dict[str, Dict[str, float]] = {}
+    print(f"{'page':<16} {'bytes':>9} {'stage':<18} {'best ms':>9} {'median ms':>10}")
+    for name, html in load_corpus(sizes).items():
+        for stage, result in bench_page(html, parser, args.repeat).items():
+            results[f"{name}/{stage}"] = result
+            print(f"{name:<16} {len(html):>9} {stage:<18} {result['best_s'] * 1000:>9.2f} "
+                  f"{result['median_s'] * 1000:>10.2f}")
+
+    if args.output:
+        save_results(args.output, "pipeline", args, results)
+        print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
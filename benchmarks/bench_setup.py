@@ -0,0 +1,114 @@
+"""
+Measures the per-request cost of setting up the evaluator crew for a page,
+building every agent from scratch versus copying it from the warm registry.
+
+No LLM is called. The "before" column builds every agent and every
+single-task crew up front, as the analysis used to; the "after" column copies
+the agents from the registry, leaving the crews to the workers that run them.
+
+Run with: python -m benchmarks.bench_setup [--chunks N] [--repeat N] [--threads N]
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List
+import argparse
+import time
+
+from core.llm import llm_gpt
+from crew.pipeline import EVALUATORS, evaluator_registry
+from crew.qa_analyzer import QAAnalyzerCrew
+
+CHUNK = "L1: <main>\nL2: <h1>Catalog</h1>\nL3: <p>Products of the week</p>"
+
+
+def build_crew(chunks: int, create_agent: Callable[[str, Any, Callable[[Any], Any]], Any],
+               eager: bool = False) -> QAAnalyzerCrew:
+    """
+    Builds the crew of a page with the given number of chunks, as run_analysis does.
+
+    With eager set, the single-task crews are built up front as well.
+    """
+    agents = []
+    tasks = []
+    for name, _, factory, create_task in EVALUATORS:
+        for index in range(chunks):
+            agent = create_agent(name, llm_gpt, factory)
+            agents.append(agent)
+            tasks.append(create_task(agent, CHUNK, "https://example.com", f"part {index + 1} of {chunks}"))
+    crew = QAAnalyzerCrew(agents=agents, tasks=tasks, process="parallel")
+    if eager:
+        for index in range(len(tasks)):
+            crew._task_crew(index)
+    return crew
+
+
+def from_factory(name: str, llm: Any, factory: Callable[[Any], Any]) -> Any:
+    return factory(llm)
+
+
+def from_registry(name: str, llm: Any, factory: Callable[[Any], Any]) -> Any:
+    return evaluator_registry.agent(name, llm)
+
+
+def measure(func: Callable[[], Any], repeat: int) -> float:
+    """
+    Returns the best wall time of func, in milliseconds.
+    """
+    func()
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+# State an agent accumulates while it runs, which no two agents may share
+AGENT_STATE = ["tools", "tools_handler", "tools_results", "callbacks", "_token_process", "_last_messages",
+               "_tool_failures"]
+
+
+def check_concurrent(chunks: int, threads: int) -> bool:
+    """
+    Builds crews from several threads at once and checks that no agent, nor
+    any of its run state (AGENT_STATE), is shared.
+    """
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        crews = list(executor.map(lambda _: build_crew(chunks, from_registry), range(threads * 4)))
+    agents: List[Any] = [agent for crew in crews for agent in crew.agents]
+    if not len({id(agent) for agent in agents}) == len(agents) == len({agent.id for agent in agents}):
+        return False
+    return all(len({id(getattr(agent, name)) for agent in agents}) == len(agents) for name in AGENT_STATE)
+
+
+def main(argv: List[str] = None) -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--chunks", type=int, default=12, help="Chunks per evaluator")
+    arg_parser.add_argument("--repeat", type=int, default=10)
+    arg_parser.add_argument("--threads", type=int, default=8)
+    args = arg_parser.parse_args(argv)
+
+    evaluator_registry.warm(llm_gpt)
+    tasks = args.chunks * len(EVALUATORS)
+    agent_only = {
+        "factory": measure(lambda: [from_factory(name, llm_gpt, factory)
+                                    for name, _, factory, _ in EVALUATORS * args.chunks], args.repeat),
+        "registry": measure(lambda: [from_registry(name, llm_gpt, factory)
+                                     for name, _, factory, _ in EVALUATORS * args.chunks], args.repeat),
+    }
+    full = {
+        "factory": measure(lambda: build_crew(args.chunks, from_factory, eager=True), args.repeat),
+        "registry": measure(lambda: build_crew(args.chunks, from_registry), args.repeat),
+    }
+    crews = measure(lambda: build_crew(args.chunks, from_registry, eager=True), args.repeat) - full["registry"]
+
+    print(f"{tasks} tasks per request")
+    print(f"{'stage':<24} {'before ms':>10} {'after ms':>9} {'speedup':>8}")
+    for label, result in (("agents", agent_only), ("setup before first call", full)):
+        print(f"{label:<24} {result['factory']:>10.2f} {result['registry']:>9.2f} "
+              f"{result['factory'] / result['registry']:>7.1f}x")
+    print(f"crews built by the workers: {crews:.2f} ms in total, {crews / tasks:.2f} ms each")
+    print(f"no agent shared across {args.threads} threads: {check_concurrent(args.chunks, args.threads)}")
+
+
+if __name__ == "__main__":
+    main()
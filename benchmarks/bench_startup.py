@@ -0,0 +1,234 @@
+"""
+Measures how fast the API starts and how much memory its workers take.
+
+First an import profile: the wall time of importing the app, and of loading
+the analysis (crewAI and the evaluator agents, see core.startup) on top of
+it, with the modules that cost the most according to python -X importtime.
+
+Then each way of serving the app is started in a subprocess, and measured
+are the time until /api/health first answers, the time until it reports the
+analysis loaded, and the resident (RSS) and proportional (PSS, which splits
+the pages shared with other processes) memory of every worker:
+
+    uvicorn-eager       uvicorn, loading the analysis before serving (as before)
+    uvicorn-background  uvicorn, serving at once and loading behind
+    gunicorn            gunicorn without preloading, every worker loading the
+                        analysis itself (the previous start command)
+    gunicorn-preload    gunicorn.conf.py: loaded once in the master, shared by
+                        the forked workers
+
+No LLM is called. The preprocessing processes are disabled so only the web
+workers are measured; the databases go to a temporary directory.
+
+Run with: python -m benchmarks.bench_startup [--workers N] [--modes uvicorn-eager,gunicorn-preload]
+    [--settle S] [--output FILE]
+"""
+from typing import Dict, List, Optional, Tuple
+import argparse
+import os
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.results import save_results
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LOAD_ANALYSIS = "import main; from core.startup import load_analysis; load_analysis()"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def app_environment(directory: str, **extra: str) -> Dict[str, str]:
+    """
+    Returns the environment the app runs in, offline and writing to directory.
+    """
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "benchmark")
+    env.update({
+        "PREPROCESS_WORKERS": "0",
+        "RESULT_CACHE_PATH": os.path.join(directory, "results.sqlite3"),
+        "JOBS_DB_PATH": os.path.join(directory, "jobs.sqlite3"),
+        "CREWAI_DISABLE_TELEMETRY": "true",
+        "OTEL_SDK_DISABLED": "true",
+        "PYTHONPATH": ROOT,
+    })
+    env.update(extra)
+    return env
+
+
+def time_python(code: str, env: Dict[str, str], repeat: int) -> float:
+    """
+    Returns the best wall time of running code in a fresh interpreter, in seconds.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def import_profile(code: str, env: Dict[str, str], top: int) -> List[Tuple[str, float]]:
+    """
+    Returns the packages that took the longest to import while running code.
+
+    Returns:
+        List[Tuple[str, float]]: Top-level package and seconds spent importing
+            its modules, those of its dependencies excluded, the slowest first
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, env=env,
+                             check=True, capture_output=True, text=True)
+    packages: Dict[str, float] = {}
+    for line in process.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+\d+ \| +(\S+)", line)
+        if match:
+            package = match.group(2).split(".")[0]
+            packages[package] = packages.get(package, 0.0) + int(match.group(1)) / 1_000_000
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def command(mode: str, port: int, workers: int) -> Tuple[List[str], Dict[str, str]]:
+    """
+    Returns the command line serving the app in mode, and its extra environment.
+
+    Every mode runs from a directory without gunicorn.conf.py, which gunicorn
+    would otherwise read, so the configuration is passed explicitly.
+    """
+    if mode.startswith("uvicorn"):
+        load = "eager" if mode == "uvicorn-eager" else "background"
+        return ([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+                {"STARTUP_LOAD": load})
+    if mode == "gunicorn":
+        return ([sys.executable, "-m", "gunicorn", "main:app", "--workers", str(workers),
+                 "--worker-class", "uvicorn.workers.UvicornWorker", "--bind", f"127.0.0.1:{port}",
+                 "--log-level", "warning"], {"STARTUP_LOAD": "eager"})
+    return ([sys.executable, "-m", "gunicorn", "main:app", "-c", os.path.join(ROOT, "gunicorn.conf.py"),
+             "--bind", f"127.0.0.1:{port}", "--log-level", "warning"], {"WEB_CONCURRENCY": str(workers)})
+
+
+def memory_kb(pid: int) -> Tuple[int, int]:
+    """
+    Returns the RSS and the PSS of a process, in kilobytes.
+    """
+    values = {}
+    for path, field in ((f"/proc/{pid}/status", "VmRSS"), (f"/proc/{pid}/smaps_rollup", "Pss")):
+        with open(path) as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    values[field] = int(line.split()[1])
+                    break
+    return values.get("VmRSS", 0), values.get("Pss", 0)
+
+
+def children(pid: int) -> List[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def wait_for(url: str, check, timeout: float) -> Optional[float]:
+    """
+    Polls url until check accepts its JSON, returning the monotonic time it did, None on timeout.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = httpx.get(url, timeout=1)
+            if response.status_code == 200 and check(response.json()):
+                return time.monotonic()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.02)
+    return None
+
+
+def measure_mode(mode: str, workers: int, settle: float, timeout: float, directory: str) -> Dict[str, float]:
+    """
+    Starts the app in mode, measures its startup and memory, and stops it.
+    """
+    port = free_port()
+    args, extra = command(mode, port, workers)
+    start = time.monotonic()
+    process = subprocess.Popen(args, cwd=directory, env=app_environment(directory, **extra))
+    try:
+        url = f"http://127.0.0.1:{port}/api/health"
+        healthy = wait_for(url, lambda body: True, timeout)
+        loaded = wait_for(url, lambda body: body.get("analysis_loaded"), timeout)
+        if healthy is None or loaded is None:
+            raise RuntimeError(f"{mode} did not start within {timeout:.0f}s")
+        # Let the other workers finish loading
+        time.sleep(settle)
+        pids = children(process.pid) if mode.startswith("gunicorn") else [process.pid]
+        usage = [memory_kb(pid) for pid in pids]
+        result = {
+            "healthy_s": healthy - start,
+            "analysis_loaded_s": loaded - start,
+            "workers": len(pids),
+            "worker_rss_mb": sum(rss for rss, _ in usage) / len(usage) / 1000,
+            "worker_pss_mb": sum(pss for _, pss in usage) / len(usage) / 1000,
+        }
+        if mode.startswith("gunicorn"):
+            result["master_pss_mb"] = memory_kb(process.pid)[1] / 1000
+        result["total_pss_mb"] = result["worker_pss_mb"] * len(pids) + result.get("master_pss_mb", 0)
+        return result
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main(argv: List[str] = None) -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--workers", type=int, default=2, help="Gunicorn workers")
+    arg_parser.add_argument("--modes", default="uvicorn-eager,uvicorn-background,gunicorn,gunicorn-preload",
+                            help="Comma separated ways of serving the app to measure")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="Runs of each import measurement")
+    arg_parser.add_argument("--top", type=int, default=8, help="Slowest packages shown in the import profile")
+    arg_parser.add_argument("--settle", type=float, default=5, help="Seconds waited before reading the memory")
+    arg_parser.add_argument("--timeout", type=float, default=120)
+    arg_parser.add_argument("--output", help="Write the results to this JSON file")
+    args = arg_parser.parse_args(argv)
+
+    results: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        env = app_environment(directory)
+        results["import/main"] = {"wall_s": time_python("import main", env, args.repeat)}
+        results["import/main+analysis"] = {"wall_s": time_python(LOAD_ANALYSIS, env, args.repeat)}
+        print(f"import main: {results['import/main']['wall_s']:.2f}s, "
+              f"with the analysis loaded: {results['import/main+analysis']['wall_s']:.2f}s")
+        for label, code in (("import main", "import main"), ("load_analysis", LOAD_ANALYSIS)):
+            print(f"slowest imports of {label}: " + ", ".join(
+                f"{package} {seconds:.2f}s" for package, seconds in import_profile(code, env, args.top)))
+
+        print(f"\n{'mode':<19} {'healthy s':>9} {'loaded s':>8} {'workers':>7} {'RSS MB':>7} "
+              f"{'PSS MB':>7} {'total PSS MB':>12}")
+        for mode in args.modes.split(","):
+            result = measure_mode(mode, args.workers, args.settle, args.timeout, directory)
+            results[f"serve/{mode}"] = result
+            print(f"{mode:<19} {result['healthy_s']:>9.2f} {result['analysis_loaded_s']:>8.2f} "
+                  f"{result['workers']:>7} {result['worker_rss_mb']:>7.0f} {result['worker_pss_mb']:>7.0f} "
+                  f"{result['total_pss_mb']:>12.0f}")
+
+    if args.output:
+        save_results(args.output, "bench_startup", args, results)
+        print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
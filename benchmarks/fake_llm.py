@@ -0,0 +1,121 @@
+"""
+A deterministic stand-in for the LLM, so the analysis can be benchmarked offline.
+
+The same prompt always gets the same answer after the same delay, which makes
+runs comparable: only the code around the LLM changes between them.
+"""
+from crewai import BaseLLM
+from typing import Any, Dict, List, Optional
+import hashlib
+import json
+import re
+import sys
+import time
+
+from core.cache import ResultCache, create_result_cache
+from core.llm import CachingLLM
+from core.router import LLMRouter
+
+# Line markers of the chunks sent to the agents, see utils.chunk_html
+LINE_MARKER = re.compile(r"\bL(\d+):")
+
+SEVERITIES = ["info", "warning", "critical"]
+
+# Modules holding a reference to core.llm.llm_gpt, replaced by use_llm
+LLM_USERS = ["core.llm", "api.endpoints", "api.metrics", "main", "benchmarks.bench_setup"]
+
+
+class FakeLLM(BaseLLM):
+    """
+    Answers every prompt with a report of made-up issues after a fixed delay.
+
+    The delay and the issues are derived from a hash of the prompt: latency
+    plus up to jitter seconds, and issues_per_call issues on lines that appear
+    in the prompt. A broken_rate fraction of the prompts gets a truncated
+    answer instead, to exercise output repair.
+    """
+
+    latency: float = 0.0
+    jitter: float = 0.0
+    issues_per_call: int = 2
+    broken_rate: float = 0.0
+
+    def call(self, messages: Any, tools: Optional[List[Dict]] = None, callbacks: Optional[List[Any]] = None,
+             available_functions: Optional[Dict[str, Any]] = None, from_task: Any = None,
+             from_agent: Any = None, response_model: Any = None) -> Any:
+        prompt = messages if isinstance(messages, str) else json.dumps(messages, default=str)
+        # Agents expect the ReAct format, direct calls (e.g. repairs) plain JSON
+        return self.answer(prompt, getattr(from_task, "name", None) or "html", react=from_agent is not None)
+
+    def answer(self, prompt: str, evaluator: str, react: bool = False) -> str:
+        """
+        Returns the answer to a prompt, after its delay.
+
+        Args:
+            prompt: The prompt, serialized
+            evaluator: Type of the issues reported
+            react: Whether to answer in the "Thought / Final Answer" format of agents
+        """
+        digest = hashlib.sha256(prompt.encode()).digest()
+        fraction = int.from_bytes(digest[:4], "big") / 2 ** 32
+        time.sleep(self.latency + self.jitter * fraction)
+
+        lines = [int(line) for line in LINE_MARKER.findall(prompt)] or [None]
+        issues = [{
+            "id": f"{evaluator}_{index + 1}",
+            "type": evaluator,
+            "severity": SEVERITIES[(digest[4] + index) % len(SEVERITIES)],
+            "message": f"Synthetic issue {digest[5 + index % 20]:02x}",
+            "element": None,
+            "line": lines[(digest[6] + index) % len(lines)],
+        } for index in range(self.issues_per_call)]
+        report = json.dumps({"issues": issues})
+        if fraction < self.broken_rate:
+            report = report[:len(report) // 2]
+        return f"Thought: I have the report\nFinal Answer: {report}" if react else report
+
+    def supports_function_calling(self) -> bool:
+        return False
+
+    def supports_stop_words(self) -> bool:
+        return False
+
+    def get_context_window_size(self) -> int:
+        return 128000
+
+
+def use_llm(llm: BaseLLM, cache: Optional[ResultCache] = None) -> CachingLLM:
+    """
+    Makes every user of core.llm.llm_gpt use another LLM instead.
+
+    The LLM is routed to by an LLMRouter, as in production, so its calls are
+    recorded in core.metrics.
+
+    Args:
+        llm: The LLM to use, typically a FakeLLM
+        cache: Response cache of the wrapping CachingLLM, none by default so
+            that every distinct prompt reaches llm
+
+    Returns:
+        CachingLLM: The LLM now in place of llm_gpt
+    """
+    wrapped = CachingLLM(LLMRouter({llm.model: llm}, llm.model), cache=cache)
+    for name in LLM_USERS:
+        module = sys.modules.get(name)
+        if module is not None and hasattr(module, "llm_gpt"):
+            module.llm_gpt = wrapped
+    return wrapped
+
+
+def disable_caches() -> None:
+    """
+    Replaces the result, section and page caches with caches that keep nothing,
+    so that repeated requests for the same page run the whole analysis.
+    """
+    import api.endpoints
+    import crew.pipeline
+
+    for module, names in ((api.endpoints, ["result_cache", "section_cache", "page_store"]),
+                          (crew.pipeline, ["section_cache"])):
+        for name in names:
+            setattr(module, name, create_result_cache(backend="none"))
@@ -0,0 +1,204 @@
+"""
+A local OpenAI-compatible endpoint standing in for the LLM provider.
+
+It answers POST /v1/chat/completions like FakeLLM, and can be told to fail a
+fraction of the calls of each model with 429 (with a Retry-After header) or
+500, to answer slowly, or to give broken reports. Point the app at it with
+LLM_BASE_URL to exercise the routing, retries, failover and escalation of
+core.router without touching the network.
+
+Run with: python -m benchmarks.fake_openai [--port N] [--model gpt-4o-mini:broken=0.5,rate_limited=0.1]
+"""
+from dataclasses import dataclass, fields
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+import argparse
+import json
+import random
+import threading
+import time
+
+from benchmarks.fake_llm import FakeLLM
+
+
+@dataclass
+class FakeModel:
+    """
+    How one model of the fake endpoint behaves.
+
+    Attributes:
+        latency: Seconds every answer takes
+        jitter: Extra seconds, up to, derived from the prompt
+        issues_per_call: Issues reported per answer
+        broken: Fraction of the prompts answered with a truncated report
+        rate_limited: Fraction of the calls answered with 429
+        errors: Fraction of the calls answered with 500
+        retry_after: Seconds sent in the Retry-After header of the 429s
+    """
+    latency: float = 0.0
+    jitter: float = 0.0
+    issues_per_call: int = 2
+    broken: float = 0.0
+    rate_limited: float = 0.0
+    errors: float = 0.0
+    retry_after: float = 0.0
+
+
+def parse_model(spec: str) -> Dict[str, FakeModel]:
+    """
+    Parses a "name:field=value,field=value" command line model, see FakeModel.
+    """
+    name, _, settings = spec.partition(":")
+    types = {field.name: field.type for field in fields(FakeModel)}
+    values = {}
+    for item in settings.split(","):
+        if "=" in item:
+            key, value = item.split("=", 1)
+            values[key] = int(value) if types[key] in (int, "int") else float(value)
+    return {name: FakeModel(**values)}
+
+
+class FakeOpenAIServer:
+    """
+    Serves the chat completions API on 127.0.0.1 from a background thread.
+
+    Models not configured behave like FakeModel(). Use as a context manager:
+
+        with FakeOpenAIServer({"gpt-4o-mini": FakeModel(broken=1.0)}) as server:
+            base_url = server.base_url
+    """
+
+    def __init__(self, models: Optional[Dict[str, FakeModel]] = None, port: int = 0, seed: int = 0):
+        """
+        Initialize the server.
+
+        Args:
+            models: Behaviour of each model
+            port: Port to listen on, a free one by default
+            seed: Seed of the draws deciding which calls fail
+        """
+        self.models = dict(models or {})
+        # Responses sent, by model and then by status
+        self.calls: Dict[str, Dict[int, int]] = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def count(self, model: str, status: Optional[int] = None) -> int:
+        """
+        Returns the calls of a model answered with status, or all of them.
+        """
+        with self._lock:
+            statuses = self.calls.get(model, {})
+            return sum(statuses.values()) if status is None else statuses.get(status, 0)
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _respond(self, body: Dict) -> Tuple[int, Dict[str, str], Dict]:
+        """
+        Returns the status, headers and body answering a chat completion request.
+        """
+        name = body.get("model", "")
+        model = self.models.get(name, FakeModel())
+        with self._lock:
+            draw = self._random.random()
+        if draw < model.rate_limited:
+            return 429, {"Retry-After": str(model.retry_after)}, _error("Rate limit reached", "rate_limit_exceeded")
+        if draw < model.rate_limited + model.errors:
+            return 500, {}, _error("The server had an error", "server_error")
+
+        llm = FakeLLM(model=name, latency=model.latency, jitter=model.jitter,
+                      issues_per_call=model.issues_per_call, broken_rate=model.broken)
+        prompt = json.dumps(body.get("messages", []))
+        # Structured output calls want the bare report, agents the ReAct format,
+        # which direct calls (e.g. repairs) understand too
+        content = llm.answer(prompt, "html", react="response_format" not in body)
+        prompt_tokens, completion_tokens = len(prompt) // 4, len(content) // 4
+        return 200, {}, {
+            "id": f"chatcmpl-{abs(hash(prompt)):x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": name,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    def _handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    self.send_error(400)
+                    return
+                status, headers, payload = server._respond(body)
+                with server._lock:
+                    statuses = server.calls.setdefault(body.get("model", ""), {})
+                    statuses[status] = statuses.get(status, 0) + 1
+
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        return Handler
+
+
+def _error(message: str, code: str) -> Dict:
+    return {"error": {"message": message, "type": code, "param": None, "code": code}}
+
+
+def main(argv=None) -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--port", type=int, default=8766)
+    arg_parser.add_argument("--model", action="append", default=[],
+                            help="Behaviour of a model, e.g. gpt-4o-mini:broken=0.5,latency=0.2")
+    args = arg_parser.parse_args(argv)
+
+    models: Dict[str, FakeModel] = {}
+    for spec in args.model:
+        models.update(parse_model(spec))
+    server = FakeOpenAIServer(models, port=args.port)
+    print(f"LLM_BASE_URL={server.base_url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
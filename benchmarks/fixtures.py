@@ -0,0 +1,234 @@
+from typing import Callable, Dict
+import os
+import random
+
+# Approximate page sizes used by the benchmarks, in bytes
+FIXTURE_SIZES = {
+    "small": 20_000,
+    "medium": 250_000,
+    "large": 2_000_000,
+    "xlarge": 5_000_000,
+}
+
+
+def _product_card(rng: random.Random, index: int) -> str:
+    price = rng.randint(5, 500)
+    hidden = ' style="display: none"' if index % 7 == 0 else ""
+    return f"""
+    <div class="product-card" data-sku="sku-{index}">
+      <!-- product {index} -->
+      <div class="product-card__media"><div><span></span></div>
+        <img src="/img/p{index}.jpg" alt="Product {index}" loading="lazy">
+      </div>
+      <div class="product-card__body">
+        <h3 class="product-card__title"><a href="/p/{index}">Product {index}</a></h3>
+        <span class="price">{price}.99 EUR</span>
+        <span class="badge"{hidden}>Sale</span>
+        <div class="rating"><span class="stars" aria-label="{index % 5} stars"></span></div>
+        <button type="button" class="add-to-cart">Add to cart</button>
+        <script>window.dataLayer.push({{"sku": "sku-{index}", "price": {price}}});</script>
+      </div>
+    </div>"""
+
+
+def _nested_block(depth: int) -> str:
+    # Deeply nested wrappers are where per-element text lookups turn quadratic
+    return "<div class=\"wrap\">" * depth + "<span>Deep content</span>" + "</div>" * depth
+
+
+def generate_page(size: int, seed: int = 0) -> str:
+    """
+    Generates a synthetic e-commerce listing page of roughly the given size.
+
+    The page mixes everything the cleaner deals with: scripts, styles, comments,
+    empty and hidden elements, deep nesting and many repeated product cards.
+
+    Args:
+        size: Target size of the page in bytes
+        seed: Seed for the random generator, so pages are reproducible
+
+    Returns:
+        str: The HTML page
+    """
+    rng = random.Random(seed)
+    head = """<!DOCTYPE html>
+<html lang="en">
+<head>
+  <meta charset="utf-8">
+  <meta name="viewport" content="width=device-width, initial-scale=1">
+  <title>Catalog</title>
+  <link rel="stylesheet" href="/static/app.css">
+  <style>.product-card { display: flex; }</style>
+  <script src="/static/vendor.js"></script>
+</head>
+<body>
+  <header><nav><ul><li><a href="/">Home</a></li><li><a href="/shop">Shop</a></li></ul></nav></header>
+  <iframe src="https://ads.example.com/banner"></iframe>
+  <main>
+    <section class="listing">"""
+    tail = """
+    </section>
+  </main>
+  <footer><p>&copy; Example Shop</p><noscript>Enable JavaScript</noscript></footer>
+</body>
+</html>"""
+    parts = [head]
+    length = len(head) + len(tail)
+    index = 0
+    while length < size:
+        block = _nested_block(40) if index % 50 == 0 else _product_card(rng, index)
+        parts.append(block)
+        length += len(block)
+        index += 1
+    parts.append(tail)
+    return "".join(parts)
+
+
+def load_fixtures() -> Dict[str, str]:
+    """
+    Returns every benchmark fixture page keyed by its size name.
+    """
+    return {name: generate_page(size, seed=i) for i, (name, size) in enumerate(FIXTURE_SIZES.items())}
+
+
+def _paragraph(rng: random.Random) -> str:
+    words = ["quality", "page", "content", "layout", "reader", "section", "image", "link",
+             "heading", "performance", "article", "design", "accessible", "navigation"]
+    return " ".join(rng.choice(words) for _ in range(rng.randint(40, 90))).capitalize() + "."
+
+
+def generate_article(size: int, seed: int = 0) -> str:
+    """
+    Generates a synthetic long-form article of roughly the given size.
+
+    Mostly text, with a heading hierarchy (some levels skipped), figures with
+    and without alt text and inline links: the page type where the agents get
+    the most prose and the rules find heading and image issues.
+
+    Args:
+        size: Target size of the page in bytes
+        seed: Seed for the random generator, so pages are reproducible
+
+    Returns:
+        str: The HTML page
+    """
+    rng = random.Random(seed)
+    head = """<!DOCTYPE html>
+<html lang="en">
+<head>
+  <meta charset="utf-8">
+  <title>Article</title>
+  <link rel="stylesheet" href="/static/article.css">
+</head>
+<body>
+  <header><a href="/">Blog</a></header>
+  <article>
+    <h1>A long article</h1>"""
+    tail = """
+  </article>
+  <footer><p>Written by the editorial team</p></footer>
+</body>
+</html>"""
+    parts = [head]
+    length = len(head) + len(tail)
+    index = 0
+    while length < size:
+        heading = "h4" if index % 9 == 8 else "h2" if index % 3 == 0 else "h3"
+        alt = f' alt="Figure {index}"' if index % 4 else ""
+        block = f"""
+    <section id="s{index}">
+      <{heading}>Section {index}</{heading}>
+      <p>{_paragraph(rng)} <a href="/ref/{index}">Reference</a></p>
+      <figure><img src="/img/f{index}.png"{alt}><figcaption>Figure {index}</figcaption></figure>
+      <p>{_paragraph(rng)}</p>
+    </section>"""
+        parts.append(block)
+        length += len(block)
+        index += 1
+    parts.append(tail)
+    return "".join(parts)
+
+
+def generate_form(size: int, seed: int = 0) -> str:
+    """
+    Generates a synthetic page of forms of roughly the given size.
+
+    Inputs with and without labels, selects and duplicated ids make it the
+    page type the accessibility and HTML rules find the most issues in.
+
+    Args:
+        size: Target size of the page in bytes
+        seed: Seed for the random generator, so pages are reproducible
+
+    Returns:
+        str: The HTML page
+    """
+    rng = random.Random(seed)
+    head = """<!DOCTYPE html>
+<html>
+<head><title>Checkout</title><script src="/static/checkout.js"></script></head>
+<body>
+  <main>
+    <h1>Checkout</h1>"""
+    tail = """
+  </main>
+</body>
+</html>"""
+    parts = [head]
+    length = len(head) + len(tail)
+    index = 0
+    while length < size:
+        field = f"field-{index // 2 if index % 10 == 0 else index}"
+        label = f'<label for="{field}">Field {index}</label>' if index % 3 else ""
+        options = "".join(f"<option>{rng.randint(1, 99)}</option>" for _ in range(5))
+        block = f"""
+    <form action="/submit/{index}" method="post">
+      <fieldset><legend>Step {index}</legend>
+        {label}<input id="{field}" name="{field}" type="text">
+        <select name="qty-{index}">{options}</select>
+        <button type="submit">Continue</button>
+      </fieldset>
+    </form>"""
+        parts.append(block)
+        length += len(block)
+        index += 1
+    parts.append(tail)
+    return "".join(parts)
+
+
+# Page generators of the corpus, by page type
+GENERATORS: Dict[str, Callable[..., str]] = {
+    "listing": generate_page,
+    "article": generate_article,
+    "form": generate_form,
+}
+
+
+def load_corpus(sizes: Dict[str, int] = FIXTURE_SIZES) -> Dict[str, str]:
+    """
+    Returns every page type at every size, keyed "<type>-<size name>".
+
+    Args:
+        sizes: Target size in bytes of each size name, FIXTURE_SIZES by default
+    """
+    corpus = {}
+    for seed, (kind, generate) in enumerate(GENERATORS.items()):
+        for name, size in sizes.items():
+            corpus[f"{kind}-{name}"] = generate(size, seed=seed)
+    return corpus
+
+
+def write_corpus(directory: str, sizes: Dict[str, int] = FIXTURE_SIZES) -> Dict[str, str]:
+    """
+    Writes the corpus to a directory as <name>.html files.
+
+    Returns:
+        Dict[str, str]: Path of each page, keyed like load_corpus
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for name, html in load_corpus(sizes).items():
+        paths[name] = os.path.join(directory, f"{name}.html")
+        with open(paths[name], "w", encoding="utf-8") as f:
+            f.write(html)
+    return paths
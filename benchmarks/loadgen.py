@@ -0,0 +1,169 @@
+"""
+End-to-end load generator for the API, fully offline.
+
+Serves the fixture corpus from a local stub server, replaces the LLM with the
+deterministic FakeLLM and runs the app with uvicorn in this process. Then, for
+each concurrency level, it sends requests to an analysis endpoint from that
+many concurrent clients and reports the latency percentiles, the throughput
+and the peak RSS of the process.
+
+By default the result, section and page caches are disabled so every request
+runs the whole analysis; --cache keeps them. Identical prompts in flight at
+the same time are still coalesced by CachingLLM, as in production.
+
+Run with: python -m benchmarks.loadgen [--concurrency 1,4,16] [--requests N]
+    [--pages listing-small,article-medium] [--latency S] [--output FILE]
+"""
+from typing import Any, Dict, List
+import argparse
+import asyncio
+import logging
+import socket
+import threading
+import time
+
+import httpx
+import uvicorn
+
+from benchmarks.fake_llm import FakeLLM, disable_caches, use_llm
+from benchmarks.fixtures import FIXTURE_SIZES, load_corpus
+from benchmarks.results import peak_rss_mb, percentile, save_results
+from benchmarks.stub_server import StubServer
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app(port: int) -> uvicorn.Server:
+    """
+    Starts the API on 127.0.0.1 in a background thread and waits until it is up.
+    """
+    import main
+
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.monotonic() + 30
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("The API did not start within 30s")
+        time.sleep(0.05)
+    return server
+
+
+async def run_level(base_url: str, endpoint: str, urls: List[str], concurrency: int,
+                    requests: int, timeout: float) -> Dict[str, Any]:
+    """
+    Sends requests to the endpoint from concurrency clients and measures them.
+
+    Args:
+        base_url: URL of the API
+        endpoint: Path of the analysis endpoint, e.g. /api/analyze
+        urls: Pages to analyze, requested in turn
+        concurrency: Number of clients sending requests at the same time
+        requests: Total number of requests
+        timeout: Seconds after which a request counts as failed
+
+    Returns:
+        Dict[str, Any]: Latency percentiles, throughput and errors of the level
+    """
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    queue: asyncio.Queue = asyncio.Queue()
+    for index in range(requests):
+        queue.put_nowait(urls[index % len(urls)])
+
+    async def client(http: httpx.AsyncClient) -> None:
+        while not queue.empty():
+            url = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                response = await http.post(endpoint, json={"url": url})
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            if status == "200":
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors[status] = errors.get(status, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as http:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "requests": requests,
+        "ok": len(latencies),
+        "errors": sum(errors.values()),
+        "error_statuses": errors,
+        "p50_s": percentile(latencies, 0.50),
+        "p95_s": percentile(latencies, 0.95),
+        "p99_s": percentile(latencies, 0.99),
+        "mean_s": sum(latencies) / len(latencies) if latencies else 0.0,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "elapsed_s": elapsed,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main(argv: List[str] = None) -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--concurrency", default="1,4,16", help="Comma separated concurrency levels")
+    arg_parser.add_argument("--requests", type=int, default=40, help="Requests per concurrency level")
+    arg_parser.add_argument("--pages", default="listing-small,article-small,form-small,listing-medium",
+                            help="Comma separated corpus pages to request, see benchmarks.fixtures.load_corpus")
+    arg_parser.add_argument("--endpoint", default="/api/analyze")
+    arg_parser.add_argument("--latency", type=float, default=0.5, help="Seconds the fake LLM takes per call")
+    arg_parser.add_argument("--jitter", type=float, default=0.2, help="Extra seconds, up to, per call")
+    arg_parser.add_argument("--issues", type=int, default=2, help="Issues the fake LLM reports per call")
+    arg_parser.add_argument("--broken-rate", type=float, default=0.0,
+                            help="Fraction of the fake LLM's answers that are truncated")
+    arg_parser.add_argument("--cache", action="store_true", help="Keep the result, section and page caches")
+    arg_parser.add_argument("--timeout", type=float, default=300)
+    arg_parser.add_argument("--output", help="Write the results to this JSON file")
+    args = arg_parser.parse_args(argv)
+
+    corpus = load_corpus({name: FIXTURE_SIZES[name] for name in FIXTURE_SIZES})
+    pages = args.pages.split(",")
+    unknown = [page for page in pages if page not in corpus]
+    if unknown:
+        arg_parser.error(f"unknown pages {unknown}, choose from {sorted(corpus)}")
+
+    # One log line per request would interleave with the report
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    llm = use_llm(FakeLLM(model="fake", latency=args.latency, jitter=args.jitter,
+                          issues_per_call=args.issues, broken_rate=args.broken_rate))
+    if not args.cache:
+        disable_caches()
+
+    results: Dict[str, Dict[str, Any]] = {}
+    with StubServer({f"/{page}.html": corpus[page] for page in pages}) as stub:
+        urls = [stub.url(f"/{page}.html") for page in pages]
+        port = free_port()
+        server = start_app(port)
+        try:
+            print(f"{'clients':>7} {'ok':>5} {'errors':>6} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} "
+                  f"{'req/s':>7} {'llm calls':>9} {'peak MB':>8}")
+            for concurrency in [int(level) for level in args.concurrency.split(",")]:
+                calls = llm.stats()["calls"]
+                result = asyncio.run(run_level(f"http://127.0.0.1:{port}", args.endpoint, urls,
+                                               concurrency, args.requests, args.timeout))
+                result["llm_calls"] = llm.stats()["calls"] - calls
+                results[f"concurrency-{concurrency}"] = result
+                print(f"{concurrency:>7} {result['ok']:>5} {result['errors']:>6} {result['p50_s']:>7.2f} "
+                      f"{result['p95_s']:>7.2f} {result['p99_s']:>7.2f} {result['throughput_rps']:>7.2f} "
+                      f"{result['llm_calls']:>9} {result['peak_rss_mb']:>8.0f}")
+        finally:
+            server.should_exit = True
+
+    if args.output:
+        save_results(args.output, "loadgen", args, results)
+        print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
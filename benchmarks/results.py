@@ -0,0 +1,135 @@
+"""
+Saving benchmark results as JSON and comparing two runs for regressions.
+
+Every benchmark writes {"benchmark", "environment", "args", "results"} where
+results maps a case name (e.g. "listing-large/parse") to its measurements.
+Measurements whose name ends in "_s" or "_mb" are costs (lower is better),
+those ending in "_rps" are throughputs (higher is better).
+
+Run with: python -m benchmarks.results OLD.json NEW.json [--threshold 0.1]
+"""
+from typing import Any, Dict, List, Sequence
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+
+
+def percentile(values: Sequence[float], fraction: float) -> float:
+    """
+    Returns the given percentile of values by linear interpolation, 0 when empty.
+
+    Args:
+        values: Measurements, in any order
+        fraction: Percentile between 0 and 1, e.g. 0.95
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def peak_rss_mb() -> float:
+    """
+    Returns the peak resident set size of this process so far, in MB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 1_000_000 if sys.platform == "darwin" else peak / 1000
+
+
+def environment() -> Dict[str, Any]:
+    """
+    Returns what a run depends on besides the code: machine, Python and commit.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "time": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def save_results(path: str, benchmark: str, args: argparse.Namespace, results: Dict[str, Dict[str, float]]) -> None:
+    """
+    Writes the results of a benchmark run to a JSON file.
+
+    Args:
+        path: File to write
+        benchmark: Name of the benchmark
+        args: Command line arguments of the run
+        results: Measurements of each case
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"benchmark": benchmark, "environment": environment(), "args": vars(args),
+                   "results": results}, f, indent=2)
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    Returns a line for every measurement that got worse by more than threshold.
+
+    Args:
+        old: Results file of the baseline run
+        new: Results file of the run to check
+        threshold: Relative change tolerated, e.g. 0.1 for 10%
+    """
+    regressions = []
+    for case, measurements in new["results"].items():
+        baseline = old["results"].get(case, {})
+        for name, value in measurements.items():
+            before = baseline.get(name)
+            if not isinstance(before, (int, float)) or not isinstance(value, (int, float)) or before <= 0:
+                continue
+            if name.endswith(("_s", "_mb")):
+                change = value / before - 1
+            elif name.endswith("_rps"):
+                change = before / value - 1 if value > 0 else float("inf")
+            else:
+                continue
+            if change > threshold:
+                regressions.append(f"{case} {name}: {before:.4g} -> {value:.4g} ({change:+.0%} worse)")
+    return regressions
+
+
+def main(argv: List[str] = None) -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("old")
+    arg_parser.add_argument("new")
+    arg_parser.add_argument("--threshold", type=float, default=0.1,
+                            help="Relative change tolerated before a measurement counts as a regression")
+    args = arg_parser.parse_args(argv)
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    if old["benchmark"] != new["benchmark"]:
+        sys.exit(f"cannot compare {old['benchmark']} with {new['benchmark']}")
+
+    regressions = compare(old, new, args.threshold)
+    for line in regressions:
+        print(line)
+    print(f"{len(regressions)} regressions over {args.threshold:.0%} "
+          f"({old['environment'].get('commit')} -> {new['environment'].get('commit')})")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
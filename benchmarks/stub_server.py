@@ -0,0 +1,139 @@
+"""
+A local HTTP server standing in for the sites being analyzed.
+
+It serves pages from memory with ETag and Last-Modified validators, answers
+conditional requests with 304 and counts the requests it gets, so the fetcher
+and the endpoints can be exercised without touching the network.
+
+Run with: python -m benchmarks.stub_server [--port N] to serve the fixtures.
+"""
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+import argparse
+import hashlib
+import threading
+import time
+
+from benchmarks.fixtures import load_fixtures
+
+
+class StubServer:
+    """
+    Serves in-memory pages on 127.0.0.1 from a background thread.
+
+    Use as a context manager:
+
+        with StubServer({"/page.html": html}) as server:
+            url = server.url("/page.html")
+    """
+
+    def __init__(self, pages: Optional[Dict[str, str]] = None, port: int = 0):
+        """
+        Initialize the server.
+
+        Args:
+            pages: HTML of each path, served as UTF-8
+            port: Port to listen on, a free one by default
+        """
+        # Body, content type, Last-Modified and whether to send Content-Length, for each path
+        self.pages: Dict[str, Tuple[bytes, str, str, bool]] = {}
+        self.requests: Dict[str, int] = {}
+        self.not_modified = 0
+        self._lock = threading.Lock()
+        for path, html in (pages or {}).items():
+            self.set_page(path, html)
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    def set_page(self, path: str, body, content_type: str = "text/html; charset=utf-8",
+                 content_length: bool = True) -> None:
+        """
+        Serves body at path, replacing what was there. str bodies are encoded as UTF-8.
+
+        Without content_length the body is sent with no Content-Length header and
+        ends when the connection closes, as some servers do.
+        """
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        with self._lock:
+            self.pages[path] = (body, content_type, formatdate(time.time(), usegmt=True), content_length)
+
+    def url(self, path: str) -> str:
+        """
+        Returns the URL of a path on the server.
+        """
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{path}"
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StubServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                with server._lock:
+                    server.requests[self.path] = server.requests.get(self.path, 0) + 1
+                    page = server.pages.get(self.path)
+                if page is None:
+                    self.send_error(404)
+                    return
+                body, content_type, last_modified, content_length = page
+                etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+                if self.headers.get("If-None-Match") == etag or \
+                        (not self.headers.get("If-None-Match") and self.headers.get("If-Modified-Since") == last_modified):
+                    with server._lock:
+                        server.not_modified += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                if content_length:
+                    self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", last_modified)
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up on the download, e.g. over a size limit
+                    pass
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        return Handler
+
+
+def main(argv=None) -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--port", type=int, default=8765)
+    args = arg_parser.parse_args(argv)
+
+    server = StubServer({f"/{name}.html": page for name, page in load_fixtures().items()}, port=args.port)
+    for path in server.pages:
+        print(server.url(path))
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
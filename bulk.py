@@ -0,0 +1,262 @@
+"""
+Analyzes a local corpus of HTML pages without going through the API.
+
+The corpus is a directory of HTML files (e.g. a site export), a WARC file
+(.warc or .warc.gz) or a single page. Pages are read one at a time, parsed,
+cleaned and checked by the rules in a pool of worker processes, then analyzed
+by the agents with bounded concurrency. One JSON line per page is appended to
+the output as soon as the page is done, in the format of /api/analyze/batch.
+
+Progress is saved in a checkpoint next to the output after every page, so an
+interrupted run picks up where it stopped when started again with the same
+arguments; --restart starts over. Only a bounded number of pages are in
+flight at any time, so memory stays flat however large the corpus is.
+
+Run with: python bulk.py CORPUS --output issues.jsonl [--base-url URL]
+    [--workers N] [--concurrency N] [--evaluators ux,html]
+"""
+from typing import Dict, List, Optional, Set
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+
+from core.config import BULK_MAX_CONCURRENT, BULK_WORKERS
+from core.log import configure_logging
+from core.preprocess import PreprocessPool
+from utils.corpus import Document, iter_corpus
+
+logger = logging.getLogger("bulk")
+
+# Pages read ahead per worker process, so the workers never wait for the reader
+READ_AHEAD = 2
+
+# Pages done between two progress log lines
+PROGRESS_EVERY = 100
+
+
+def available_cores() -> int:
+    """
+    Returns the number of cores this process may run on.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+class Checkpoint:
+    """
+    Which pages of a corpus are done, and how much of the output they wrote.
+
+    Pages are numbered in corpus order. Since they finish out of order, the
+    checkpoint keeps the number below which every page is done and the few
+    done above it, whose count is bounded by the pages in flight. It is saved
+    atomically after every page, with the size of the output at that point,
+    so lines written after the last save are dropped when resuming.
+    """
+
+    def __init__(self, path: str, corpus: str):
+        """
+        Initialize an empty checkpoint.
+
+        Args:
+            path: File the checkpoint is saved to
+            corpus: Path of the corpus, a checkpoint of another corpus is not resumed
+        """
+        self.path = path
+        self.corpus = corpus
+        self.done_below = 0
+        self.done: Set[int] = set()
+        self.output_size = 0
+
+    @classmethod
+    def load(cls, path: str, corpus: str) -> "Checkpoint":
+        """
+        Returns the checkpoint saved at path for corpus, an empty one if there is none.
+        """
+        checkpoint = cls(path, corpus)
+        try:
+            with open(path, encoding="utf-8") as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return checkpoint
+        if state.get("corpus") != corpus:
+            logger.warning("Checkpoint %s is for another corpus (%s), starting over", path, state.get("corpus"))
+            return checkpoint
+        checkpoint.done_below = state["done_below"]
+        checkpoint.done = set(state["done"])
+        checkpoint.output_size = state["output_size"]
+        return checkpoint
+
+    def is_done(self, number: int) -> bool:
+        return number < self.done_below or number in self.done
+
+    @property
+    def pages_done(self) -> int:
+        return self.done_below + len(self.done)
+
+    def complete(self, number: int, output_size: int) -> None:
+        """
+        Records a page as done, its line written, and saves the checkpoint.
+        """
+        self.done.add(number)
+        while self.done_below in self.done:
+            self.done.remove(self.done_below)
+            self.done_below += 1
+        self.output_size = output_size
+        self.save()
+
+    def save(self) -> None:
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump({"corpus": self.corpus, "done_below": self.done_below, "done": sorted(self.done),
+                       "output_size": self.output_size}, file)
+        os.replace(temporary, self.path)
+
+
+async def analyze_corpus(documents, output, checkpoint: Checkpoint, workers: int, concurrency: int,
+                         evaluators: Optional[List[str]] = None) -> Dict[str, int]:
+    """
+    Analyzes the pages of a corpus and writes one JSON line per page to output.
+
+    Args:
+        documents: The pages, see utils.corpus.iter_corpus
+        output: Binary file the lines are appended to
+        checkpoint: Pages already done, skipped, and updated as pages finish
+        workers: Number of processes preparing pages
+        concurrency: Number of pages analyzed by the agents at the same time
+        evaluators: Evaluators to run, chosen from each page's content by default
+
+    Returns:
+        Dict[str, int]: Number of pages analyzed, failed and skipped as already done
+
+    Raises:
+        ValueError: If evaluators names an unknown evaluator
+    """
+    # Imported here rather than at the top: the worker processes import this
+    # module, and have no use for the agents and the LLM
+    from api.batch import BatchItem
+    from api.endpoints import analyze_page, select
+    from core.concurrency import AnalysisLimiter
+    from core.config import OPENAI_MODEL as model_name
+    from crew.pipeline import EVALUATORS, EVALUATOR_VIEWS
+    from fastapi import HTTPException
+    from utils.chunk_html import token_budget_for
+
+    names = [name for name, _, _, _ in EVALUATORS]
+    unknown = sorted(set(evaluators or []) - set(names))
+    if unknown:
+        raise ValueError(f"Unknown evaluators {unknown}, choose from {names}")
+
+    token_budget = token_budget_for(model_name)
+    in_flight_limit = workers * READ_AHEAD + concurrency
+    # The number of pages in flight is bounded here, the limiter only needs to run them
+    limiter = AnalysisLimiter(max_concurrent=concurrency, max_queued=in_flight_limit, queue_timeout=float("inf"))
+    counts = {"analyzed": 0, "failed": 0, "skipped": 0}
+    started = time.perf_counter()
+
+    async def analyze_one(document: Document) -> BatchItem:
+        start_time = time.time()
+        if document.content is None:
+            return BatchItem(url=document.url, status_code=422,
+                             error=f"Page too large: {document.size} bytes")
+        try:
+            page = await pool.prepare(document.text(), token_budget, EVALUATOR_VIEWS)
+            if not page.chunks:
+                return BatchItem(url=document.url, error="Empty page", status_code=422)
+            result = await analyze_page(document.url, page, start_time, selection=select(page, evaluators),
+                                        limiter=limiter)
+            return BatchItem(url=document.url, result=result)
+        except HTTPException as e:
+            return BatchItem(url=document.url, error=str(e.detail), status_code=e.status_code)
+        except Exception as e:
+            # One broken page must not stop the run
+            logger.warning("Could not analyze %s: %s", document.id, e)
+            return BatchItem(url=document.url, error=f"{type(e).__name__}: {e}", status_code=500)
+
+    def write(number: int, item: BatchItem) -> None:
+        output.write(item.model_dump_json().encode("utf-8") + b"\n")
+        output.flush()
+        checkpoint.complete(number, output.tell())
+        counts["failed" if item.error else "analyzed"] += 1
+        done = counts["analyzed"] + counts["failed"]
+        if done % PROGRESS_EVERY == 0:
+            logger.info("%d pages done (%d failed), %.1f pages/s", done, counts["failed"],
+                        done / (time.perf_counter() - started))
+
+    # Every page goes to the workers, the event loop only writes results
+    pool = PreprocessPool(workers, inline_max_bytes=0)
+    pending: Dict[asyncio.Task, int] = {}
+    try:
+        for number, document in enumerate(documents):
+            if checkpoint.is_done(number):
+                counts["skipped"] += 1
+                continue
+            while len(pending) >= in_flight_limit:
+                finished, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    write(pending.pop(task), task.result())
+            pending[asyncio.ensure_future(analyze_one(document))] = number
+        while pending:
+            finished, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                write(pending.pop(task), task.result())
+    finally:
+        for task in pending:
+            task.cancel()
+        pool.shutdown()
+        limiter.shutdown()
+    return counts
+
+
+def main(argv: List[str] = None) -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("corpus", help="Directory of HTML files, WARC file or HTML file")
+    arg_parser.add_argument("--output", required=True, help="JSONL file the results are written to")
+    arg_parser.add_argument("--base-url", default="http://localhost/",
+                            help="URL the corpus directory stands for, pages are analyzed under it")
+    arg_parser.add_argument("--workers", type=int, default=BULK_WORKERS or available_cores(),
+                            help="Processes preparing pages, one per available core by default")
+    arg_parser.add_argument("--concurrency", type=int, default=BULK_MAX_CONCURRENT,
+                            help="Pages analyzed by the agents at the same time")
+    arg_parser.add_argument("--evaluators", help="Comma separated evaluators to run, chosen per page by default")
+    arg_parser.add_argument("--checkpoint", help="Checkpoint file, the output followed by .checkpoint by default")
+    arg_parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start over")
+    args = arg_parser.parse_args(argv)
+
+    configure_logging()
+    if not os.path.exists(args.corpus):
+        arg_parser.error(f"no such corpus: {args.corpus}")
+    evaluators = args.evaluators.split(",") if args.evaluators else None
+    corpus = os.path.abspath(args.corpus)
+    checkpoint_path = args.checkpoint or args.output + ".checkpoint"
+    checkpoint = Checkpoint.load(checkpoint_path, corpus)
+    if args.restart or not os.path.exists(args.output):
+        checkpoint = Checkpoint(checkpoint_path, corpus)
+
+    resume = checkpoint.pages_done > 0
+    with open(args.output, "r+b" if resume else "wb") as output:
+        if resume:
+            # Lines written after the last save belong to pages that run again
+            output.truncate(checkpoint.output_size)
+            output.seek(0, os.SEEK_END)
+            logger.info("Resuming %s: %d pages already done", args.corpus, checkpoint.pages_done)
+        start = time.perf_counter()
+        try:
+            counts = asyncio.run(analyze_corpus(iter_corpus(args.corpus, args.base_url), output, checkpoint,
+                                                max(1, args.workers), max(1, args.concurrency), evaluators))
+        except ValueError as e:
+            arg_parser.error(str(e))
+        except KeyboardInterrupt:
+            print(f"Interrupted after {checkpoint.pages_done} pages, run again to resume")
+            raise SystemExit(130)
+
+    elapsed = time.perf_counter() - start
+    print(f"{counts['analyzed']} pages analyzed, {counts['failed']} failed, "
+          f"{counts['skipped']} skipped as already done, in {elapsed:.1f}s; results in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
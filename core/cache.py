@@ -0,0 +1,199 @@
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from core.config import (
+    RESULT_CACHE_BACKEND, RESULT_CACHE_TTL, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_PATH,
+    SECTION_CACHE_TTL, SECTION_CACHE_MAX_ENTRIES, PAGE_STORE_TTL, PAGE_STORE_MAX_ENTRIES
+)
+from core.db import ProcessLocalConnection
+
+
+class ResultCache:
+    """
+    Base class of the analysis result caches.
+
+    Values are JSON-serializable dicts. Subclasses implement _get and _set; this
+    class keeps the hit and miss counters and, used as is, caches nothing.
+    """
+
+    backend = "none"
+
+    def __init__(self, ttl: float, max_entries: int):
+        """
+        Initialize the cache.
+
+        Args:
+            ttl: Seconds an entry stays valid
+            max_entries: Number of entries kept before the least recently used is evicted
+        """
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the value stored for key, or None if it is missing or expired.
+        """
+        value = self._get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """
+        Stores value for key, evicting the least recently used entries if needed.
+        """
+        self._set(key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the hit and miss counters of the cache.
+        """
+        return {"backend": self.backend, "hits": self.hits, "misses": self.misses}
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        return None
+
+    def _set(self, key: str, value: Dict[str, Any]) -> None:
+        pass
+
+
+class MemoryResultCache(ResultCache):
+    """
+    In-process LRU cache with a time to live.
+    """
+
+    backend = "memory"
+
+    def __init__(self, ttl: float, max_entries: int):
+        super().__init__(ttl, max_entries)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key: str, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SQLiteResultCache(ResultCache):
+    """
+    On-disk cache stored in a single SQLite file, shared by every worker.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path: str, ttl: float, max_entries: int, table: str = "results"):
+        """
+        Initialize the cache.
+
+        Args:
+            path: Path of the SQLite database file, created if missing
+            ttl: Seconds an entry stays valid
+            max_entries: Number of entries kept before the least recently used is evicted
+            table: Table holding the entries, so several caches can share one file
+        """
+        super().__init__(ttl, max_entries)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.table = table
+        self._lock = threading.Lock()
+        self._connection = ProcessLocalConnection(self._connect)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        db.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_accessed_at ON {self.table} (accessed_at)")
+        return db
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        return self._connection.get()
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT value FROM {self.table} WHERE key = ? AND expires_at >= ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def _set(self, key: str, value: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + self.ttl, now)
+            )
+            self._db.execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (now,))
+            self._db.execute(
+                f"DELETE FROM {self.table} WHERE key IN ("
+                f"SELECT key FROM {self.table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+
+def create_result_cache(backend: str = RESULT_CACHE_BACKEND, table: str = "results",
+                        ttl: float = RESULT_CACHE_TTL,
+                        max_entries: int = RESULT_CACHE_MAX_ENTRIES) -> ResultCache:
+    """
+    Creates a result cache for the configured backend.
+
+    Args:
+        backend: "memory", "sqlite" or "none"
+        table: SQLite table of the cache, see SQLiteResultCache
+        ttl: Seconds an entry stays valid
+        max_entries: Number of entries kept before the least recently used is evicted
+
+    Returns:
+        ResultCache: The cache; the "none" backend never stores anything
+    """
+    if backend == "memory":
+        return MemoryResultCache(ttl, max_entries)
+    if backend == "sqlite":
+        return SQLiteResultCache(RESULT_CACHE_PATH, ttl, max_entries, table=table)
+    return ResultCache(ttl, max_entries)
+
+
+# Complete analyses, keyed by crew.pipeline.analysis_cache_key
+result_cache = create_result_cache()
+
+# Issues of a single evaluator on a single chunk of a page, keyed by
+# crew.pipeline.section_cache_key, so unchanged parts of a page are not re-analyzed
+section_cache = create_result_cache(table="sections", ttl=SECTION_CACHE_TTL,
+                                    max_entries=SECTION_CACHE_MAX_ENTRIES)
+
+# Validators and last complete result of each analyzed URL, keyed by URL, for
+# conditional revalidation of pages (see api.endpoints.fetch_page)
+page_store = create_result_cache(table="pages", ttl=PAGE_STORE_TTL, max_entries=PAGE_STORE_MAX_ENTRIES)
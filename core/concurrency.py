@@ -0,0 +1,125 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+import asyncio
+import contextvars
+import functools
+import time
+
+from core.config import ANALYSIS_MAX_CONCURRENT, ANALYSIS_MAX_QUEUED, ANALYSIS_QUEUE_TIMEOUT
+from core.metrics import record_stage
+
+
+class AnalysisQueueFullError(Exception):
+    """
+    Raised when an analysis cannot even be queued because the queue is full.
+    """
+
+
+class AnalysisQueueTimeoutError(Exception):
+    """
+    Raised when a queued analysis waited too long for a free slot.
+    """
+
+
+class AnalysisLimiter:
+    """
+    Runs blocking analyses on a bounded thread pool with a bounded wait queue.
+
+    At most max_concurrent analyses run at once; up to max_queued more wait for a
+    slot for at most queue_timeout seconds. Everything else is rejected so callers
+    can answer with backpressure instead of piling up work.
+    """
+
+    def __init__(self, max_concurrent: int, max_queued: int, queue_timeout: float):
+        """
+        Initialize the limiter.
+
+        Args:
+            max_concurrent: Number of analyses allowed to run at the same time
+            max_queued: Number of analyses allowed to wait for a free slot
+            queue_timeout: Seconds a queued analysis may wait before giving up
+        """
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queued = max(0, max_queued)
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self.queued = 0
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent,
+                                            thread_name_prefix="qa-analysis")
+
+    async def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Run func(*args, **kwargs) on the analysis thread pool once a slot is free.
+
+        Args:
+            func: Blocking callable to run
+            *args: Positional arguments for func
+            **kwargs: Keyword arguments for func
+
+        Returns:
+            Any: The return value of func
+
+        Raises:
+            AnalysisQueueFullError: If all slots are busy and the queue is full
+            AnalysisQueueTimeoutError: If no slot freed up within queue_timeout
+        """
+        queued_at = time.perf_counter()
+        if not self._semaphore.locked():
+            # A slot is free: acquiring it does not suspend, so no other request
+            # can sneak in between the check and the acquire.
+            await self._semaphore.acquire()
+        else:
+            if self.queued >= self.max_queued:
+                raise AnalysisQueueFullError(
+                    f"{self.running} analyses running and {self.queued} queued")
+
+            self.queued += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise AnalysisQueueTimeoutError(
+                    f"No analysis slot became free within {self.queue_timeout:.0f}s")
+            finally:
+                self.queued -= 1
+
+        record_stage("queue", time.perf_counter() - queued_at)
+        self.running += 1
+        loop = asyncio.get_running_loop()
+        # Run in a copy of the caller's context, so the analysis adds its
+        # stage timings to those of the request (see core.metrics)
+        context = contextvars.copy_context()
+        try:
+            future = self._executor.submit(functools.partial(context.run, func, *args, **kwargs))
+        except BaseException:
+            self._release()
+            raise
+        # The slot is held until the thread is done, not until the caller stops
+        # waiting: a cancelled caller (e.g. a client that disconnected) leaves
+        # the analysis running, and it must still count against the limit
+        future.add_done_callback(lambda _: self._release_threadsafe(loop))
+        return await asyncio.wrap_future(future)
+
+    def _release(self) -> None:
+        self.running -= 1
+        self._semaphore.release()
+
+    def _release_threadsafe(self, loop: asyncio.AbstractEventLoop) -> None:
+        try:
+            loop.call_soon_threadsafe(self._release)
+        except RuntimeError:
+            # The event loop is closed, nothing waits for the slot any more
+            pass
+
+    def shutdown(self) -> None:
+        """
+        Stop the thread pool, without waiting for running analyses.
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+analysis_limiter = AnalysisLimiter(
+    max_concurrent=ANALYSIS_MAX_CONCURRENT,
+    max_queued=ANALYSIS_MAX_QUEUED,
+    queue_timeout=ANALYSIS_QUEUE_TIMEOUT,
+)
@@ -0,0 +1,207 @@
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+# Crew execution
+# "parallel" runs every evaluator task at the same time, "sequential" keeps the
+# original one-after-another crewAI process.
+CREW_PROCESS = os.getenv("CREW_PROCESS", "parallel")
+CREW_MAX_PARALLEL_TASKS = int(os.getenv("CREW_MAX_PARALLEL_TASKS", "8"))
+CREW_TASK_TIMEOUT = float(os.getenv("CREW_TASK_TIMEOUT", "120"))
+# Which evaluators run on a page: "features" skips or scales down those with
+# little to look at (see crew.selection), "all" runs every evaluator in full.
+EVALUATOR_POLICY = os.getenv("EVALUATOR_POLICY", "features")
+# crewAI's verbose mode prints every prompt, page HTML included, to stdout
+CREW_VERBOSE = os.getenv("CREW_VERBOSE", "false").lower() in ("1", "true", "yes")
+
+# Request admission
+# Analyses run on a dedicated thread pool so the event loop stays free. Requests
+# beyond ANALYSIS_MAX_CONCURRENT wait in a bounded queue; a full queue answers 429
+# and a request that waits longer than ANALYSIS_QUEUE_TIMEOUT answers 503.
+ANALYSIS_MAX_CONCURRENT = int(os.getenv("ANALYSIS_MAX_CONCURRENT", "32"))
+ANALYSIS_MAX_QUEUED = int(os.getenv("ANALYSIS_MAX_QUEUED", "64"))
+ANALYSIS_QUEUE_TIMEOUT = float(os.getenv("ANALYSIS_QUEUE_TIMEOUT", "30"))
+# Seconds a request may take in total; clients may ask for less. Evaluators still
+# running then are stopped and the issues found so far are returned. 0 for none.
+ANALYSIS_DEADLINE = float(os.getenv("ANALYSIS_DEADLINE", "300"))
+
+# Startup
+# crewAI takes seconds to import. "background" serves requests (health checks
+# included) at once and loads it behind them, analyses waiting for it; "eager"
+# loads it before serving. Either way, under gunicorn it is loaded once in the
+# master and shared by the workers (see gunicorn.conf.py).
+STARTUP_LOAD = os.getenv("STARTUP_LOAD", "background")
+
+# HTML parsing
+# Any BeautifulSoup tree builder name ("html.parser", "lxml", "html5lib"). When the
+# requested backend is not installed the cleaner falls back to html.parser.
+HTML_PARSER = os.getenv("HTML_PARSER", "html.parser")
+
+# Prompt chunking
+# Token budget for the HTML of a single prompt, per model. Models not listed use
+# CHUNK_TOKEN_BUDGET. CHUNK_MAX_CHUNKS bounds how many chunks of one page are sent
+# to each evaluator, which keeps the cost of huge pages predictable.
+CHUNK_TOKEN_BUDGET = int(os.getenv("CHUNK_TOKEN_BUDGET", "3000"))
+CHUNK_TOKEN_BUDGETS = {
+    "gpt-3.5-turbo": 3000,
+    "gpt-4": 4000,
+    "gpt-4-turbo": 12000,
+    "gpt-4o": 12000,
+    "gpt-4o-mini": 12000,
+}
+CHUNK_MAX_CHUNKS = int(os.getenv("CHUNK_MAX_CHUNKS", "12"))
+
+# Repeated templates
+# Sibling elements sharing one structure (product cards, search results, table
+# rows) are sent to the agents once when there are at least TEMPLATE_MIN_REPEATS
+# of them, and the issues found on that one are copied onto the others. 0 sends
+# every copy.
+TEMPLATE_MIN_REPEATS = int(os.getenv("TEMPLATE_MIN_REPEATS", "3"))
+
+# Result cache
+# "memory" keeps an in-process LRU, "sqlite" stores results on disk at
+# RESULT_CACHE_PATH, "none" disables caching. Entries expire after
+# RESULT_CACHE_TTL seconds and the least recently used ones are evicted beyond
+# RESULT_CACHE_MAX_ENTRIES.
+RESULT_CACHE_BACKEND = os.getenv("RESULT_CACHE_BACKEND", "memory")
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "3600"))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1000"))
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "data/results.sqlite3")
+
+# Section cache
+# Issues found by each evaluator in each chunk of a page, kept for incremental
+# re-analysis: when a page changes, only the chunks whose content changed are sent
+# to the agents again. Uses the RESULT_CACHE_BACKEND storage.
+SECTION_CACHE_TTL = float(os.getenv("SECTION_CACHE_TTL", str(7 * 24 * 3600)))
+SECTION_CACHE_MAX_ENTRIES = int(os.getenv("SECTION_CACHE_MAX_ENTRIES", "50000"))
+
+# LLM response cache
+# Answers of the LLM keyed on the model, its parameters and the normalized prompt,
+# so identical prompts (e.g. a header shared by every page of a site) reach the
+# provider once. LLM_CACHE_BACKEND takes the RESULT_CACHE_BACKEND values.
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+
+# LLM routing
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+# Every evaluator uses OPENAI_MODEL unless LLM_EVALUATOR_MODELS gives it another
+# model ("html=gpt-4o-mini,ux=gpt-4o"). With LLM_CHEAP_MODEL set, prompts of at
+# most LLM_CHEAP_MAX_TOKENS tokens go to the cheap model first and are escalated
+# to the evaluator's model when its answer is not a valid report. A model that
+# keeps failing is replaced by the LLM_FALLBACK_MODELS, in order. LLM_BASE_URL
+# points every model at another OpenAI-compatible endpoint (e.g. a local fake).
+LLM_EVALUATOR_MODELS = dict(item.split("=", 1) for item in os.getenv("LLM_EVALUATOR_MODELS", "").split(",")
+                            if "=" in item)
+LLM_CHEAP_MODEL = os.getenv("LLM_CHEAP_MODEL", "")
+LLM_CHEAP_MAX_TOKENS = int(os.getenv("LLM_CHEAP_MAX_TOKENS", "2000"))
+LLM_FALLBACK_MODELS = [model for model in os.getenv("LLM_FALLBACK_MODELS", "").split(",") if model]
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "")
+
+# Requests and tokens per minute allowed for each model, enforced with token
+# buckets before calls reach the provider. LLM_RATE_LIMITS overrides them
+# ("gpt-4o=500:30000,gpt-4o-mini=500:200000"); models not listed are unlimited.
+# A call that cannot get through within LLM_RATE_LIMIT_TIMEOUT seconds fails
+# over to the next model.
+LLM_RATE_LIMITS = {
+    "gpt-3.5-turbo": (3500, 200000),
+    "gpt-4": (500, 10000),
+    "gpt-4-turbo": (500, 30000),
+    "gpt-4o": (500, 30000),
+    "gpt-4o-mini": (500, 200000),
+}
+LLM_RATE_LIMITS.update({
+    model: tuple(float(limit) for limit in limits.split(":", 1))
+    for model, limits in (item.split("=", 1) for item in os.getenv("LLM_RATE_LIMITS", "").split(",") if "=" in item)
+})
+LLM_RATE_LIMIT_TIMEOUT = float(os.getenv("LLM_RATE_LIMIT_TIMEOUT", "60"))
+
+# Failed calls (rate limited, timed out, server errors) are retried up to
+# LLM_RETRIES times with exponential backoff and full jitter.
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "3"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "1.0"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "30"))
+
+# LLM pricing
+# USD per million (prompt, completion) tokens, used to estimate the cost reported
+# by the /metrics endpoint. Models not listed are counted as free.
+LLM_PRICES = {
+    "gpt-3.5-turbo": (0.5, 1.5),
+    "gpt-4": (30.0, 60.0),
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+}
+
+# Metrics
+# Each process keeps its own metrics. With METRICS_DIR set (gunicorn.conf.py sets
+# it), every process writes them to a file of its own in that directory every
+# METRICS_WRITE_INTERVAL seconds, and /metrics reports the sum over all the
+# processes, whichever of them answers the scrape.
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_WRITE_INTERVAL = float(os.getenv("METRICS_WRITE_INTERVAL", "5"))
+
+# Page fetching
+FETCH_TIMEOUT = float(os.getenv("FETCH_TIMEOUT", "30"))
+FETCH_MAX_CONNECTIONS = int(os.getenv("FETCH_MAX_CONNECTIONS", "100"))
+FETCH_PER_HOST_CONCURRENCY = int(os.getenv("FETCH_PER_HOST_CONCURRENCY", "4"))
+# Pages larger than FETCH_MAX_BYTES are not downloaded further. HTTP/2 is used
+# when FETCH_HTTP2 is on and the h2 package is installed.
+FETCH_MAX_BYTES = int(os.getenv("FETCH_MAX_BYTES", str(5 * 1024 * 1024)))
+FETCH_HTTP2 = os.getenv("FETCH_HTTP2", "true").lower() in ("1", "true", "yes")
+
+# Page preprocessing
+# Pages larger than PREPROCESS_INLINE_MAX_BYTES are parsed, checked and chunked
+# in a pool of PREPROCESS_WORKERS processes, so they do not stall the event loop;
+# smaller ones are prepared inline. PREPROCESS_WORKERS=0 prepares every page inline.
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", "2"))
+PREPROCESS_INLINE_MAX_BYTES = int(os.getenv("PREPROCESS_INLINE_MAX_BYTES", str(8 * 1024)))
+
+# Page store
+# ETag and Last-Modified of each analyzed URL with its last complete result, so
+# that a page the server reports as unchanged (304) is not analyzed again. Uses
+# the RESULT_CACHE_BACKEND storage.
+PAGE_STORE_TTL = float(os.getenv("PAGE_STORE_TTL", str(7 * 24 * 3600)))
+PAGE_STORE_MAX_ENTRIES = int(os.getenv("PAGE_STORE_MAX_ENTRIES", "10000"))
+
+# Batch analysis
+# BATCH_MAX_CONCURRENT pages of a batch are fetched and analyzed at the same time;
+# BATCH_MAX_URLS bounds the size of a batch, sitemap expansion included.
+BATCH_MAX_URLS = int(os.getenv("BATCH_MAX_URLS", "500"))
+BATCH_MAX_CONCURRENT = int(os.getenv("BATCH_MAX_CONCURRENT", "8"))
+
+# Offline bulk analysis (bulk.py)
+# Pages of a local corpus are parsed, cleaned and checked by the rules in
+# BULK_WORKERS processes (0: one per available core), and at most
+# BULK_MAX_CONCURRENT of them are with the agents at the same time.
+BULK_WORKERS = int(os.getenv("BULK_WORKERS", "0"))
+BULK_MAX_CONCURRENT = int(os.getenv("BULK_MAX_CONCURRENT", "8"))
+
+# Analysis jobs
+# Jobs are queued in a SQLite database so they survive restarts and are shared by
+# every worker process. Each process runs JOB_WORKERS workers that poll the queue
+# every JOB_POLL_INTERVAL seconds when it is empty.
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "data/jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+JOB_WEBHOOK_ATTEMPTS = int(os.getenv("JOB_WEBHOOK_ATTEMPTS", "3"))
+JOB_LEASE = float(os.getenv("JOB_LEASE", "120"))
+
+# Analysis history
+# Every analysis result is kept in a SQLite database at HISTORY_PATH ("none"
+# disables it) to answer latest, diff and trend queries. Runs are dropped after
+# HISTORY_RETENTION seconds, a URL keeps at most HISTORY_MAX_RUNS_PER_URL runs,
+# and runs older than HISTORY_COMPACT_AFTER seconds are thinned to one per URL
+# and day, checked by the server every HISTORY_COMPACT_INTERVAL seconds.
+HISTORY_PATH = os.getenv("HISTORY_PATH", "data/history.sqlite3")
+HISTORY_RETENTION = float(os.getenv("HISTORY_RETENTION", str(90 * 24 * 3600)))
+HISTORY_MAX_RUNS_PER_URL = int(os.getenv("HISTORY_MAX_RUNS_PER_URL", "200"))
+HISTORY_COMPACT_AFTER = float(os.getenv("HISTORY_COMPACT_AFTER", str(7 * 24 * 3600)))
+HISTORY_COMPACT_INTERVAL = float(os.getenv("HISTORY_COMPACT_INTERVAL", "3600"))
+
+# Logging
+# Records below WARNING are sampled: the first of each message is logged, then one
+# in every 1 / LOG_SAMPLE_RATE, so a repeated message cannot flood stdout.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
@@ -0,0 +1,43 @@
+from typing import Callable, List, Optional
+import os
+import sqlite3
+import threading
+
+
+class ProcessLocalConnection:
+    """
+    A SQLite connection opened on first use, and opened again in a forked process.
+
+    A SQLite connection must not be used by two processes, which happens when
+    gunicorn forks its workers from a master that imported the app (see
+    gunicorn.conf.py). Each process therefore opens its own connection, the
+    first time it needs one. The connection a child inherits is kept but never
+    used nor closed, since closing it would release the locks of the parent.
+    """
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection]):
+        """
+        Initialize the connection, opened by connect when first used.
+
+        Args:
+            connect: Opens the connection and creates the tables it needs
+        """
+        self._connect = connect
+        self._db: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._inherited: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def get(self) -> sqlite3.Connection:
+        """
+        Returns the connection of the current process, opening it if needed.
+        """
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    if self._db is not None:
+                        self._inherited.append(self._db)
+                    self._db = self._connect()
+                    self._pid = pid
+        return self._db
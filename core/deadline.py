@@ -0,0 +1,155 @@
+from contextvars import ContextVar
+from typing import Callable, List, Optional
+import threading
+import time
+
+
+class AnalysisCancelledError(Exception):
+    """
+    Raised when work is about to start for an analysis that was cancelled.
+    """
+
+
+class Deadline:
+    """
+    The time budget of one request, and whether its result is still wanted.
+
+    A deadline is cancelled when its time is up or when cancel is called, e.g.
+    because the client disconnected. Work is not interrupted: the analysis
+    checks the deadline between stages and before every LLM call, so calls
+    already made run to their end while no new ones are made.
+    """
+
+    def __init__(self, seconds: Optional[float] = None):
+        """
+        Initialize the deadline.
+
+        Args:
+            seconds: Time budget from now, None for none
+        """
+        self.expires_at = time.monotonic() + seconds if seconds else None
+        self.reason: Optional[str] = None
+        self._cancelled = threading.Event()
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def remaining(self) -> Optional[float]:
+        """
+        Returns the seconds left, 0 once cancelled, None when there is no time budget.
+        """
+        if self._cancelled.is_set():
+            return 0.0
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def cancelled(self) -> bool:
+        """
+        Whether the result is no longer wanted, the time budget being spent included.
+        """
+        if not self._cancelled.is_set() and self.expires_at is not None and time.monotonic() >= self.expires_at:
+            self.cancel("deadline")
+        return self._cancelled.is_set()
+
+    def cancel(self, reason: str) -> None:
+        """
+        Cancels the work of the request, calling the on_cancel callbacks the first time.
+
+        Args:
+            reason: Why, "deadline" or "disconnect", reported in metrics and issues
+        """
+        with self._lock:
+            if self._cancelled.is_set():
+                return
+            self.reason = reason
+            self._cancelled.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        """
+        Calls callback, from the thread that cancels, when the deadline is cancelled.
+
+        Running out of time only cancels the deadline once someone checks it,
+        so waiters should also wait no longer than remaining().
+        """
+        with self._lock:
+            if not self._cancelled.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def check(self) -> None:
+        """
+        Raises:
+            AnalysisCancelledError: If the deadline is cancelled
+        """
+        if self.cancelled:
+            raise AnalysisCancelledError(self.describe())
+
+    def sleep(self, seconds: float) -> bool:
+        """
+        Sleeps for seconds, waking up early if the deadline is cancelled.
+
+        Returns:
+            bool: Whether the deadline is cancelled
+        """
+        remaining = self.remaining()
+        self._cancelled.wait(seconds if remaining is None else min(seconds, remaining))
+        return self.cancelled
+
+    def describe(self) -> str:
+        """
+        Returns why the work was cancelled, in words.
+        """
+        if self.reason == "disconnect":
+            return "the client disconnected"
+        return "the analysis ran out of time"
+
+
+# Deadline of the request being handled. Like the stage timings (see
+# core.metrics), it follows the work handed to other threads in a copy of the
+# context.
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("current_deadline", default=None)
+
+
+def start_deadline(seconds: Optional[float] = None) -> Deadline:
+    """
+    Gives the current request a deadline, checked by all the work it runs from now on.
+
+    Args:
+        seconds: Time budget, None for none (the deadline can still be cancelled)
+    """
+    deadline = Deadline(seconds)
+    _current_deadline.set(deadline)
+    return deadline
+
+
+def current_deadline() -> Optional[Deadline]:
+    """
+    Returns the deadline of the current request, None if it has none.
+    """
+    return _current_deadline.get()
+
+
+def check_deadline() -> None:
+    """
+    Raises:
+        AnalysisCancelledError: If the current request's deadline is cancelled
+    """
+    deadline = _current_deadline.get()
+    if deadline is not None:
+        deadline.check()
+
+
+def sleep(seconds: float) -> None:
+    """
+    time.sleep that wakes up early when the current request's deadline is cancelled.
+    """
+    deadline = _current_deadline.get()
+    if deadline is None:
+        time.sleep(seconds)
+    else:
+        deadline.sleep(seconds)
@@ -0,0 +1,350 @@
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from core.config import (
+    HISTORY_PATH, HISTORY_RETENTION, HISTORY_MAX_RUNS_PER_URL, HISTORY_COMPACT_AFTER, HISTORY_COMPACT_INTERVAL
+)
+from core.db import ProcessLocalConnection
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 3600
+
+
+def issue_fingerprint(issue: Dict[str, Any]) -> str:
+    """
+    Returns an identifier of an issue that stays the same from one analysis to the next.
+
+    Issue ids and line numbers change whenever the page or the chunking does,
+    so the fingerprint covers the type, the element and the message only, the
+    message lowercased with its numbers and spacing blurred ("3 images" and
+    "4 images" are the same issue).
+    """
+    message = re.sub(r"\d+", "0", str(issue.get("message") or "").lower())
+    message = " ".join(message.split()).strip(" .")
+    element = " ".join(str(issue.get("element") or "").split())
+    digest = hashlib.sha256(f"{issue.get('type')}\0{element}\0{message}".encode())
+    return digest.hexdigest()[:16]
+
+
+def site_of(url: str) -> str:
+    """
+    Returns the site a URL belongs to, its lowercased host name.
+    """
+    return (urlsplit(url).hostname or "").lower()
+
+
+def _by_severity(counts: Dict[str, Dict[str, int]]) -> Dict[str, int]:
+    """
+    Sums the issue counts of a run by evaluator and severity over the evaluators.
+    """
+    totals: Dict[str, int] = {}
+    for by_severity in counts.values():
+        for severity, count in by_severity.items():
+            totals[severity] = totals.get(severity, 0) + count
+    return totals
+
+
+class HistoryStore:
+    """
+    Every analysis result, kept in SQLite to compare pages over time.
+
+    A run is one AnalyzeResponse for a URL and the hash of the page content it
+    was computed from. The response is stored whole in a table of its own, so
+    scans of the runs stay small; its issues are stored once more, one row per
+    fingerprint (see issue_fingerprint) for diffs, and counted by evaluator
+    and severity on the run for trends, so neither decodes whole results.
+
+    The store stays bounded: runs older than retention are dropped, a URL
+    keeps at most max_runs_per_url runs, and runs older than compact_after are
+    thinned to the last one of each day, which is all the trends read. compact
+    applies this; the server runs it every compact_interval seconds, see
+    compact_periodically.
+    """
+
+    def __init__(self, path: str, retention: float, max_runs_per_url: int, compact_after: float,
+                 compact_interval: float):
+        """
+        Initialize the store.
+
+        Args:
+            path: Path of the SQLite database file, created if missing
+            retention: Seconds a run is kept
+            max_runs_per_url: Number of runs kept per URL, the most recent
+            compact_after: Runs older than this many seconds are thinned to one per URL and day
+            compact_interval: Seconds between two compactions by compact_periodically
+        """
+        self.path = path
+        self.retention = retention
+        self.max_runs_per_url = max_runs_per_url
+        self.compact_after = compact_after
+        self.compact_interval = compact_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = ProcessLocalConnection(self._connect)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        db.row_factory = sqlite3.Row
+        # Must come before the tables are created, lets compact give space back
+        db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA foreign_keys=ON")
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL,
+                site TEXT NOT NULL,
+                content_hash TEXT,
+                created_at REAL NOT NULL,
+                partial INTEGER NOT NULL,
+                cached INTEGER NOT NULL,
+                counts TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS runs_url_created_at ON runs (url, created_at);
+            CREATE INDEX IF NOT EXISTS runs_site_created_at ON runs (site, created_at);
+            CREATE INDEX IF NOT EXISTS runs_content_hash ON runs (content_hash);
+            CREATE INDEX IF NOT EXISTS runs_created_at ON runs (created_at);
+            CREATE TABLE IF NOT EXISTS results (
+                run_id INTEGER PRIMARY KEY REFERENCES runs (id) ON DELETE CASCADE,
+                result TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS issues (
+                run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+                fingerprint TEXT NOT NULL,
+                issue TEXT NOT NULL,
+                PRIMARY KEY (run_id, fingerprint)
+            ) WITHOUT ROWID;
+        """)
+        return db
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        return self._connection.get()
+
+    def record(self, result: Dict[str, Any], content_hash: Optional[str] = None,
+               now: Optional[float] = None) -> int:
+        """
+        Stores an analysis result as a new run of its URL.
+
+        Args:
+            result: The AnalyzeResponse, as JSON
+            content_hash: Hash of the page content analyzed; by default that of
+                the URL's last run, for results of unchanged pages
+            now: Time of the run, the current time by default
+
+        Returns:
+            int: Id of the run
+        """
+        now = time.time() if now is None else now
+        url = str(result["url"])
+        issues = {}
+        for issue in result.get("issues", []):
+            issues.setdefault(issue_fingerprint(issue), issue)
+        # Issues by evaluator and severity, all the trends need
+        counts: Dict[str, Dict[str, int]] = {}
+        for issue in issues.values():
+            by_severity = counts.setdefault(issue["type"], {})
+            by_severity[issue["severity"]] = by_severity.get(issue["severity"], 0) + 1
+
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                if content_hash is None:
+                    row = self._db.execute(
+                        "SELECT content_hash FROM runs WHERE url = ? ORDER BY created_at DESC LIMIT 1", (url,)
+                    ).fetchone()
+                    content_hash = row["content_hash"] if row is not None else None
+                run_id = self._db.execute(
+                    "INSERT INTO runs (url, site, content_hash, created_at, partial, cached, counts) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (url, site_of(url), content_hash, now, int(bool(result.get("partial"))),
+                     int(bool(result.get("cached"))), json.dumps(counts))
+                ).lastrowid
+                self._db.execute("INSERT INTO results (run_id, result) VALUES (?, ?)", (run_id, json.dumps(result)))
+                self._db.executemany(
+                    "INSERT INTO issues (run_id, fingerprint, issue) VALUES (?, ?, ?)",
+                    [(run_id, fingerprint, json.dumps(issue))
+                     for fingerprint, issue in issues.items()]
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return run_id
+
+    @staticmethod
+    def _run(row: sqlite3.Row) -> Dict[str, Any]:
+        return {"id": row["id"], "url": row["url"], "content_hash": row["content_hash"],
+                "created_at": row["created_at"], "partial": bool(row["partial"]), "cached": bool(row["cached"]),
+                "issues": _by_severity(json.loads(row["counts"]))}
+
+    def runs(self, url: str, limit: int = 20, before: Optional[float] = None,
+             complete: bool = False) -> List[Dict[str, Any]]:
+        """
+        Returns the runs of a URL without their result, the most recent first.
+
+        Args:
+            url: URL of the page
+            limit: Number of runs returned at most
+            before: Only runs made at or before this time.time()
+            complete: Leave out the runs the deadline cut short
+        """
+        query = "SELECT id, url, content_hash, created_at, partial, cached, counts FROM runs WHERE url = ?"
+        params: List[Any] = [url]
+        if before is not None:
+            query += " AND created_at <= ?"
+            params.append(before)
+        if complete:
+            query += " AND partial = 0"
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [self._run(row) for row in rows]
+
+    def run(self, run_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Returns a run with its result decoded, or None if it does not exist.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT * FROM runs JOIN results ON results.run_id = runs.id WHERE id = ?",
+                                   (run_id,)).fetchone()
+        if row is None:
+            return None
+        run = self._run(row)
+        run["result"] = json.loads(row["result"])
+        return run
+
+    def latest(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the most recent run of a URL with its result, or None if it was never analyzed.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT id FROM runs WHERE url = ? ORDER BY created_at DESC LIMIT 1",
+                                   (url,)).fetchone()
+        return self.run(row["id"]) if row is not None else None
+
+    def issues(self, run_id: int) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns the issues of a run by fingerprint.
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT fingerprint, issue FROM issues WHERE run_id = ?", (run_id,)).fetchall()
+        return {row["fingerprint"]: json.loads(row["issue"]) for row in rows}
+
+    def trend(self, site: str, since: float, evaluator: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Returns the issues of a site by day and severity.
+
+        A day counts the issues of the last complete run of each URL of the
+        site analyzed that day (UTC), so a page analyzed ten times a day
+        counts once.
+
+        Args:
+            site: Host name, see site_of
+            since: Only days from this time.time() on
+            evaluator: Only the issues of this evaluator (issue type)
+
+        Returns:
+            List[Dict[str, Any]]: For each day with runs, in order: the day
+                number since the epoch, the number of URLs and the number of
+                issues of each severity
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT day, counts FROM ("
+                f"SELECT url, counts, CAST(created_at / {DAY} AS INTEGER) AS day, ROW_NUMBER() OVER ("
+                f"PARTITION BY url, CAST(created_at / {DAY} AS INTEGER) ORDER BY created_at DESC) AS position "
+                "FROM runs WHERE site = ? AND created_at >= ? AND partial = 0) "
+                "WHERE position = 1 ORDER BY day",
+                (site, since)
+            ).fetchall()
+        days: Dict[int, Dict[str, Any]] = {}
+        for day, counts in rows:
+            point = days.get(day)
+            if point is None:
+                point = days[day] = {"day": day, "urls": 0, "issues": {}}
+            point["urls"] += 1
+            issues = point["issues"]
+            for name, by_severity in json.loads(counts).items():
+                if evaluator and name != evaluator:
+                    continue
+                for severity, count in by_severity.items():
+                    issues[severity] = issues.get(severity, 0) + count
+        return list(days.values())
+
+    def compact(self, now: Optional[float] = None) -> int:
+        """
+        Applies the retention policy, see the class docstring.
+
+        Returns:
+            int: Number of runs deleted
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                deleted = self._db.execute("DELETE FROM runs WHERE created_at < ?", (now - self.retention,)).rowcount
+                deleted += self._db.execute(
+                    "DELETE FROM runs WHERE id IN (SELECT id FROM ("
+                    "SELECT id, ROW_NUMBER() OVER (PARTITION BY url ORDER BY created_at DESC) AS position "
+                    "FROM runs) WHERE position > ?)",
+                    (self.max_runs_per_url,)
+                ).rowcount
+                deleted += self._db.execute(
+                    "DELETE FROM runs WHERE id IN (SELECT id FROM ("
+                    f"SELECT id, ROW_NUMBER() OVER (PARTITION BY url, CAST(created_at / {DAY} AS INTEGER) "
+                    "ORDER BY created_at DESC) AS position FROM runs WHERE created_at < ?) WHERE position > 1)",
+                    (now - self.compact_after,)
+                ).rowcount
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            if deleted:
+                # Gives the freed pages back, to the file once the log is checkpointed
+                # Run as a script: executed as a statement it frees one page only
+                self._db.executescript("PRAGMA incremental_vacuum;")
+                self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return deleted
+
+
+async def compact_periodically(store: HistoryStore) -> None:
+    """
+    Compacts a store every compact_interval seconds, off the event loop, until cancelled.
+
+    Failures are logged, the next compaction tries again.
+    """
+    while True:
+        try:
+            deleted = await asyncio.to_thread(store.compact)
+            if deleted:
+                logger.info("Compacted the analysis history: %d runs deleted", deleted)
+        except sqlite3.Error as e:
+            logger.warning("Could not compact the analysis history: %s", e)
+        await asyncio.sleep(store.compact_interval)
+
+
+def create_history_store(path: str = HISTORY_PATH) -> Optional[HistoryStore]:
+    """
+    Creates the history store, None when path is "none" and history is disabled.
+    """
+    if path == "none":
+        return None
+    return HistoryStore(path, HISTORY_RETENTION, HISTORY_MAX_RUNS_PER_URL, HISTORY_COMPACT_AFTER,
+                        HISTORY_COMPACT_INTERVAL)
+
+
+history_store = create_history_store()
@@ -0,0 +1,237 @@
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from core.config import JOBS_DB_PATH, JOB_LEASE
+from core.db import ProcessLocalConnection
+
+# Job statuses
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobStore:
+    """
+    Durable queue of analysis jobs stored in SQLite.
+
+    Jobs move from queued to running when a worker claims them and end as done or
+    failed. Claims happen in an immediate transaction, so several worker processes
+    can share one database without running a job twice. A running job holds a
+    lease that its worker renews with heartbeat(); when the lease runs out the
+    job is handed to another worker. The issues a running job finds are
+    appended as rows of their own, so adding some never rewrites the others.
+    """
+
+    def __init__(self, path: str, lease: float):
+        """
+        Initialize the store.
+
+        Args:
+            path: Path of the SQLite database file, created if missing
+            lease: Seconds a running job stays claimed without a heartbeat
+        """
+        self.path = path
+        self.lease = lease
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = ProcessLocalConnection(self._connect)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                status TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status_updated_at ON jobs (status, updated_at);
+            CREATE INDEX IF NOT EXISTS jobs_created_at ON jobs (created_at);
+            CREATE INDEX IF NOT EXISTS jobs_url_status ON jobs (url, status);
+            CREATE TABLE IF NOT EXISTS job_issues (
+                id INTEGER PRIMARY KEY,
+                job_id TEXT NOT NULL,
+                issue TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS job_issues_job_id ON job_issues (job_id, id);
+            CREATE TABLE IF NOT EXISTS job_webhooks (
+                job_id TEXT NOT NULL,
+                url TEXT NOT NULL,
+                PRIMARY KEY (job_id, url)
+            );
+        """)
+        return db
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        return self._connection.get()
+
+    def submit(self, url: str, webhook: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """
+        Queues an analysis of url, or joins the job already queued or running for it.
+
+        Args:
+            url: URL of the web page to analyze
+            webhook: URL notified when the job finishes
+
+        Returns:
+            Tuple[Dict[str, Any], bool]: The job and whether it was newly created
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id FROM jobs WHERE url = ? AND status IN (?, ?) ORDER BY created_at LIMIT 1",
+                    (url, QUEUED, RUNNING)
+                ).fetchone()
+                created = row is None
+                job_id = uuid.uuid4().hex if created else row["id"]
+                if created:
+                    self._db.execute(
+                        "INSERT INTO jobs (id, url, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                        (job_id, url, QUEUED, now, now)
+                    )
+                if webhook:
+                    self._db.execute("INSERT OR IGNORE INTO job_webhooks (job_id, url) VALUES (?, ?)",
+                                     (job_id, webhook))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return self.get(job_id), created
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """
+        Marks the oldest claimable job as running and returns it.
+
+        Claimable jobs are queued jobs and running jobs whose lease expired, which
+        happens when the process running them died.
+
+        Returns:
+            Optional[Dict[str, Any]]: The claimed job, or None if there is none
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id FROM jobs WHERE status = ? OR (status = ? AND updated_at < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (QUEUED, RUNNING, now - self.lease)
+                ).fetchone()
+                if row is not None:
+                    # Partial issues of an interrupted run are dropped, the job restarts
+                    self._db.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?",
+                                     (RUNNING, now, row["id"]))
+                    self._db.execute("DELETE FROM job_issues WHERE job_id = ?", (row["id"],))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return self.get(row["id"]) if row is not None else None
+
+    def add_issues(self, job_id: str, issues: List[Dict]) -> None:
+        """
+        Appends partial issues to a running job.
+        """
+        if not issues:
+            return
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                if self._db.execute("UPDATE jobs SET updated_at = ? WHERE id = ?",
+                                    (time.time(), job_id)).rowcount:
+                    self._db.executemany("INSERT INTO job_issues (job_id, issue) VALUES (?, ?)",
+                                         [(job_id, json.dumps(issue)) for issue in issues])
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def heartbeat(self, job_id: str) -> None:
+        """
+        Renews the lease of a running job.
+        """
+        with self._lock:
+            self._db.execute("UPDATE jobs SET updated_at = ? WHERE id = ? AND status = ?",
+                             (time.time(), job_id, RUNNING))
+
+    def requeue(self, job_id: str) -> None:
+        """
+        Puts a running job back in the queue, dropping its partial issues.
+        """
+        self._finish(job_id, "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?",
+                     (QUEUED, time.time(), job_id))
+
+    def complete(self, job_id: str, result: Dict[str, Any]) -> None:
+        """
+        Marks a job as done with its final AnalyzeResponse, whose issues replace the partial ones.
+        """
+        self._finish(job_id, "UPDATE jobs SET status = ?, result = ?, updated_at = ? WHERE id = ?",
+                     (DONE, json.dumps(result), time.time(), job_id))
+
+    def fail(self, job_id: str, error: str) -> None:
+        """
+        Marks a job as failed, keeping the issues it found before failing.
+        """
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                             (FAILED, error, time.time(), job_id))
+
+    def _finish(self, job_id: str, update: str, params: Tuple) -> None:
+        """
+        Updates a job and drops its partial issues, in one transaction.
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(update, params)
+                self._db.execute("DELETE FROM job_issues WHERE job_id = ?", (job_id,))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns a job with its issues and result decoded, or None if it does not exist.
+
+        The issues are those of the result once the job is done, those found
+        so far until then.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            issues = [] if row is None or row["result"] else self._db.execute(
+                "SELECT issue FROM job_issues WHERE job_id = ? ORDER BY id", (job_id,)
+            ).fetchall()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["issues"] = job["result"].get("issues", []) if job["result"] else [json.loads(issue) for issue, in issues]
+        return job
+
+    def webhooks(self, job_id: str) -> List[str]:
+        """
+        Returns the URLs to notify when a job finishes.
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT url FROM job_webhooks WHERE job_id = ?", (job_id,)).fetchall()
+        return [row["url"] for row in rows]
+
+
+job_store = JobStore(JOBS_DB_PATH, JOB_LEASE)
@@ -1,12 +1,273 @@
-from crewai import LLM
+from concurrent.futures import Future
+from crewai import LLM, BaseLLM
+from crewai.llms.base_llm import call_stop_override
 from dotenv import load_dotenv
+from pydantic import BaseModel, PrivateAttr
+from typing import Any, Dict, List, Optional
+import asyncio
+import hashlib
+import json
 import os
+import re
+import threading
+import time
+
+from core.cache import ResultCache, create_result_cache
+from core.config import (
+    LLM_BASE_URL, LLM_CACHE_BACKEND, LLM_CACHE_TTL, LLM_CACHE_MAX_ENTRIES, LLM_CHEAP_MODEL, LLM_EVALUATOR_MODELS,
+    LLM_FALLBACK_MODELS, LLM_RATE_LIMITS, OPENAI_MODEL
+)
+from core.deadline import AnalysisCancelledError, current_deadline
+from core.router import LLMRouter, without_crewai_retries
+from crew.output import is_valid_report
+from utils.chunk_html import estimate_tokens
 
 load_dotenv()
 
-model_name = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+model_name = OPENAI_MODEL
+
+WHITESPACE = re.compile(r"\s+")
+
+# Answer of a coalesced call whose caller gave up before the provider answered
+LEADER_GONE = object()
+
+
+class CachingLLM(BaseLLM):
+    """
+    Wraps an LLM to answer repeated prompts from a cache.
+
+    Calls are keyed on the model, the sampling parameters, the stop words and
+    the prompt with its whitespace normalized. Concurrent identical calls are
+    coalesced: the first one reaches the provider and the others wait for its
+    answer, no longer than their own deadline. Its failures are theirs, but not
+    its cancellation: one of them then makes the call instead. Structured
+    answers are stored as JSON and validated again against the requested model
+    on a hit. Calls with tools are always passed through, and failures are
+    never cached.
+    """
+
+    llm: Any
+    cache: Any = None
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _in_flight: Dict[str, Future] = PrivateAttr(default_factory=dict)
+    _stats: Dict[str, float] = PrivateAttr(default_factory=lambda: {
+        "calls": 0, "hits": 0, "coalesced": 0, "tokens_saved": 0, "latency_saved": 0.0
+    })
+
+    def __init__(self, llm: BaseLLM, cache: Optional[ResultCache] = None, **kwargs: Any):
+        """
+        Initialize the wrapper.
+
+        Args:
+            llm: The LLM that answers cache misses
+            cache: Where answers are stored, see core.cache.create_result_cache.
+                Without one, only concurrent identical calls are coalesced.
+        """
+        super().__init__(llm=llm, cache=cache, model=llm.model, temperature=llm.temperature,
+                         stop=list(llm.stop or []), **kwargs)
+
+    def cache_key(self, messages: Any, response_model: Any = None) -> str:
+        """
+        Returns the cache key of a call.
+
+        Args:
+            messages: Prompt as a string or a list of role/content messages
+            response_model: Structured output model requested, if any
+
+        Returns:
+            str: Hex SHA-256 digest
+        """
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        prompt = []
+        for message in messages:
+            content = message.get("content")
+            if isinstance(content, str):
+                content = WHITESPACE.sub(" ", content).strip()
+            prompt.append([message.get("role"), content])
+        inner = self.llm
+        params = {
+            "model": inner.model,
+            "temperature": inner.temperature,
+            "top_p": getattr(inner, "top_p", None),
+            "max_tokens": getattr(inner, "max_tokens", None),
+            "seed": getattr(inner, "seed", None),
+            "stop": sorted(self.stop_sequences),
+            "response_model": getattr(response_model, "__name__", None),
+        }
+        payload = json.dumps([params, prompt], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    @without_crewai_retries
+    def call(self, messages: Any, tools: Optional[List[Dict]] = None, callbacks: Optional[List[Any]] = None,
+             available_functions: Optional[Dict[str, Any]] = None, from_task: Any = None,
+             from_agent: Any = None, response_model: Any = None) -> Any:
+        def forward() -> Any:
+            # The stop words crewai sets for this call apply to the wrapped LLM
+            with call_stop_override(self.llm, self.stop_sequences):
+                return self.llm.call(messages, tools=tools, callbacks=callbacks,
+                                     available_functions=available_functions, from_task=from_task,
+                                     from_agent=from_agent, response_model=response_model)
+
+        if tools or available_functions:
+            return forward()
+
+        key = self.cache_key(messages, response_model)
+        with self._lock:
+            self._stats["calls"] += 1
+        while True:
+            # The cache is read outside the lock, which only guards the calls in flight
+            cached = self._lookup(key, response_model)
+            if cached is not None:
+                return cached
+            with self._lock:
+                leader = key not in self._in_flight
+                if leader:
+                    self._in_flight[key] = Future()
+                future = self._in_flight[key]
+            if leader:
+                break
+
+            # The same prompt is already on its way to the provider
+            response = self._wait(future)
+            if response is LEADER_GONE:
+                # Its caller gave up: one of the waiters makes the call instead
+                continue
+            with self._lock:
+                self._stats["coalesced"] += 1
+                self._stats["tokens_saved"] += self._estimate_tokens(messages, response)
+            return response
+
+        start = time.monotonic()
+        try:
+            response = forward()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            if isinstance(e, Exception) and not isinstance(e, AnalysisCancelledError):
+                future.set_exception(e)
+            else:
+                # The leader's request was cancelled, not the call of the waiters
+                future.set_result(LEADER_GONE)
+            raise
+        future.set_result(response)
+
+        structured = isinstance(response, BaseModel)
+        try:
+            if self.cache is not None and (structured or (isinstance(response, str) and response.strip())):
+                self.cache.set(key, {
+                    "response": response.model_dump_json() if structured else response,
+                    "structured": structured,
+                    "tokens": self._estimate_tokens(messages, response),
+                    "latency": time.monotonic() - start,
+                })
+        finally:
+            # Stored first, so that a call missing the cache until now finds the answer in flight
+            with self._lock:
+                del self._in_flight[key]
+        return response
+
+    def _lookup(self, key: str, response_model: Any = None) -> Any:
+        """
+        Returns the cached answer of a call, None on a miss.
+        """
+        cached = self.cache.get(key) if self.cache is not None else None
+        if cached is None:
+            return None
+        with self._lock:
+            self._stats["hits"] += 1
+            self._stats["tokens_saved"] += cached["tokens"]
+            self._stats["latency_saved"] += cached["latency"]
+        if cached.get("structured") and response_model is not None:
+            return response_model.model_validate_json(cached["response"])
+        return cached["response"]
+
+    def _wait(self, future: Future) -> Any:
+        """
+        Waits for the answer of the call another thread is making.
+
+        Raises:
+            AnalysisCancelledError: If the deadline of the current request is
+                cancelled first
+        """
+        deadline = current_deadline()
+        if deadline is not None:
+            woken = threading.Event()
+            future.add_done_callback(lambda _: woken.set())
+            deadline.on_cancel(woken.set)
+            woken.wait(deadline.remaining())
+            if not future.done():
+                deadline.check()
+        return future.result()
+
+    def _estimate_tokens(self, messages: Any, response: Any) -> int:
+        """
+        Returns a cheap estimate of the tokens of a call, prompt and answer.
+
+        Either may be None to estimate the tokens of the other one only.
+        """
+        prompt = estimate_tokens(json.dumps(messages, default=str)) if messages is not None else 0
+        answer = estimate_tokens(str(response)) if response is not None else 0
+        return prompt + answer
+
+    @without_crewai_retries
+    async def acall(self, *args: Any, **kwargs: Any) -> Any:
+        return await asyncio.to_thread(self.call, *args, **kwargs)
+
+    def supports_function_calling(self) -> bool:
+        return self.llm.supports_function_calling()
+
+    def supports_stop_words(self) -> bool:
+        return self.llm.supports_stop_words()
+
+    def get_context_window_size(self) -> int:
+        return self.llm.get_context_window_size()
+
+    def get_token_usage_summary(self) -> Any:
+        return self.llm.get_token_usage_summary()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the hit rate of the cache and the tokens and seconds it saved.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats["hit_rate"] = (stats["hits"] + stats["coalesced"]) / stats["calls"] if stats["calls"] else 0.0
+        if self.cache is not None:
+            stats["backend"] = self.cache.backend
+        return stats
+
+
+# Answers of the LLM, keyed by CachingLLM.cache_key
+llm_cache = create_result_cache(backend=LLM_CACHE_BACKEND, table="llm_responses", ttl=LLM_CACHE_TTL,
+                                max_entries=LLM_CACHE_MAX_ENTRIES)
+
+
+def create_model(name: str) -> LLM:
+    """
+    Returns the LLM of an OpenAI model. Retries are left to LLMRouter.
+    """
+    return LLM(
+        model="openai/"+name,
+        temperature=0.2,
+        max_retries=0,
+        base_url=LLM_BASE_URL or None,
+    )
+
+
+# Every model the evaluators may be routed to, see core.router
+router_models = [model_name, LLM_CHEAP_MODEL, *LLM_EVALUATOR_MODELS.values(), *LLM_FALLBACK_MODELS]
 
-llm_gpt = LLM(
-    model="openai/"+model_name, 
-    temperature=0.2,
-)
\ No newline at end of file
+llm_gpt = CachingLLM(
+    LLMRouter(
+        {name: create_model(name) for name in dict.fromkeys(router_models) if name},
+        model_name,
+        rate_limits=LLM_RATE_LIMITS,
+        evaluator_models=LLM_EVALUATOR_MODELS,
+        cheap_model=LLM_CHEAP_MODEL or None,
+        fallback_models=LLM_FALLBACK_MODELS,
+        is_valid=is_valid_report,
+    ),
+    cache=llm_cache,
+)
@@ -0,0 +1,61 @@
+from typing import Dict, Optional, Tuple
+import logging
+import threading
+
+from core.config import LOG_LEVEL, LOG_SAMPLE_RATE
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets through every warning and error but only a sample of the other records.
+
+    Records are sampled per message template: the first record of a message is
+    always logged, then one in every 1 / rate, so a message repeated on every
+    request costs one write in N instead of one per request.
+    """
+
+    def __init__(self, rate: float = LOG_SAMPLE_RATE, min_level: int = logging.WARNING):
+        """
+        Initialize the filter.
+
+        Args:
+            rate: Fraction of the records below min_level to log, between 0 and 1
+            min_level: Records at this level or above are never dropped
+        """
+        super().__init__()
+        self.every = max(1, round(1 / rate)) if rate > 0 else 0
+        self.min_level = min_level
+        self._counts: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= self.min_level:
+            return True
+        if not self.every:
+            return False
+        key = (record.name, str(record.msg))
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        return count % self.every == 0
+
+
+def configure_logging(level: Optional[str] = None, sample_rate: Optional[float] = None) -> None:
+    """
+    Sends the application's logs to stderr, leveled and sampled.
+
+    Args:
+        level: Minimum level logged (defaults to LOG_LEVEL)
+        sample_rate: See SamplingFilter (defaults to LOG_SAMPLE_RATE)
+    """
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    handler.addFilter(SamplingFilter(LOG_SAMPLE_RATE if sample_rate is None else sample_rate))
+    root = logging.getLogger()
+    for existing in [h for h in root.handlers if getattr(h, "_qa_handler", False)]:
+        root.removeHandler(existing)
+    handler._qa_handler = True
+    root.addHandler(handler)
+    root.setLevel(level or LOG_LEVEL)
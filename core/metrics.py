@@ -0,0 +1,492 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import asyncio
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+from core.config import LLM_PRICES, METRICS_DIR, METRICS_WRITE_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Seconds; the stages range from sub-millisecond rule runs to minute-long LLM calls
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """
+    Base class of the metrics, a family of samples told apart by label values.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        """
+        Initialize the metric.
+
+        Args:
+            name: Metric name in the Prometheus exposition format
+            documentation: Help text of the metric
+            labelnames: Names of the labels every sample is recorded with
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes the labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def values(self) -> List[Tuple[LabelValues, Any]]:
+        """
+        Returns the label values and the value of every sample.
+        """
+        return []
+
+    @staticmethod
+    def merge(first: Any, second: Any) -> Any:
+        """
+        Returns the sum of two values of one sample, recorded by different processes.
+        """
+        return first + second
+
+    def render(self, values: Optional[List[Tuple[LabelValues, Any]]] = None) -> List[str]:
+        """
+        Returns the lines of the metric in the Prometheus text format.
+
+        Args:
+            values: Samples to render instead of those of the metric, see values
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples(self.values() if values is None else values))
+        return lines
+
+    def _samples(self, values: List[Tuple[LabelValues, Any]]) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in values]
+
+
+class Counter(Metric):
+    """
+    A value that only goes up, such as a number of calls or tokens.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def values(self) -> List[Tuple[LabelValues, float]]:
+        with self._lock:
+            return sorted(self._values.items())
+
+
+class Histogram(Metric):
+    """
+    The distribution of observed values, such as the latency of a stage.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Per label values: count of each bucket (not cumulative), sum, count
+        self._values: Dict[LabelValues, List[Any]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def values(self) -> List[Tuple[LabelValues, List[Any]]]:
+        with self._lock:
+            return sorted((key, [list(entry[0]), entry[1], entry[2]]) for key, entry in self._values.items())
+
+    @staticmethod
+    def merge(first: List[Any], second: List[Any]) -> List[Any]:
+        return [[a + b for a, b in zip(first[0], second[0])], first[1] + second[1], first[2] + second[2]]
+
+    def _samples(self, values: List[Tuple[LabelValues, List[Any]]]) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class CallbackMetric(Metric):
+    """
+    A counter or gauge read from elsewhere (e.g. the stats of a cache) when rendered.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 collect: Callable[[], Iterable[Tuple[LabelValues, float]]], kind: str = "gauge"):
+        """
+        Initialize the metric.
+
+        Args:
+            collect: Returns (label values, value) of every sample
+            kind: "counter" or "gauge"
+        """
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.collect = collect
+
+    def values(self) -> List[Tuple[LabelValues, float]]:
+        return list(self.collect())
+
+
+# A snapshot of a registry: the samples of each metric as [label values, value], by metric name
+Snapshot = Dict[str, List[List[Any]]]
+
+
+class MetricsRegistry:
+    """
+    The metrics of the process, rendered by the /metrics endpoint.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        """
+        Adds a metric, replacing any earlier metric of the same name.
+        """
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name: str, documentation: str, labelnames: Sequence[str],
+                 collect: Callable[[], Iterable[Tuple[LabelValues, float]]],
+                 kind: str = "gauge") -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, labelnames, collect, kind))
+
+    def snapshot(self) -> Snapshot:
+        """
+        Returns the samples of every metric, as JSON.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: [[list(key), value] for key, value in metric.values()] for metric in metrics}
+
+    def render(self, snapshots: Optional[List[Tuple[Snapshot, bool]]] = None) -> str:
+        """
+        Returns every metric in the Prometheus text exposition format (version 0.0.4).
+
+        Args:
+            snapshots: Snapshots of the registries of several processes, each
+                with whether its process is still running, to render summed
+                instead of this registry's samples. The gauges of processes
+                that exited are left out; their counters and histograms still
+                count, so the sums never go backwards.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            if snapshots is None:
+                lines.extend(metric.render())
+                continue
+            values: Dict[LabelValues, Any] = {}
+            for snapshot, running in snapshots:
+                if not running and metric.kind == "gauge":
+                    continue
+                for key, value in snapshot.get(metric.name, []):
+                    key = tuple(key)
+                    values[key] = metric.merge(values[key], value) if key in values else value
+            lines.extend(metric.render(sorted(values.items())))
+        return "\n".join(lines) + "\n"
+
+
+def _running(pid: int) -> bool:
+    """
+    Returns whether a process exists.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedMetrics:
+    """
+    The metrics of every process serving the app, such as the gunicorn workers.
+
+    Each process has its own registry, and a scrape reaches whichever process
+    accepts it. So every process writes a snapshot of its registry to a file
+    of its own in a shared directory, every interval seconds and whenever it
+    renders, and renders the sum of the snapshots of all the processes.
+    """
+
+    def __init__(self, registry: MetricsRegistry, directory: str, interval: float):
+        """
+        Initialize the shared metrics.
+
+        Args:
+            registry: The registry of this process
+            directory: Directory of the snapshots, created if missing
+            interval: Seconds between two snapshots of this process, see write_periodically
+        """
+        self.registry = registry
+        self.directory = directory
+        self.interval = interval
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self) -> None:
+        """
+        Writes the snapshot of this process.
+        """
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.registry.snapshot(), f)
+        os.replace(path + ".tmp", path)
+
+    def read(self) -> List[Tuple[Snapshot, bool]]:
+        """
+        Returns the last snapshot of every process, with whether the process is still running.
+        """
+        snapshots = []
+        for name in os.listdir(self.directory):
+            pid, extension = os.path.splitext(name)
+            if extension != ".json" or not pid.isdigit():
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    snapshots.append((json.load(f), _running(int(pid))))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def render(self) -> str:
+        """
+        Returns the metrics of all the processes, summed, see MetricsRegistry.render.
+        """
+        self.write()
+        return self.registry.render(self.read())
+
+    def clear(self) -> None:
+        """
+        Removes the snapshots, for a server starting afresh.
+        """
+        for name in os.listdir(self.directory):
+            if name.endswith((".json", ".json.tmp")):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    async def write_periodically(self) -> None:
+        """
+        Writes the snapshot of this process every interval seconds, off the event
+        loop, until cancelled. Failures are logged, the next write tries again.
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.write)
+            except OSError as e:
+                logger.warning("Could not write the metrics to %s: %s", self.directory, e)
+
+
+class StageTimings:
+    """
+    Seconds spent in each stage of one request, summed over the threads working on it.
+    """
+
+    def __init__(self):
+        self._timings: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self._timings[stage] = self._timings.get(stage, 0.0) + seconds
+
+    def as_dict(self) -> Dict[str, float]:
+        with self._lock:
+            return {stage: round(seconds, 6) for stage, seconds in self._timings.items()}
+
+
+# Timings of the request being handled. Work handed to other threads carries it
+# along by running in a copy of the context (see core.concurrency).
+_current_timings: ContextVar[Optional[StageTimings]] = ContextVar("current_timings", default=None)
+
+
+def collect_timings() -> StageTimings:
+    """
+    Starts collecting the stage timings of the current request.
+
+    Returns:
+        StageTimings: Filled by every span run from this context from now on
+    """
+    timings = StageTimings()
+    _current_timings.set(timings)
+    return timings
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """
+    Records time spent in a stage, for the metrics and the current request.
+    """
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """
+    Times the enclosed block as one run of a stage, see record_stage.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def llm_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """
+    Returns the estimated cost in USD of an LLM call, 0 for models without a price.
+
+    Args:
+        model: Model name, with or without a provider prefix ("openai/gpt-4o")
+        prompt_tokens: Tokens sent to the model
+        completion_tokens: Tokens returned by the model
+    """
+    prices = LLM_PRICES.get(model.split("/")[-1])
+    if prices is None:
+        return 0.0
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+
+def record_llm_call(evaluator: str, model: str, seconds: float, prompt_tokens: int,
+                    completion_tokens: int) -> None:
+    """
+    Records one call that reached the LLM provider.
+
+    Args:
+        evaluator: Name of the evaluator the call was made for, "unknown" if none
+        model: Model that answered, see llm_cost
+        seconds: Latency of the call
+        prompt_tokens: Tokens sent to the model
+        completion_tokens: Tokens returned by the model
+    """
+    LLM_SECONDS.observe(seconds, evaluator=evaluator, model=model)
+    LLM_TOKENS.inc(prompt_tokens, evaluator=evaluator, model=model, kind="prompt")
+    LLM_TOKENS.inc(completion_tokens, evaluator=evaluator, model=model, kind="completion")
+    LLM_COST.inc(llm_cost(model, prompt_tokens, completion_tokens), evaluator=evaluator, model=model)
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(f"llm.{evaluator}", seconds)
+
+
+def record_cancelled_call(evaluator: str, prompt_tokens: int, reason: str) -> None:
+    """
+    Records an LLM call not made because its analysis was cancelled.
+
+    Args:
+        evaluator: Name of the evaluator the call was for, "unknown" if none
+        prompt_tokens: Estimated tokens the call would have sent
+        reason: Why the analysis was cancelled, see core.deadline.Deadline.cancel
+    """
+    LLM_CANCELLED_CALLS.inc(evaluator=evaluator, reason=reason)
+    LLM_CANCELLED_TOKENS.inc(prompt_tokens, evaluator=evaluator, reason=reason)
+
+
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram(
+    "qa_stage_seconds", "Time spent in each stage of an analysis", ["stage"])
+LLM_SECONDS = metrics.histogram(
+    "qa_llm_call_seconds", "Latency of the calls that reached the LLM provider", ["evaluator", "model"])
+LLM_TOKENS = metrics.counter(
+    "qa_llm_tokens_total", "Estimated tokens sent to and returned by the LLM provider",
+    ["evaluator", "model", "kind"])
+LLM_COST = metrics.counter(
+    "qa_llm_cost_usd_total", "Estimated cost of the LLM calls in USD", ["evaluator", "model"])
+LLM_RETRIES = metrics.counter(
+    "qa_llm_retries_total", "LLM calls retried after a transient failure, by error", ["model", "error"])
+LLM_FAILOVERS = metrics.counter(
+    "qa_llm_failovers_total", "LLM calls moved to a fallback model, by the model that failed", ["model"])
+LLM_ESCALATIONS = metrics.counter(
+    "qa_llm_escalations_total", "Answers of a cheap model rejected and asked again of a stronger one",
+    ["evaluator", "model"])
+LLM_RATE_LIMIT_WAIT = metrics.histogram(
+    "qa_llm_rate_limit_wait_seconds", "Time LLM calls waited for the rate limit of their model", ["model"])
+LLM_CANCELLED_CALLS = metrics.counter(
+    "qa_llm_cancelled_calls_total", "LLM calls not made because the analysis was cancelled, by reason",
+    ["evaluator", "reason"])
+LLM_CANCELLED_TOKENS = metrics.counter(
+    "qa_llm_cancelled_tokens_total", "Estimated prompt tokens of the LLM calls not made because the analysis "
+    "was cancelled", ["evaluator", "reason"])
+PREPROCESS_PAGES = metrics.counter(
+    "qa_preprocess_pages_total", "Pages prepared inline or in the preprocessing process pool", ["path"])
+PARSE_FAILURES = metrics.counter(
+    "qa_parse_failures_total",
+    "Evaluator outputs that did not parse, by what was done about it (repaired, recovered, failed)",
+    ["evaluator", "outcome"])
+
+# The metrics of every process, when the server runs several, see SharedMetrics
+shared_metrics = SharedMetrics(metrics, METRICS_DIR, METRICS_WRITE_INTERVAL) if METRICS_DIR else None
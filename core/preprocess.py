@@ -0,0 +1,138 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Sequence, Tuple
+import asyncio
+import multiprocessing
+import os
+import time
+
+from core.config import PREPROCESS_INLINE_MAX_BYTES, PREPROCESS_WORKERS
+from core.metrics import PREPROCESS_PAGES, collect_timings, record_stage
+from utils.prepare_page import PageSnapshot, prepare_detached, prepare_page
+
+
+def _prepare_in_worker(html_content: str, token_budget: int,
+                       views: Sequence[str]) -> Tuple[PageSnapshot, float, Dict[str, float]]:
+    """
+    Prepares a page in a worker process.
+
+    Returns:
+        Tuple[PageSnapshot, float, Dict[str, float]]: The page, see prepare_detached,
+            the time.time() at which the worker picked it up, and the seconds
+            spent in each stage, which the parent records since the metrics of
+            the worker are never read
+    """
+    started = time.time()
+    timings = collect_timings()
+    page = prepare_detached(html_content, token_budget, views)
+    return page, started, timings.as_dict()
+
+
+class PreprocessPool:
+    """
+    Prepares fetched pages (parse, rules, chunking, features) off the event loop.
+
+    Parsing costs about a millisecond and a half per kilobyte of HTML, so a
+    large page prepared on the event loop would stall every other request of
+    the worker. Pages larger than inline_max_bytes go to a pool of processes
+    started once and kept for the life of the app; the HTML goes in and the
+    snapshot comes back with its views and features computed but without its
+    parsed document, which is what is costly to pickle. Smaller pages are
+    prepared inline, where they cost less than the round trip to a process.
+    """
+
+    def __init__(self, workers: int, inline_max_bytes: int):
+        """
+        Initialize the pool, whose processes start on first use or with start.
+
+        Args:
+            workers: Number of worker processes, 0 to prepare every page inline
+            inline_max_bytes: Pages up to this size are prepared inline
+        """
+        self.workers = max(0, workers)
+        self.inline_max_bytes = inline_max_bytes
+        # Pages sent to the pool and not back yet
+        self.pending = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def running(self) -> int:
+        """
+        Pages being prepared by a worker process.
+        """
+        return min(self.pending, self.workers)
+
+    @property
+    def queued(self) -> int:
+        """
+        Pages waiting for a free worker process.
+        """
+        return max(0, self.pending - self.workers)
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawned rather than forked: the parent runs threads (analyses,
+            # the fetcher) whose locks a forked child could inherit held
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def start(self) -> None:
+        """
+        Starts the worker processes now rather than on the first large page.
+        """
+        if self.workers:
+            pool = self._pool()
+            for _ in range(self.workers):
+                pool.submit(os.getpid)
+
+    async def prepare(self, html_content: str, token_budget: int, views: Sequence[str]) -> PageSnapshot:
+        """
+        Prepares a page, inline or in a worker process depending on its size.
+
+        Args:
+            html_content: Raw HTML of the page
+            token_budget: Maximum number of tokens per chunk
+            views: Names of the views the evaluators will read, computed in the
+                worker since the snapshot comes back without its parsed document
+
+        Returns:
+            PageSnapshot: The page, see utils.prepare_page.prepare_page
+
+        Raises:
+            BrokenProcessPool: If a worker died while preparing the page; the
+                pool is replaced for the next pages
+        """
+        if not self.workers or len(html_content) <= self.inline_max_bytes:
+            PREPROCESS_PAGES.inc(path="inline")
+            return prepare_page(html_content, token_budget)
+
+        PREPROCESS_PAGES.inc(path="pool")
+        pool = self._pool()
+        submitted = time.time()
+        self.pending += 1
+        try:
+            page, started, timings = await asyncio.wrap_future(
+                pool.submit(_prepare_in_worker, html_content, token_budget, list(views)))
+        except BrokenProcessPool:
+            if self._executor is pool:
+                self._executor = None
+                pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        finally:
+            self.pending -= 1
+        record_stage("preprocess_queue", max(0.0, started - submitted))
+        for stage, seconds in timings.items():
+            record_stage(stage, seconds)
+        return page
+
+    def shutdown(self) -> None:
+        """
+        Stops the worker processes, dropping the pages still queued.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+preprocess_pool = PreprocessPool(workers=PREPROCESS_WORKERS, inline_max_bytes=PREPROCESS_INLINE_MAX_BYTES)
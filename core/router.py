@@ -0,0 +1,344 @@
+from crewai import BaseLLM
+from crewai.llms.base_llm import call_stop_override
+from pydantic import PrivateAttr, ValidationError
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import asyncio
+import functools
+import json
+import random
+import threading
+import time
+
+from core.config import (
+    LLM_CHEAP_MAX_TOKENS, LLM_RATE_LIMIT_TIMEOUT, LLM_RETRIES, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY
+)
+from core.deadline import AnalysisCancelledError, check_deadline, current_deadline, sleep
+from core.metrics import (
+    LLM_ESCALATIONS, LLM_FAILOVERS, LLM_RATE_LIMIT_WAIT, LLM_RETRIES as RETRIES, record_cancelled_call, record_llm_call
+)
+from utils.chunk_html import estimate_tokens
+
+# Tokens reserved for the answer when taking from a tokens-per-minute bucket
+COMPLETION_TOKENS = 500
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS = frozenset([408, 409, 429, 500, 502, 503, 504])
+
+# Names of provider exception classes that mean "try again later"
+RETRYABLE_NAMES = ("RateLimit", "Timeout", "APIConnection", "InternalServer", "ServiceUnavailable")
+
+# Names of provider exception classes raised for an answer that cannot be
+# parsed into the structured output requested, e.g. one cut at max_tokens
+INVALID_ANSWER_NAMES = ("ResponseValidation", "LengthFinishReason")
+
+
+class RateLimitTimeoutError(Exception):
+    """
+    Raised when a call waited too long for the rate limit of its model.
+    """
+
+
+class TokenBucket:
+    """
+    Allows a number of units per minute, with bursts of up to one minute's worth.
+    """
+
+    def __init__(self, per_minute: float):
+        """
+        Initialize the bucket, full.
+
+        Args:
+            per_minute: Units added to the bucket every minute, also its capacity
+        """
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self._available = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, amount: float, deadline: float) -> None:
+        """
+        Takes units from the bucket, waiting for them to be refilled if needed.
+
+        Args:
+            amount: Units to take, capped at the capacity of the bucket
+            deadline: time.monotonic() after which to give up
+
+        Raises:
+            RateLimitTimeoutError: If the units would not be available before the deadline
+            AnalysisCancelledError: If the deadline of the request is cancelled while waiting
+        """
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._available = min(self.capacity, self._available + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._available >= amount:
+                    self._available -= amount
+                    return
+                wait = (amount - self._available) / self.rate
+            if now + wait > deadline:
+                raise RateLimitTimeoutError(f"rate limit would take {wait:.1f}s to allow the call")
+            sleep(wait)
+            check_deadline()
+
+
+class ModelLimiter:
+    """
+    The requests-per-minute and tokens-per-minute buckets of one model.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    def acquire(self, tokens: int, timeout: float) -> float:
+        """
+        Waits until a call of the given size is allowed.
+
+        Returns:
+            float: Seconds waited
+
+        Raises:
+            RateLimitTimeoutError: If the call would not be allowed within timeout
+            AnalysisCancelledError: If the deadline of the request is cancelled while waiting
+        """
+        start = time.monotonic()
+        deadline = start + timeout
+        self.requests.take(1, deadline)
+        self.tokens.take(tokens, deadline)
+        return time.monotonic() - start
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Returns whether an LLM call that raised error may succeed if made again.
+    """
+    if isinstance(error, RateLimitTimeoutError):
+        return True
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return any(name in type(error).__name__ for name in RETRYABLE_NAMES)
+
+
+def is_invalid_answer(error: BaseException) -> bool:
+    """
+    Returns whether an LLM call raised error because of what the model answered,
+    e.g. structured output that does not validate, which another model may get right.
+    """
+    if isinstance(error, (ValidationError, json.JSONDecodeError)):
+        return True
+    return any(name in type(error).__name__ for name in INVALID_ANSWER_NAMES)
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """
+    Returns the delay asked for by the Retry-After header of a failed call, if any.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after")) if headers is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def without_crewai_retries(method: Callable) -> Callable:
+    """
+    Marks the call method of an LLM class as one that crewai must not wrap.
+
+    crewai wraps the call of every BaseLLM subclass in retries of its own on
+    rate limits. Around LLMRouter, or a wrapper of it, they would make again
+    the calls the router gave up on, without regard for the deadline of the
+    request.
+    """
+    method._crewai_rate_limit_wrapped = True
+    return method
+
+
+def provider_call(llm: BaseLLM) -> Callable[..., Any]:
+    """
+    Returns the call method of an LLM without the rate limit retries crewai wraps around it.
+    """
+    call = type(llm).call
+    if getattr(call, "_crewai_rate_limit_wrapped", False) and hasattr(call, "__wrapped__"):
+        return functools.partial(call.__wrapped__, llm)
+    return llm.call
+
+
+class LLMRouter(BaseLLM):
+    """
+    Sends each call to a model chosen for its evaluator and size.
+
+    Each evaluator has its model (the default one unless evaluator_models says
+    otherwise). Calls small enough for the cheap model go to it first, and
+    its answer is only kept when is_valid accepts it, or when structured
+    output was requested, when it parses; otherwise the call is escalated to
+    the evaluator's model. Every model has token buckets for its
+    requests and tokens per minute. Transient failures are retried with
+    exponential backoff and full jitter, and a model that keeps failing is
+    replaced by the fallback models, in order. Every call that reaches a
+    provider is recorded in core.metrics under the model that answered.
+    """
+
+    models: Dict[str, Any]
+    default_model: str
+    evaluator_models: Dict[str, str] = {}
+    cheap_model: Optional[str] = None
+    cheap_max_tokens: int = LLM_CHEAP_MAX_TOKENS
+    fallback_models: List[str] = []
+    is_valid: Optional[Callable[[str], bool]] = None
+    retries: int = LLM_RETRIES
+    retry_base_delay: float = LLM_RETRY_BASE_DELAY
+    retry_max_delay: float = LLM_RETRY_MAX_DELAY
+    rate_limit_timeout: float = LLM_RATE_LIMIT_TIMEOUT
+
+    _limiters: Dict[str, ModelLimiter] = PrivateAttr(default_factory=dict)
+
+    def __init__(self, models: Dict[str, BaseLLM], default_model: str,
+                 rate_limits: Optional[Dict[str, Tuple[float, float]]] = None, **kwargs: Any):
+        """
+        Initialize the router.
+
+        Args:
+            models: The LLM of every model the router may use, by model name
+            default_model: Model of the evaluators without one of their own
+            rate_limits: (requests, tokens) per minute of each model; models
+                without limits are not throttled
+            **kwargs: The other fields: evaluator_models, cheap_model,
+                cheap_max_tokens, fallback_models, is_valid, retries, ...
+        """
+        default = models[default_model]
+        super().__init__(models=models, default_model=default_model, model=default.model,
+                         temperature=default.temperature, stop=list(default.stop or []), **kwargs)
+        for name in [self.cheap_model, *self.evaluator_models.values(), *self.fallback_models]:
+            if name and name not in models:
+                raise ValueError(f"No LLM given for model {name}")
+        for name, (requests, tokens) in (rate_limits or {}).items():
+            if name in models:
+                self._limiters[name] = ModelLimiter(requests, tokens)
+
+    def tiers(self, evaluator: str, prompt_tokens: int) -> List[str]:
+        """
+        Returns the models a call is tried on, cheapest first, until one gives a valid answer.
+        """
+        model = self.evaluator_models.get(evaluator, self.default_model)
+        if self.cheap_model and self.cheap_model != model and prompt_tokens <= self.cheap_max_tokens:
+            return [self.cheap_model, model]
+        return [model]
+
+    @without_crewai_retries
+    def call(self, messages: Any, tools: Optional[List[Dict]] = None, callbacks: Optional[List[Any]] = None,
+             available_functions: Optional[Dict[str, Any]] = None, from_task: Any = None,
+             from_agent: Any = None, response_model: Any = None) -> Any:
+        # Tasks are named after their evaluator by crew.pipeline
+        evaluator = getattr(from_task, "name", None) or "unknown"
+        prompt_tokens = estimate_tokens(json.dumps(messages, default=str))
+        kwargs = dict(tools=tools, callbacks=callbacks, available_functions=available_functions,
+                      from_task=from_task, from_agent=from_agent, response_model=response_model)
+
+        tiers = self.tiers(evaluator, prompt_tokens)
+        for tier, model in enumerate(tiers):
+            final = tier == len(tiers) - 1
+            try:
+                response = self._call_with_failover(model, evaluator, messages, prompt_tokens, kwargs)
+            except Exception as e:
+                if final or tools or not is_invalid_answer(e):
+                    raise
+            else:
+                if final or tools or self._acceptable(response):
+                    return response
+            LLM_ESCALATIONS.inc(evaluator=evaluator, model=model)
+
+    def _acceptable(self, response: Any) -> bool:
+        """
+        Returns whether an answer of a cheaper tier can be kept.
+        """
+        if self.is_valid is None or not isinstance(response, str):
+            return True
+        try:
+            return bool(self.is_valid(response))
+        except Exception:
+            return False
+
+    def _call_with_failover(self, model: str, evaluator: str, messages: Any, prompt_tokens: int,
+                            kwargs: Dict[str, Any]) -> Any:
+        """
+        Calls a model, moving on to the fallback models while it keeps failing.
+        """
+        candidates = [model] + [fallback for fallback in self.fallback_models if fallback != model]
+        for index, candidate in enumerate(candidates):
+            try:
+                return self._call_with_retries(candidate, evaluator, messages, prompt_tokens, kwargs)
+            except Exception as e:
+                if index == len(candidates) - 1 or not is_retryable(e):
+                    raise
+                LLM_FAILOVERS.inc(model=candidate)
+
+    def _call_with_retries(self, model: str, evaluator: str, messages: Any, prompt_tokens: int,
+                           kwargs: Dict[str, Any]) -> Any:
+        """
+        Calls one model within its rate limit, retrying transient failures.
+
+        No call is made once the deadline of the request is cancelled, and no
+        wait outlasts it.
+
+        Raises:
+            AnalysisCancelledError: If the deadline of the request is cancelled
+        """
+        llm = self.models[model]
+        limiter = self._limiters.get(model)
+        deadline = current_deadline()
+        for attempt in range(self.retries + 1):
+            if deadline is not None and deadline.cancelled:
+                record_cancelled_call(evaluator, prompt_tokens, deadline.reason)
+                raise AnalysisCancelledError(deadline.describe())
+            if limiter is not None:
+                # Waiting longer is pointless, the caller fails over instead
+                timeout = self.rate_limit_timeout
+                if deadline is not None and deadline.remaining() is not None:
+                    timeout = min(timeout, deadline.remaining())
+                try:
+                    waited = limiter.acquire(prompt_tokens + COMPLETION_TOKENS, timeout)
+                except AnalysisCancelledError:
+                    record_cancelled_call(evaluator, prompt_tokens, deadline.reason)
+                    raise
+                LLM_RATE_LIMIT_WAIT.observe(waited, model=model)
+            start = time.monotonic()
+            try:
+                # The stop words crewai sets for this call apply to the chosen LLM
+                with call_stop_override(llm, self.stop_sequences):
+                    response = provider_call(llm)(messages, **kwargs)
+            except Exception as e:
+                if attempt == self.retries or not is_retryable(e):
+                    raise
+                RETRIES.inc(model=model, error=type(e).__name__)
+                delay = random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+                retry_after = _retry_after(e)
+                if retry_after is not None:
+                    delay = max(delay, min(retry_after, self.retry_max_delay))
+                sleep(delay)
+                continue
+            record_llm_call(evaluator, model, time.monotonic() - start, prompt_tokens,
+                            estimate_tokens(str(response)))
+            return response
+
+    @without_crewai_retries
+    async def acall(self, *args: Any, **kwargs: Any) -> Any:
+        return await asyncio.to_thread(self.call, *args, **kwargs)
+
+    def supports_function_calling(self) -> bool:
+        return self.models[self.default_model].supports_function_calling()
+
+    def supports_stop_words(self) -> bool:
+        return self.models[self.default_model].supports_stop_words()
+
+    def get_context_window_size(self) -> int:
+        # A call may go to any tier, so the smallest window applies
+        return min(llm.get_context_window_size() for llm in self.models.values())
+
+    def get_token_usage_summary(self) -> Any:
+        return self.models[self.default_model].get_token_usage_summary()
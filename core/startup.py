@@ -0,0 +1,58 @@
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Set once the language model and the evaluator agents are loaded
+_loaded = threading.Event()
+_lock = threading.Lock()
+
+
+def load_analysis() -> None:
+    """
+    Imports the language model and the agents (crewAI) and warms the evaluator registry, once.
+
+    Importing crewAI takes seconds, so nothing imports it at startup: the
+    server answers as soon as it listens and loads this in the background
+    (see main.py), or the gunicorn master loads it before forking its workers,
+    which then share it (see gunicorn.conf.py). Safe to call from any thread.
+    """
+    with _lock:
+        if _loaded.is_set():
+            return
+        start = time.perf_counter()
+        from core.llm import llm_gpt
+        from crew.pipeline import evaluator_registry
+
+        # Build the evaluator agents once instead of on every request
+        evaluator_registry.warm(llm_gpt)
+        _loaded.set()
+        logger.info("Analysis loaded in %.1fs", time.perf_counter() - start)
+
+
+def analysis_loaded() -> bool:
+    """
+    Whether load_analysis has completed, in this process or the one it was forked from.
+    """
+    return _loaded.is_set()
+
+
+async def ensure_analysis_loaded() -> None:
+    """
+    Waits for load_analysis, running it off the event loop if it has not run yet.
+    """
+    if not _loaded.is_set():
+        await asyncio.to_thread(load_analysis)
+
+
+async def load_in_background() -> None:
+    """
+    Runs load_analysis off the event loop, logging rather than raising failures,
+    since the first analysis tries again.
+    """
+    try:
+        await ensure_analysis_loaded()
+    except Exception:
+        logger.exception("Could not load the analysis, retrying on the first request")
@@ -0,0 +1,187 @@
+from dataclasses import dataclass, field
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from typing import Any, Dict, List, Literal, Optional
+import json
+import re
+
+# Severities agents use besides the three of the schema
+SEVERITY_ALIASES = {
+    "high": "critical", "error": "critical", "severe": "critical", "major": "critical",
+    "medium": "warning", "moderate": "warning", "minor": "info", "low": "info", "notice": "info",
+}
+
+# Where the answer of a ReAct-style agent starts
+FINAL_ANSWER = re.compile(r"Final Answer\s*:", re.IGNORECASE)
+
+# Start of a JSON array of objects, or of an empty one
+ARRAY_START = re.compile(r"\[\s*[{\]]")
+
+# Line numbers quoted with the chunk prefix, e.g. "L23"
+LINE_PREFIX = re.compile(r"^\s*L?(\d+)\s*:?\s*$", re.IGNORECASE)
+
+
+class AgentIssue(BaseModel):
+    """
+    One issue as reported by an evaluator agent.
+    """
+    id: str = Field("", description="Unique identifier for the issue, e.g. 'a1'")
+    type: str = Field(..., description="Category of the issue (html, ux, accessibility, performance)")
+    severity: Literal["info", "warning", "critical"] = Field(..., description="Severity level of the issue")
+    message: str = Field(..., description="Description of the issue")
+    element: Optional[str] = Field(None, description="Affected HTML element")
+    line: Optional[int] = Field(None, description="Line number from the 'L<n>:' prefix of the element's line")
+
+    @field_validator("severity", mode="before")
+    @classmethod
+    def _normalize_severity(cls, value: Any) -> Any:
+        if isinstance(value, str):
+            value = value.strip().lower()
+            return SEVERITY_ALIASES.get(value, value)
+        return value
+
+    @field_validator("line", mode="before")
+    @classmethod
+    def _normalize_line(cls, value: Any) -> Any:
+        if isinstance(value, str):
+            match = LINE_PREFIX.match(value)
+            return int(match.group(1)) if match else None
+        return value
+
+    @field_validator("id", mode="before")
+    @classmethod
+    def _normalize_id(cls, value: Any) -> Any:
+        return "" if value is None else str(value)
+
+
+class IssueReport(BaseModel):
+    """
+    The answer expected from an evaluator agent, used as its structured output model.
+    """
+    issues: List[AgentIssue] = Field(default_factory=list, description="Issues found, empty if none")
+
+
+@dataclass
+class ParsedOutput:
+    """
+    Issues recovered from the output of an agent.
+
+    Attributes:
+        issues: Valid issues, as dicts
+        complete: Whether the whole output was understood: a closed list was
+            found and none of its items was broken or invalid
+        dropped: Number of items that could not be recovered
+    """
+    issues: List[Dict] = field(default_factory=list)
+    complete: bool = False
+    dropped: int = 0
+
+
+def _validate(item: Any, parsed: ParsedOutput) -> None:
+    """
+    Adds an item to the parsed issues if it is a valid issue.
+    """
+    try:
+        parsed.issues.append(AgentIssue.model_validate(item).model_dump())
+    except ValidationError:
+        parsed.dropped += 1
+
+
+def _parse_array(text: str, start: int, parsed: ParsedOutput) -> None:
+    """
+    Decodes the items of a JSON array one at a time, skipping broken ones.
+
+    A truncated array keeps the items decoded before the point where it ends.
+    """
+    decoder = json.JSONDecoder()
+    position = start + 1
+    length = len(text)
+    while position < length:
+        char = text[position]
+        if char in " \t\r\n,":
+            position += 1
+            continue
+        if char == "]":
+            parsed.complete = parsed.dropped == 0
+            return
+        try:
+            item, position = decoder.raw_decode(text, position)
+        except json.JSONDecodeError:
+            # Resynchronize on the next object of the array
+            parsed.dropped += 1
+            position = text.find("{", position + 1)
+            if position < 0:
+                return
+            continue
+        _validate(item, parsed)
+
+
+def parse_issues(output: Any) -> ParsedOutput:
+    """
+    Recovers the issues of an agent's output, tolerating broken or truncated JSON.
+
+    Accepts an IssueReport, a {"issues": [...]} object, a bare list of issues or
+    a single issue, as an object or as text possibly surrounded by prose or code
+    fences. Each item is validated against AgentIssue on its own, so one broken
+    item does not lose the others.
+
+    Args:
+        output: Raw output of the agent
+
+    Returns:
+        ParsedOutput: The valid issues and whether anything was lost
+    """
+    parsed = ParsedOutput()
+    if isinstance(output, BaseModel):
+        output = output.model_dump()
+    if isinstance(output, (dict, list)):
+        output = json.dumps(output)
+    text = str(output or "")
+
+    answer = FINAL_ANSWER.search(text)
+    if answer:
+        text = text[answer.end():]
+
+    # Whole answer first: an {"issues": [...]} report or a single issue
+    stripped = text.strip().strip("`").strip()
+    if stripped.lower().startswith("json"):
+        stripped = stripped[4:].strip()
+    if stripped.startswith("{"):
+        try:
+            value, _ = json.JSONDecoder().raw_decode(stripped)
+        except json.JSONDecodeError:
+            value = None
+        if isinstance(value, dict) and isinstance(value.get("issues"), list):
+            for item in value["issues"]:
+                _validate(item, parsed)
+            parsed.complete = parsed.dropped == 0
+            return parsed
+        if isinstance(value, dict):
+            _validate(value, parsed)
+            parsed.complete = parsed.dropped == 0
+            return parsed
+
+    match = ARRAY_START.search(text)
+    if match:
+        _parse_array(text, match.start(), parsed)
+    return parsed
+
+
+def is_valid_report(output: Any) -> bool:
+    """
+    Returns whether the output of an evaluator is a report understood in full.
+    """
+    return parse_issues(output).complete
+
+
+def repair_prompt(output: str) -> List[Dict[str, str]]:
+    """
+    Returns the messages asking an LLM to turn a broken agent output into a valid report.
+    """
+    schema = json.dumps(IssueReport.model_json_schema())
+    return [
+        {"role": "system", "content": "You convert quality reports into valid JSON. You never add, drop "
+                                      "or change issues, you only fix the format."},
+        {"role": "user", "content": f"Rewrite the report below as a single JSON object matching this JSON "
+                                    f"schema, and output nothing else.\n\nSchema: {schema}\n\n"
+                                    f"Report:\n{output}"},
+    ]
@@ -0,0 +1,285 @@
+from typing import Any, Callable, Dict, List, Optional
+import hashlib
+import importlib
+from urllib.parse import urlsplit
+
+from crew.registry import EvaluatorRegistry
+from crew.selection import EvaluatorChoice, select_evaluators
+from core.cache import section_cache
+from core.config import CHUNK_MAX_CHUNKS
+from core.metrics import span
+from rules.engine import rule_engine
+from utils.chunk_html import HtmlChunk, expand_templates, map_issue_lines
+from utils.views import VIEWS
+from utils.prepare_page import PageSnapshot
+
+# Bump whenever the agents or task prompts change, so cached results of the old
+# prompts are no longer used
+PROMPT_VERSION = "7"
+
+
+def _lazy(module: str, name: str) -> Callable[..., Any]:
+    """
+    Returns a function calling module.name, importing the module on first call.
+
+    The agents and tasks import crewAI, which takes seconds; deferring them lets
+    the server answer before they are loaded (see core.startup).
+    """
+    def call(*args: Any, **kwargs: Any) -> Any:
+        return getattr(importlib.import_module(module), name)(*args, **kwargs)
+    call.__name__ = name
+    return call
+
+
+# (name, view, agent factory, task factory) of every evaluator run on a page. The
+# view (see utils.views) is the part of the page the evaluator gets to see.
+EVALUATORS = [
+    ("ux", "layout", _lazy("agents.ux_evaluator", "create_ux_evaluator"),
+     _lazy("tasks.analyze_ux", "create_analyze_ux_task")),
+    ("accessibility", "semantic", _lazy("agents.accessibility_evaluator", "create_accessibility_evaluator"),
+     _lazy("tasks.analyze_accessibility", "create_analyze_accessibility_task")),
+    ("html", "layout", _lazy("agents.html_evaluator", "create_html_evaluator"),
+     _lazy("tasks.analyze_html", "create_analyze_html_task")),
+    ("performance", "resources", _lazy("agents.performance_evaluator", "create_performance_evaluator"),
+     _lazy("tasks.analyze_performance", "create_analyze_performance_task")),
+]
+
+# Views read by the evaluators, computed up front for pages prepared in another
+# process (see core.preprocess)
+EVALUATOR_VIEWS = list(dict.fromkeys(view for _, view, _, _ in EVALUATORS))
+
+# Prototype agents of the evaluators, warmed at startup by core.startup
+evaluator_registry = EvaluatorRegistry({name: create_agent for name, _, create_agent, _ in EVALUATORS})
+
+
+def choose_evaluators(page: PageSnapshot, requested: Optional[List[str]] = None) -> List[EvaluatorChoice]:
+    """
+    Returns which evaluators run on a page and why, see crew.selection.select_evaluators.
+
+    Raises:
+        ValueError: If requested names an unknown evaluator
+    """
+    return select_evaluators([name for name, _, _, _ in EVALUATORS], page, requested)
+
+
+def analysis_cache_key(page: PageSnapshot, model_name: str,
+                       selection: Optional[List[EvaluatorChoice]] = None) -> str:
+    """
+    Returns the key under which the analysis of a page is cached.
+
+    The key covers everything that decides the result: the content of every
+    view sent to the agents, the evaluators that run and how, the prompt
+    version and the model.
+
+    Args:
+        page: The page to analyze
+        model_name: Name of the model used by the agents
+        selection: Evaluators that run, defaults to choose_evaluators(page)
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    choices = {choice.name: choice for choice in selection or choose_evaluators(page)}
+    selected = [(name, view) for name, view, _, _ in EVALUATORS if choices[name].run]
+    digest = hashlib.sha256()
+    evaluators = ",".join(f"{name}:{view}:{choices[name].variant}" for name, view in selected)
+    digest.update(f"{PROMPT_VERSION}\0{model_name}\0{evaluators}\0".encode())
+    for view in dict.fromkeys(view for _, view in selected):
+        for chunk in page.view(view):
+            digest.update(chunk.content.encode())
+            digest.update(b"\0")
+        digest.update(b"\1")
+    return digest.hexdigest()
+
+
+def content_hash(page: PageSnapshot) -> str:
+    """
+    Returns a hash of the content of a page as cleaned and chunked, which
+    changes when the page does but not with the evaluators or the model.
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    digest = hashlib.sha256()
+    for chunk in page.chunks:
+        digest.update(chunk.content.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def section_cache_key(url: str, evaluator: str, chunk: HtmlChunk, model_name: str, variant: str = "") -> str:
+    """
+    Returns the key under which the issues of one evaluator on one chunk are cached.
+
+    The chunk fingerprint ignores line numbers, so a section keeps its key when
+    content above it changes. variant is EvaluatorChoice.variant.
+    """
+    key = f"{PROMPT_VERSION}\0{model_name}\0{evaluator}\0{variant}\0{url}\0{chunk.fingerprint}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _store_section(key: str, issues: List[Dict], chunk: HtmlChunk) -> None:
+    """
+    Caches the issues of a chunk with their lines stored as positions in the chunk.
+    """
+    positions = [chunk.lines.index(issue["line"]) if issue.get("line") in chunk.lines else None
+                 for issue in issues]
+    section_cache.set(key, {"issues": [dict(issue) for issue in issues], "positions": positions})
+
+
+def _load_section(key: str, chunk: HtmlChunk) -> Optional[List[Dict]]:
+    """
+    Returns the cached issues of a chunk with their lines mapped onto its current lines.
+    """
+    cached = section_cache.get(key)
+    if cached is None:
+        return None
+    return [
+        {**issue, "line": chunk.lines[position] if position is not None else None}
+        for issue, position in zip(cached["issues"], cached["positions"])
+    ]
+
+
+def is_complete(issues: List[Dict]) -> bool:
+    """
+    Returns whether no evaluator failed or timed out while producing issues.
+    """
+    return not any(str(issue.get("id", "")).startswith("error_") for issue in issues)
+
+
+def _number_issues(issues: List[Dict], chunk: HtmlChunk) -> List[Dict]:
+    """
+    Returns copies of the issues of a chunk with ids made unique across chunks.
+
+    Agents number their issues per prompt, so on multi-chunk pages the chunk
+    number is appended to each id.
+    """
+    if chunk.total == 1:
+        return issues
+    return [{**issue, "id": f"{issue['id']}-{chunk.index + 1}"} if issue.get("id") else issue
+            for issue in issues]
+
+
+def _report_issues(issues: List[Dict], chunk: HtmlChunk) -> List[Dict]:
+    """
+    Returns the issues of a chunk as reported: copied onto every copy of the
+    repeated templates collapsed in the chunk, then numbered.
+    """
+    return _number_issues(expand_templates(issues, chunk), chunk)
+
+
+def run_analysis(llm: Any, page: PageSnapshot, url: str, model_name: str = "",
+                 on_issues: Optional[Callable[[str, List[Dict]], None]] = None,
+                 on_start: Optional[Callable[[str], None]] = None,
+                 selection: Optional[List[EvaluatorChoice]] = None) -> List[Dict]:
+    """
+    Binds the evaluator agents to the page's tasks, builds the crew and runs the analysis.
+
+    Every evaluator is sent every chunk of its view of the page, except the
+    chunks it already analyzed for this URL: their issues come from the section
+    cache, so when a page changes only its changed sections reach the agents.
+    The issues found in each chunk get their line numbers mapped back to the
+    original document, are copied onto the collapsed copies of repeated
+    templates (see utils.chunk_html.expand_templates) and are merged into one
+    list. The section cache keeps them before expansion.
+
+    This call blocks for the duration of every LLM round-trip, so async callers
+    should run it through core.concurrency.analysis_limiter.
+
+    Args:
+        llm: Language model to use for the agents
+        page: The page, see utils.prepare_page.prepare_page
+        url: URL of the web page
+        model_name: Name of the model behind llm, part of the section cache key
+        on_issues: Called with an evaluator name and issues each time the issues
+            of one chunk are available, cached chunks first, from the calling thread
+        on_start: Called with an evaluator name each time the evaluator starts
+            working on a chunk that was not cached
+        selection: Evaluators that run and how, defaults to choose_evaluators(page)
+
+    Returns:
+        List[Dict]: Combined list of issues from all agents
+    """
+    # [evaluator name, chunk, issues] of every (evaluator, chunk) pair, issues
+    # staying None until the chunk is analyzed
+    sections = []
+    agents = []
+    tasks = []
+    pending = []
+    # Prompts name the site rather than the page, so that sections shared by the
+    # pages of a site (header, footer, ...) send identical prompts, which the
+    # LLM response cache answers (see core.llm.CachingLLM)
+    parts = urlsplit(url)
+    site = f"{parts.scheme}://{parts.netloc}" if parts.netloc else url
+    truncated = []
+    choices = {choice.name: choice for choice in selection or choose_evaluators(page)}
+    for name, view, _, create_task in EVALUATORS:
+        choice = choices[name]
+        if not choice.run:
+            continue
+        # Checks made by the rule engine, and those that do not apply to the
+        # page, are left out of the prompts
+        covered = rule_engine.covered_checks(name) + list(choice.skipped_checks)
+        chunks = page.view(view)
+        # A scaled down evaluator is cut short by design, its choice says so
+        if len(chunks) > CHUNK_MAX_CHUNKS and choice.max_chunks >= CHUNK_MAX_CHUNKS:
+            truncated.append(f"{name} {CHUNK_MAX_CHUNKS} of {len(chunks)}")
+        for chunk in chunks[:min(choice.max_chunks, CHUNK_MAX_CHUNKS)]:
+            key = section_cache_key(url, name, chunk, model_name, choice.variant)
+            issues = _load_section(key, chunk)
+            sections.append([name, chunk, issues])
+            if issues is None:
+                with span("prompt"):
+                    agent = evaluator_registry.agent(name, llm)
+                    task = create_task(agent, chunk.content, site, chunk.describe() + VIEWS[view].summary,
+                                       covered)
+                    # Names the evaluator in the metrics of the task's LLM calls
+                    task.name = name
+                agents.append(agent)
+                tasks.append(task)
+                pending.append((len(sections) - 1, key))
+            elif on_issues is not None:
+                on_issues(name, _report_issues(issues, chunk))
+
+    def task_started(task_index: int) -> None:
+        if on_start is not None:
+            on_start(sections[pending[task_index][0]][0])
+
+    def task_completed(task_index: int, issues: List[Dict]) -> None:
+        index, key = pending[task_index]
+        name, chunk, _ = sections[index]
+        issues = map_issue_lines(issues, chunk)
+        if is_complete(issues):
+            _store_section(key, issues, chunk)
+        sections[index][2] = issues
+        if on_issues is not None:
+            on_issues(name, _report_issues(issues, chunk))
+
+    if tasks:
+        # Imported here with crewAI, see _lazy
+        from crew.qa_analyzer import QAAnalyzerCrew
+
+        # Create and run crew
+        crew = QAAnalyzerCrew(agents=agents, tasks=tasks, on_task_start=task_started,
+                              on_task_complete=task_completed)
+        with span("agents"):
+            task_results = crew.analyze_by_task()
+        for task_index, issues in enumerate(task_results):
+            section = sections[pending[task_index][0]]
+            if section[2] is None:
+                section[2] = map_issue_lines(issues, section[1])
+
+    all_issues = []
+    for _, chunk, issues in sections:
+        all_issues.extend(_report_issues(issues, chunk))
+
+    if truncated:
+        all_issues.append({
+            "id": "chunks_truncated",
+            "type": "system",
+            "severity": "info",
+            "message": f"Page too large: analyzed the first chunks only ({', '.join(truncated)})",
+            "element": None,
+            "line": None
+        })
+    return all_issues
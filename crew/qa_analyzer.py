@@ -1,109 +1,307 @@
 from crewai import Crew, Process
-from typing import Any, List, Dict
-import json
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, List, Dict, Optional
+import contextvars
+import logging
+import math
+import time
+
+from core.config import CREW_PROCESS, CREW_MAX_PARALLEL_TASKS, CREW_TASK_TIMEOUT, CREW_VERBOSE
+from core.deadline import AnalysisCancelledError, Deadline, current_deadline
+from core.metrics import PARSE_FAILURES, record_cancelled_call, span
+from crew.output import parse_issues, repair_prompt, IssueReport
+from utils.chunk_html import estimate_tokens
+
+logger = logging.getLogger(__name__)
 
 class QAAnalyzerCrew:
     """
     A crew of agents specialized in analyzing web pages for quality issues.
     """
-    
-    def __init__(self, agents: List[Any], tasks: List[Any]):
+
+    def __init__(self, agents: List[Any], tasks: List[Any], process: Optional[str] = None,
+                 max_parallel_tasks: Optional[int] = None, task_timeout: Optional[float] = None,
+                 on_task_start: Optional[Callable[[int], None]] = None,
+                 on_task_complete: Optional[Callable[[int, List[Dict]], None]] = None):
         """
         Initialize the web analyzer crew.
-        
+
         Args:
             agents: List of crewAI agents for the analysis
             tasks: List of crewAI tasks to be performed
+            process: "parallel" to run every task at the same time or "sequential"
+                to run them one after another (defaults to CREW_PROCESS)
+            max_parallel_tasks: Maximum number of tasks running at once in parallel mode
+            task_timeout: Seconds a single task may run before its result is dropped
+            on_task_start: Called with the index of a task when it starts running
+            on_task_complete: Called with the index of a task and its issues as soon
+                as that task finishes, failed and timed out tasks included
         """
         self.agents = agents
         self.tasks = tasks
-        self.crew = Crew(
-            agents=agents,
-            tasks=tasks,
-            verbose=True,
-            process=Process.sequential
-        )
-    
+        self.process = process or CREW_PROCESS
+        self.max_parallel_tasks = max(1, max_parallel_tasks or CREW_MAX_PARALLEL_TASKS)
+        self.task_timeout = task_timeout or CREW_TASK_TIMEOUT
+        self.on_task_start = on_task_start
+        self.on_task_complete = on_task_complete
+
+        if self.process == "parallel":
+            # The evaluators do not depend on each other's output, so each task
+            # gets a crew of its own and all of them can be kicked off at once.
+            # Crews are built by the worker that runs them, so building one
+            # overlaps with the LLM calls of the tasks already running.
+            self.crews: List[Optional[Crew]] = [None] * len(tasks)
+        else:
+            self.crew = Crew(
+                agents=agents,
+                tasks=tasks,
+                verbose=CREW_VERBOSE,
+                process=Process.sequential
+            )
+
     def analyze(self) -> List[Dict]:
         """
         Run the analysis and return a combined list of issues.
-        
+
         Returns:
             List[Dict]: Combined list of issues from all agents
         """
-        # Execute the crew's tasks
-        results = self.crew.kickoff()
-
-        
         all_issues = []
-        for task in self.tasks:
-            result = task.output.raw
-            self._process_result(result, all_issues)
-            
-        print(all_issues)
-        return all_issues       
-        
-        
-    
-    def _process_result(self, result, all_issues):
-        """
-        Process a single result and add parsed issues to all_issues list.
-        
-        Args:
-            result: The result to process
-            all_issues: List to append parsed issues to
+        for issues in self.analyze_by_task():
+            all_issues.extend(issues)
+
+        logger.debug("Analysis found %d issues", len(all_issues))
+        return all_issues
+
+    def analyze_by_task(self) -> List[List[Dict]]:
+        """
+        Run the analysis and return the issues of each task separately.
+
+        When the deadline of the request (see core.deadline) is cancelled, tasks
+        that have not finished are stopped and reported as system issues, so the
+        issues of the tasks done so far are still returned.
+
+        Returns:
+            List[List[Dict]]: Issues of each task, in the order of self.tasks
         """
+        if self.process == "parallel":
+            return self._analyze_parallel()
+
+        # Execute the crew's tasks
+        deadline = current_deadline()
+        for index in range(len(self.tasks)):
+            self._notify(self.on_task_start, index)
+        kicked_off = False
         try:
-            print("New Result : ")
-            print(result)
-            print("Old Result :")
-            print(all_issues)
-            # If result is already a dict or list, convert to string first
-            if isinstance(result, (dict, list)):
-                result_str = json.dumps(result)
-            else:
-                result_str = str(result)
-                
-            # Clean the string to ensure it's valid JSON
-            # Look for JSON array pattern [...] in the result
-            import re
-            json_match = re.search(r'\[.*\]', result_str, re.DOTALL)
-            
-            if json_match:
-                json_str = json_match.group(0)
-                issues = json.loads(json_str)
-                
-                if isinstance(issues, list):
-                    all_issues.extend(issues)
-                else:
-                    all_issues.append(issues)
+            if deadline is not None:
+                deadline.check()
+            kicked_off = True
+            self.crew.kickoff()
+        except AnalysisCancelledError:
+            pass
+
+        task_issues = []
+        for index, task in enumerate(self.tasks):
+            if task.output is None:
+                # Only the first task without output was running, the next ones never started
+                issues = self._cancelled_issues(index, deadline, started=kicked_off)
+                kicked_off = False
             else:
-                # Try parsing the entire string as JSON
-                try:
-                    issues = json.loads(result_str)
-                    if isinstance(issues, list):
-                        all_issues.extend(issues)
-                    else:
-                        all_issues.append(issues)
-                except json.JSONDecodeError:
-                    # Create an error issue for non-JSON output
-                    error_issue = {
-                        "id": f"error_{len(all_issues) + 1}",
-                        "type": "system",
-                        "severity": "info",
-                        "message": f"Failed to parse agent output: {result_str[:100]}...",
-                        "element": None,
-                        "line": None
-                    }
-                    all_issues.append(error_issue)
+                issues = self._task_issues(index, task.output.raw)
+            self._notify(self.on_task_complete, index, issues)
+            task_issues.append(issues)
+        return task_issues
+
+    def _analyze_parallel(self) -> List[List[Dict]]:
+        """
+        Run every task in its own crew on a bounded thread pool.
+
+        Tasks that fail, exceed the task timeout or outlive the deadline of the
+        request are reported as system issues so the results of the other
+        evaluators are still returned.
+
+        Returns:
+            List[List[Dict]]: Issues of each task, in the order of self.tasks
+        """
+        started: Dict[int, float] = {}
+        outcomes: Dict[int, List[Dict]] = {}
+        deadline = current_deadline()
+        # Done as soon as the deadline is cancelled, to stop waiting for the tasks
+        cancelled: Future = Future()
+        if deadline is not None:
+            deadline.on_cancel(lambda: cancelled.set_result(None))
+
+        def run(index: int) -> List[Dict]:
+            if deadline is not None and deadline.cancelled:
+                # Queued when the deadline was cancelled, never started
+                return self._cancelled_issues(index, deadline, started=False)
+            started[index] = time.monotonic()
+            self._notify(self.on_task_start, index)
+            self._task_crew(index).kickoff()
+            # Parsed here so that a repair call counts against the task's timeout
+            return self._task_issues(index, self.tasks[index].output.raw)
+
+        executor = ThreadPoolExecutor(max_workers=self.max_parallel_tasks,
+                                      thread_name_prefix="qa-evaluator")
+        # Each task runs in a copy of the caller's context, which carries the
+        # request's stage timings (see core.metrics)
+        pending = {executor.submit(contextvars.copy_context().run, run, index): index
+                   for index in range(len(self.tasks))}
+        # Queued tasks only start once a worker frees up, so the whole batch gets
+        # one timeout per wave of workers.
+        waves = math.ceil(len(self.tasks) / self.max_parallel_tasks) if self.tasks else 0
+        batch_deadline = time.monotonic() + self.task_timeout * waves
+
+        try:
+            while pending:
+                now = time.monotonic()
+                deadlines = [started[index] + self.task_timeout
+                             for index in pending.values() if index in started]
+                if deadline is not None and deadline.remaining() is not None:
+                    deadlines.append(now + deadline.remaining())
+                next_deadline = min(deadlines + [batch_deadline])
+                done, _ = wait(list(pending) + [cancelled], timeout=max(0.0, next_deadline - now),
+                               return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    if future is cancelled:
+                        continue
+                    index = pending.pop(future)
+                    try:
+                        outcomes[index] = future.result()
+                    except AnalysisCancelledError:
+                        outcomes[index] = self._cancelled_issues(index, deadline, started=True)
+                    except Exception as e:
+                        outcomes[index] = self._error_issues(
+                            index, f"Evaluator '{self._task_name(index)}' failed: {str(e)}")
+                    self._notify(self.on_task_complete, index, outcomes[index])
+
+                if deadline is not None and deadline.cancelled:
+                    # Calls in progress finish in the background, no new ones are made
+                    for future, index in list(pending.items()):
+                        future.cancel()
+                        del pending[future]
+                        outcomes[index] = self._cancelled_issues(index, deadline, started=index in started)
+                        self._notify(self.on_task_complete, index, outcomes[index])
+
+                now = time.monotonic()
+                for future, index in list(pending.items()):
+                    timed_out = index in started and now - started[index] >= self.task_timeout
+                    if timed_out or now >= batch_deadline:
+                        future.cancel()
+                        del pending[future]
+                        outcomes[index] = self._error_issues(
+                            index, f"Evaluator '{self._task_name(index)}' timed out after "
+                            f"{self.task_timeout:.0f}s")
+                        self._notify(self.on_task_complete, index, outcomes[index])
+        finally:
+            # Threads stuck in an LLM call cannot be interrupted; stop waiting for them.
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        return [outcomes[index] for index in range(len(self.tasks))]
+
+    def _task_crew(self, index: int) -> Crew:
+        """
+        Return the single-task crew of a task in parallel mode, building it on first use.
+        """
+        if self.crews[index] is None:
+            task = self.tasks[index]
+            self.crews[index] = Crew(
+                agents=[task.agent],
+                tasks=[task],
+                verbose=CREW_VERBOSE,
+                process=Process.sequential
+            )
+        return self.crews[index]
+
+    def _task_issues(self, index: int, result: Any) -> List[Dict]:
+        """
+        Return the issues of a task, validated against crew.output.AgentIssue.
+
+        Output that cannot be fully understood is sent back to the task's LLM
+        once to be reformatted, rather than running the evaluator again. When
+        that fails too, the issues recovered from the original output are kept,
+        or a system issue is reported if there are none.
+        """
+        with span("parse"):
+            parsed = parse_issues(result)
+        if parsed.complete:
+            return parsed.issues
+
+        evaluator = getattr(self.tasks[index], "name", None) or self._task_name(index)
+        with span("repair"):
+            repaired = self._repair(index, result)
+        if repaired is not None and repaired.complete and len(repaired.issues) >= len(parsed.issues):
+            PARSE_FAILURES.inc(evaluator=evaluator, outcome="repaired")
+            return repaired.issues
+        if parsed.issues:
+            PARSE_FAILURES.inc(evaluator=evaluator, outcome="recovered")
+            return parsed.issues
+        PARSE_FAILURES.inc(evaluator=evaluator, outcome="failed")
+        return self._error_issues(
+            index, f"Evaluator '{self._task_name(index)}' returned output that could not be parsed: "
+            f"{str(result)[:100]}...")
+
+    def _repair(self, index: int, result: Any) -> Optional[Any]:
+        """
+        Ask the LLM of a task to reformat its output as a valid report.
+
+        Returns:
+            ParsedOutput: The parsed reformatted output, None if the call failed
+        """
+        llm = getattr(getattr(self.tasks[index], "agent", None), "llm", None)
+        if llm is None or not str(result or "").strip():
+            return None
+        try:
+            return parse_issues(llm.call(repair_prompt(str(result)), from_task=self.tasks[index],
+                                         response_model=IssueReport))
         except Exception as e:
-            # Handle any other errors
-            error_issue = {
-                "id": f"error_{len(all_issues) + 1}",
-                "type": "system",
-                "severity": "info",
-                "message": f"Error processing result: {str(e)}",
-                "element": None,
-                "line": None
-            }
-            all_issues.append(error_issue)
\ No newline at end of file
+            logger.warning("Repair of evaluator output failed: %s", e)
+            return None
+
+    def _cancelled_issues(self, index: int, deadline: Optional[Deadline], started: bool) -> List[Dict]:
+        """
+        Return the issues reported for a task stopped because its deadline was cancelled.
+
+        The LLM calls of a task that never started are counted as saved here;
+        those of a running task are counted by core.router as it refuses them.
+        """
+        reason = deadline.reason if deadline is not None else "deadline"
+        if not started:
+            task = self.tasks[index]
+            record_cancelled_call(getattr(task, "name", None) or "unknown",
+                                  estimate_tokens(str(getattr(task, "description", ""))), reason)
+        description = deadline.describe() if deadline is not None else "the analysis was cancelled"
+        return self._error_issues(index, f"Evaluator '{self._task_name(index)}' was stopped because {description}")
+
+    def _error_issues(self, index: int, message: str) -> List[Dict]:
+        """
+        Return the issues reported for a task that produced no output, numbered
+        after the task so several failed tasks of a page get distinct ids.
+        """
+        return [{
+            "id": f"error_{index + 1}",
+            "type": "system",
+            "severity": "info",
+            "message": message,
+            "element": None,
+            "line": None
+        }]
+
+    def _notify(self, callback: Optional[Callable[..., None]], *args: Any) -> None:
+        """
+        Call a progress callback, never letting a failing callback break the analysis.
+        """
+        if callback is None:
+            return
+        try:
+            callback(*args)
+        except Exception as e:
+            logger.warning("Progress callback failed: %s", e)
+
+    def _task_name(self, index: int) -> str:
+        """
+        Return a readable name for a task, used in timeout and failure messages.
+        """
+        agent = getattr(self.tasks[index], "agent", None)
+        return getattr(agent, "role", None) or f"task {index + 1}"
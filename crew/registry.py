@@ -0,0 +1,78 @@
+from typing import Any, Callable, Dict, List, Tuple
+import threading
+import uuid
+
+
+class EvaluatorRegistry:
+    """
+    Warm pool of the evaluator agents, shared by every request.
+
+    Building an agent validates its whole pydantic model. The registry does that
+    once per evaluator and language model, ideally at startup, and hands each
+    request a shallow copy with its own id and its own run state (token usage,
+    tool results, messages, callbacks). A crew binds the agents it runs to
+    itself, so requests never share an agent; the prototypes themselves are
+    never run and stay unchanged.
+    """
+
+    def __init__(self, factories: Dict[str, Callable[[Any], Any]]):
+        """
+        Initialize the registry.
+
+        Args:
+            factories: Agent factory of each evaluator, by evaluator name
+        """
+        self.factories = dict(factories)
+        # Prototype agents of each evaluator, with the language model they use
+        self._prototypes: Dict[str, Tuple[Any, Any]] = {}
+        self._lock = threading.Lock()
+
+    def warm(self, llm: Any) -> None:
+        """
+        Builds the prototype agents of every evaluator for a language model.
+
+        Args:
+            llm: Language model of the agents
+        """
+        with self._lock:
+            for name, create_agent in self.factories.items():
+                prototype = self._prototypes.get(name)
+                if prototype is None or prototype[0] is not llm:
+                    self._prototypes[name] = (llm, create_agent(llm))
+
+    def agent(self, name: str, llm: Any) -> Any:
+        """
+        Returns a fresh agent of an evaluator, copied from its prototype.
+
+        Args:
+            name: Name of the evaluator
+            llm: Language model of the agent. The prototypes are rebuilt when
+                it is not the one they were warmed with.
+
+        Returns:
+            Agent: An agent owned by the caller
+        """
+        prototype = self._prototypes.get(name)
+        if prototype is None or prototype[0] is not llm:
+            self.warm(llm)
+            prototype = self._prototypes[name]
+        agent = prototype[1]
+        # A shallow copy would share what an agent accumulates while it runs
+        copy = agent.model_copy(update={
+            "id": uuid.uuid4(),
+            "tools": list(agent.tools or []),
+            "tools_handler": type(agent.tools_handler)(cache=agent.tools_handler.cache),
+            "tools_results": [],
+            "callbacks": list(agent.callbacks or []),
+        })
+        copy._token_process = type(agent._token_process)()
+        copy._last_messages = []
+        copy._tool_failures = []
+        copy._times_executed = 0
+        return copy
+
+    def names(self) -> List[str]:
+        """
+        Returns the names of the registered evaluators.
+        """
+        return list(self.factories)
@@ -0,0 +1,138 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+import hashlib
+
+from core.config import CHUNK_MAX_CHUNKS, EVALUATOR_POLICY
+from utils.features import PageFeatures
+from utils.prepare_page import PageSnapshot
+
+# Chunks sent to an evaluator that was scaled down
+LIGHT_MAX_CHUNKS = 2
+
+
+@dataclass(frozen=True)
+class EvaluatorChoice:
+    """
+    Whether and how one evaluator runs on a page.
+
+    Attributes:
+        name: Name of the evaluator, see crew.pipeline.EVALUATORS
+        run: Whether the evaluator runs at all
+        reason: Why, reported in the response
+        max_chunks: Chunks of its view the evaluator is sent at most
+        skipped_checks: Checks that do not apply to the page, left out of the
+            prompt like those of the rule engine
+    """
+    name: str
+    run: bool
+    reason: str
+    max_chunks: int = CHUNK_MAX_CHUNKS
+    skipped_checks: Tuple[str, ...] = ()
+
+    @property
+    def variant(self) -> str:
+        """
+        Identifies the prompt the evaluator gets, for the cache keys: "" when
+        it runs in full, a short digest of its restrictions otherwise.
+        """
+        if self.max_chunks >= CHUNK_MAX_CHUNKS and not self.skipped_checks:
+            return ""
+        payload = f"{self.max_chunks}\0" + "\0".join(self.skipped_checks)
+        return hashlib.sha256(payload.encode()).hexdigest()[:12]
+
+
+class SelectionPolicy:
+    """
+    Decides which evaluators run on a page. The base class runs all of them.
+
+    Subclasses override choose, called once per evaluator with the features
+    of the page. Register a policy in POLICIES to select it with EVALUATOR_POLICY.
+    """
+
+    def choose(self, name: str, features: PageFeatures) -> EvaluatorChoice:
+        return EvaluatorChoice(name, True, "run on every page")
+
+    def needs_features(self) -> bool:
+        """
+        Returns whether choose looks at the features, so they are not extracted for nothing.
+        """
+        return type(self).choose is not SelectionPolicy.choose
+
+
+class FeaturePolicy(SelectionPolicy):
+    """
+    Skips or scales down the evaluators that have little or nothing to look at.
+
+    - performance is skipped on pages that load nothing (no scripts,
+      stylesheets, images, media or iframes)
+    - accessibility is scaled down on pages without forms, images or
+      interactive controls: a couple of chunks, structure and language only
+    - ux is scaled down on pages without any interactive control or link:
+      a couple of chunks, readability and layout only
+    - html always runs in full
+    """
+
+    def choose(self, name: str, features: PageFeatures) -> EvaluatorChoice:
+        if name == "performance" and features.resources == 0:
+            return EvaluatorChoice(name, False, "no scripts, stylesheets, images, media or iframes to load")
+
+        if name == "accessibility" and not (features.forms or features.images or features.media
+                                            or features.interactive):
+            return EvaluatorChoice(
+                name, True, "scaled down: no forms, images, media or interactive controls",
+                max_chunks=LIGHT_MAX_CHUNKS,
+                skipped_checks=("Form labels and keyboard access of controls (the page has none)",
+                                "Text alternatives of images and media (the page has none)"))
+
+        if name == "ux" and not (features.interactive or features.links or features.forms):
+            return EvaluatorChoice(
+                name, True, "scaled down: static page without links or controls",
+                max_chunks=LIGHT_MAX_CHUNKS,
+                skipped_checks=("Navigation and interactive elements (the page has none)",))
+
+        return EvaluatorChoice(name, True, f"page has {self._summary(features)}")
+
+    def _summary(self, features: PageFeatures) -> str:
+        return (f"{features.forms} forms, {features.images} images, "
+                f"{features.interactive} controls, {features.resources} resources")
+
+
+# Selection policies by name, see EVALUATOR_POLICY
+POLICIES: Dict[str, SelectionPolicy] = {
+    "all": SelectionPolicy(),
+    "features": FeaturePolicy(),
+}
+
+
+def select_evaluators(names: Sequence[str], page: PageSnapshot, requested: Optional[Sequence[str]] = None,
+                      policy: Optional[SelectionPolicy] = None) -> List[EvaluatorChoice]:
+    """
+    Chooses which evaluators run on a page.
+
+    Evaluators named in requested run in full whatever the policy says, and
+    the others do not run at all. Without requested, the policy decides.
+
+    Args:
+        names: Names of every evaluator, in order
+        page: The page, whose features are only extracted when the policy needs them
+        requested: Evaluators asked for by the client, if any
+        policy: Policy to apply, defaults to POLICIES[EVALUATOR_POLICY]
+
+    Returns:
+        List[EvaluatorChoice]: One choice per evaluator, in the order of names
+
+    Raises:
+        ValueError: If requested names an unknown evaluator
+    """
+    if requested is not None:
+        unknown = sorted(set(requested) - set(names))
+        if unknown:
+            raise ValueError(f"Unknown evaluators {unknown}, choose from {list(names)}")
+        return [EvaluatorChoice(name, True, "requested") if name in requested
+                else EvaluatorChoice(name, False, "not requested") for name in names]
+
+    policy = policy or POLICIES[EVALUATOR_POLICY]
+    if not policy.needs_features():
+        return [policy.choose(name, PageFeatures()) for name in names]
+    features = page.features
+    return [policy.choose(name, features) for name in names]
@@ -0,0 +1,49 @@
+"""
+Gunicorn settings, used with: gunicorn main:app -c gunicorn.conf.py
+
+The app is imported once by the master, which also loads crewAI and builds
+the evaluator agents (see core.startup) before forking the workers. The
+workers start with all of it loaded, instead of importing it each, and share
+its memory with the master until they write to it.
+
+Each worker keeps its own metrics and a scrape of /metrics reaches only one of
+them, so the workers share their metrics through METRICS_DIR, by default a
+directory of this server in the temporary directory (see
+core.metrics.SharedMetrics).
+"""
+import os
+import tempfile
+
+# Set before the app, and so core.config, is imported
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), f"qa-metrics-{os.getpid()}"))
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+
+def when_ready(server):
+    # Runs in the master, after the app is imported and before the workers are forked
+    from core.startup import load_analysis
+
+    load_analysis()
+
+
+def on_starting(server):
+    # Metrics of an earlier server using the same directory are not this one's
+    from core.metrics import shared_metrics
+
+    if shared_metrics is not None:
+        shared_metrics.clear()
+
+
+def on_exit(server):
+    from core.metrics import shared_metrics
+
+    if shared_metrics is not None:
+        shared_metrics.clear()
+        try:
+            os.rmdir(shared_metrics.directory)
+        except OSError:
+            pass
@@ -1,16 +1,64 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
+import logging
 import uvicorn
 import os
 
+from core.log import configure_logging
+
+# Leveled, sampled logs instead of prints, configured before anything logs
+configure_logging()
+logger = logging.getLogger(__name__)
+
 # Import API endpoints
 from api.endpoints import router as api_router
+from api.batch import router as batch_router
+from api.stream import router as stream_router
+from api.jobs import router as jobs_router, job_workers
+from api.history import router as history_router
+from api.metrics import router as metrics_router
+from core.config import STARTUP_LOAD
+from core.history import compact_periodically, history_store
+from core.metrics import shared_metrics
+from core.preprocess import preprocess_pool
+from core.startup import ensure_analysis_loaded, load_in_background
+from utils.fetcher import page_fetcher
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load crewAI and build the evaluator agents, unless the gunicorn master did
+    if STARTUP_LOAD == "eager":
+        await ensure_analysis_loaded()
+    loading = asyncio.ensure_future(load_in_background())
+    # Start the preprocessing processes before the first large page needs them
+    preprocess_pool.start()
+    # Start the workers of the analysis job queue
+    job_workers.start()
+    # Keep the analysis history bounded, away from the requests that record it
+    compacting = asyncio.ensure_future(compact_periodically(history_store)) if history_store else None
+    # Share this worker's metrics with the others, see core.metrics.SharedMetrics
+    sharing = asyncio.ensure_future(shared_metrics.write_periodically()) if shared_metrics else None
+    yield
+    loading.cancel()
+    if compacting is not None:
+        compacting.cancel()
+    if sharing is not None:
+        sharing.cancel()
+        # What this worker counted keeps counting once it exits
+        await asyncio.to_thread(shared_metrics.write)
+    await job_workers.stop()
+    preprocess_pool.shutdown()
+    await page_fetcher.aclose()
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Web QA Analyzer API",
     description="Analyzes web pages for quality issues using CrewAI and LLMs",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -24,6 +72,11 @@ app.add_middleware(
 
 # Include API routes
 app.include_router(api_router)
+app.include_router(batch_router)
+app.include_router(stream_router)
+app.include_router(jobs_router)
+app.include_router(history_router)
+app.include_router(metrics_router)
 
 # Root endpoint
 @app.get("/")
@@ -37,8 +90,8 @@ async def root():
 if __name__ == "__main__":
     # Make sure OPENAI_API_KEY is set
     if not os.getenv("OPENAI_API_KEY"):
-        print("Warning: OPENAI_API_KEY environment variable is not set")
-        print("Set it with: export OPENAI_API_KEY='your-api-key'")
+        logger.warning("OPENAI_API_KEY environment variable is not set")
+        logger.warning("Set it with: export OPENAI_API_KEY='your-api-key'")
     
     # Run the application
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
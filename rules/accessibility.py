@@ -0,0 +1,70 @@
+from bs4 import BeautifulSoup, Tag
+from typing import Dict, Iterable, List
+
+from rules.engine import Rule
+
+# Input types that need no visible label
+UNLABELED_INPUT_TYPES = frozenset(["hidden", "submit", "reset", "button", "image"])
+
+
+class MissingAltRule(Rule):
+    name = "missing-alt"
+    type = "accessibility"
+    severity = "critical"
+    tags = frozenset(["img"])
+    covers = "Images without an alt attribute"
+
+    def visit(self, tag: Tag) -> Iterable[Dict]:
+        if not tag.has_attr("alt") and tag.get("role") != "presentation" and tag.get("aria-hidden") != "true":
+            yield self.issue("Image lacks alt text for screen readers", tag)
+
+
+class MissingLangRule(Rule):
+    name = "missing-lang"
+    type = "accessibility"
+    tags = frozenset(["html"])
+    covers = "Missing lang attribute on the <html> element"
+
+    def __init__(self):
+        self.seen = False
+
+    def visit(self, tag: Tag) -> Iterable[Dict]:
+        self.seen = True
+        if not (tag.get("lang") or "").strip():
+            yield self.issue("Document language is not declared with a lang attribute on <html>", tag)
+
+    def finish(self, soup: BeautifulSoup) -> Iterable[Dict]:
+        if not self.seen:
+            yield self.issue("Document has no <html> element declaring its language")
+
+
+class UnlabeledInputRule(Rule):
+    name = "unlabeled-input"
+    type = "accessibility"
+    severity = "critical"
+    tags = frozenset(["input", "select", "textarea", "label"])
+    covers = "Form inputs, selects and textareas without an associated label"
+
+    def __init__(self):
+        self.label_targets = set()
+        self.candidates: List[Tag] = []
+
+    def visit(self, tag: Tag) -> Iterable[Dict]:
+        if tag.name == "label":
+            if tag.get("for"):
+                self.label_targets.add(tag["for"])
+            return ()
+        if tag.name == "input" and (tag.get("type") or "text").lower() in UNLABELED_INPUT_TYPES:
+            return ()
+        if tag.get("aria-label") or tag.get("aria-labelledby") or tag.get("title"):
+            return ()
+        if tag.find_parent("label") is not None:
+            return ()
+        # A <label for> may come after the input: decide once the whole document is seen
+        self.candidates.append(tag)
+        return ()
+
+    def finish(self, soup: BeautifulSoup) -> Iterable[Dict]:
+        for tag in self.candidates:
+            if tag.get("id") not in self.label_targets:
+                yield self.issue(f"Form field <{tag.name}> has no associated label", tag)
@@ -0,0 +1,137 @@
+from bs4 import BeautifulSoup, Tag
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+
+def describe_element(tag: Tag, limit: int = 200) -> str:
+    """
+    Returns the opening tag of an element, as quoted in issues.
+    """
+    attributes = []
+    for name, value in tag.attrs.items():
+        if isinstance(value, list):
+            value = " ".join(value)
+        attributes.append(f' {name}="{value}"')
+    opening = f"<{tag.name}{''.join(attributes)}>"
+    return opening if len(opening) <= limit else opening[:limit - 4] + "...>"
+
+
+class Rule:
+    """
+    A deterministic check run on the raw document before any agent sees it.
+
+    Subclasses set the class attributes and override visit, called for every
+    element whose name is in tags (every element when tags is None), and/or
+    finish, called once after the traversal for document-level checks. Both
+    return issues built with self.issue. A fresh instance is created for every
+    document, so rules can keep state between calls.
+    """
+
+    # Unique name of the rule, used in issue ids
+    name = "rule"
+    # Evaluator whose findings the rule replaces (ux, accessibility, html, performance)
+    type = "html"
+    severity = "warning"
+    # Element names the rule looks at, None for every element
+    tags: Optional[FrozenSet[str]] = None
+    # What the rule checks, listed in the evaluator's prompt so the agent skips it
+    covers = ""
+
+    def visit(self, tag: Tag) -> Iterable[Dict]:
+        return ()
+
+    def finish(self, soup: BeautifulSoup) -> Iterable[Dict]:
+        return ()
+
+    def issue(self, message: str, tag: Optional[Tag] = None, severity: Optional[str] = None) -> Dict:
+        """
+        Builds an issue of this rule about an element, with its exact source line.
+        """
+        return {
+            "id": self.name,
+            "type": self.type,
+            "severity": severity or self.severity,
+            "message": message,
+            "element": describe_element(tag) if tag is not None else None,
+            "line": tag.sourceline if tag is not None else None
+        }
+
+
+class RuleEngine:
+    """
+    Runs a set of rules over a document in a single traversal.
+    """
+
+    def __init__(self, rules: List[type]):
+        """
+        Initialize the engine.
+
+        Args:
+            rules: Rule subclasses to run, instantiated for every document
+        """
+        self.rules = list(rules)
+
+    def register(self, rule: type) -> type:
+        """
+        Adds a rule to the engine. Usable as a class decorator.
+        """
+        self.rules.append(rule)
+        return rule
+
+    def covered_checks(self, evaluator: str) -> List[str]:
+        """
+        Returns what the rules check for an evaluator, to be left out of its prompt.
+        """
+        return [rule.covers for rule in self.rules if rule.type == evaluator and rule.covers]
+
+    def run(self, soup: BeautifulSoup) -> List[Dict]:
+        """
+        Runs every rule over a document.
+
+        Args:
+            soup: The raw, uncleaned document, parsed with line numbers
+
+        Returns:
+            List[Dict]: Issues in the format of the agents' issues, with ids
+            numbered per rule (e.g. "missing-alt-1")
+        """
+        rules = [rule() for rule in self.rules]
+        by_tag: Dict[str, List[Rule]] = {}
+        every_tag = [rule for rule in rules if rule.tags is None]
+        for rule in rules:
+            for name in rule.tags or ():
+                by_tag.setdefault(name, []).append(rule)
+
+        issues = []
+        for element in soup.descendants:
+            if not isinstance(element, Tag):
+                continue
+            for rule in by_tag.get(element.name, ()):
+                issues.extend(rule.visit(element))
+            for rule in every_tag:
+                issues.extend(rule.visit(element))
+        for rule in rules:
+            issues.extend(rule.finish(soup))
+
+        counts: Dict[str, int] = {}
+        for issue in issues:
+            counts[issue["id"]] = counts.get(issue["id"], 0) + 1
+            issue["id"] = f"{issue['id']}-{counts[issue['id']]}"
+        return issues
+
+
+def create_default_engine() -> RuleEngine:
+    """
+    Creates an engine with every built-in rule.
+    """
+    from rules.accessibility import MissingAltRule, MissingLangRule, UnlabeledInputRule
+    from rules.html import HeadingOrderRule, DuplicateIdRule
+    from rules.performance import ImageDimensionsRule, RenderBlockingResourceRule
+
+    return RuleEngine([
+        MissingAltRule, MissingLangRule, UnlabeledInputRule,
+        HeadingOrderRule, DuplicateIdRule,
+        ImageDimensionsRule, RenderBlockingResourceRule,
+    ])
+
+
+rule_engine = create_default_engine()
@@ -0,0 +1,43 @@
+from bs4 import BeautifulSoup, Tag
+from typing import Dict, Iterable, List
+
+from rules.engine import Rule
+
+HEADINGS = frozenset(["h1", "h2", "h3", "h4", "h5", "h6"])
+
+
+class HeadingOrderRule(Rule):
+    name = "heading-order"
+    type = "html"
+    tags = HEADINGS
+    covers = "Heading levels that skip a level (e.g. <h2> followed by <h4>)"
+
+    def __init__(self):
+        self.level = 0
+
+    def visit(self, tag: Tag) -> Iterable[Dict]:
+        level = int(tag.name[1])
+        if self.level and level > self.level + 1:
+            yield self.issue(f"Heading level skips from h{self.level} to h{level}", tag)
+        elif not self.level and level > 1:
+            yield self.issue(f"First heading of the page is h{level} instead of h1", tag, severity="info")
+        self.level = level
+
+
+class DuplicateIdRule(Rule):
+    name = "duplicate-id"
+    type = "html"
+    covers = "Duplicate id attributes"
+
+    def __init__(self):
+        self.seen = {}
+
+    def visit(self, tag: Tag) -> Iterable[Dict]:
+        element_id = tag.get("id")
+        if not element_id:
+            return ()
+        if element_id in self.seen:
+            first_line = self.seen[element_id]
+            return (self.issue(f"Duplicate id '{element_id}' (first used on line {first_line})", tag),)
+        self.seen[element_id] = tag.sourceline
+        return ()
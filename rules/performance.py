@@ -0,0 +1,34 @@
+from bs4 import Tag
+from typing import Dict, Iterable
+
+from rules.engine import Rule
+
+
+class ImageDimensionsRule(Rule):
+    name = "image-dimensions"
+    type = "performance"
+    tags = frozenset(["img"])
+    covers = "Images without width and height attributes (layout shift)"
+
+    def visit(self, tag: Tag) -> Iterable[Dict]:
+        if not (tag.get("width") and tag.get("height")):
+            yield self.issue("Image has no explicit width and height, which causes layout shifts while loading", tag)
+
+
+class RenderBlockingResourceRule(Rule):
+    name = "render-blocking"
+    type = "performance"
+    tags = frozenset(["script", "link"])
+    covers = "Render-blocking scripts and stylesheets in <head>"
+
+    def visit(self, tag: Tag) -> Iterable[Dict]:
+        if tag.find_parent("head") is None:
+            return ()
+        if tag.name == "script":
+            if tag.get("src") and not tag.has_attr("async") and not tag.has_attr("defer") \
+                    and (tag.get("type") or "").lower() != "module":
+                return (self.issue("Script in <head> blocks rendering, load it with async or defer", tag),)
+        elif "stylesheet" in (tag.get("rel") or []) and (tag.get("media") or "all") in ("all", "screen"):
+            return (self.issue("Stylesheet in <head> blocks rendering, inline critical CSS and load the rest "
+                               "asynchronously", tag, severity="info"),)
+        return ()
@@ -1,14 +1,19 @@
 from crewai import Task
-from typing import Any
+from typing import Any, List, Optional
 
-def create_analyze_html_task(agent: Any, html_content: str, url: str) -> Task:
+from crew.output import IssueReport
+
+def create_analyze_html_task(agent: Any, html_content: str, url: str, section: str = "the whole page",
+                             covered: Optional[List[str]] = None) -> Task:
     """
     Creates a task for analyzing HTML structure issues in a web page.
     
     Args:
         agent: The agent to assign this task to
-        html_content: HTML content of the web page
+        html_content: HTML content of the web page, or of one chunk of it
         url: URL of the web page
+        section: Which part of the page html_content holds (see HtmlChunk.describe)
+        covered: Checks already made by the rule engine, left out of the analysis
         
     Returns:
         Task: CrewAI Task for HTML analysis
@@ -23,25 +28,37 @@ def create_analyze_html_task(agent: Any, html_content: str, url: str) -> Task:
             "line": 78
         }
     ]
+    skipped_checks = ""
+    if covered:
+        skipped_checks = "These checks were already made automatically, do not report them:\n" + \
+            "\n".join(f"        - {check}" for check in covered)
     return Task(
         description=f"""
         Analyze the HTML content from {url} for HTML structure, semantics, and best practices issues.
         
+        The HTML below is {section}, minified with one element per line. Each line starts
+        with the line number of that element in the original document (e.g. 'L23:').
+        Elements repeated with the same structure (cards, list items, rows) are shown once,
+        followed by a comment such as '<!-- 11 more <li> with the same structure -->': report
+        issues of the repeated elements once, on the one shown.
+        
         HTML Content:
         ```html
-        {html_content[:5000]}... (truncated for brevity)
+        {html_content}
         ```
         
+        {skipped_checks}
+        
         For each issue identified, provide:
         - A unique ID with prefix 'h' (e.g., 'h1', 'h2')
         - Type: 'html'
         - Severity: one of ['info', 'warning', 'critical']
         - A clear message describing the issue
         - The affected HTML element (if applicable)
-        - Approximate line number (if possible to determine)
+        - The line number from the 'L<n>:' prefix of the line holding the element
         
-        Your output should be a valid JSON list of issues in the following format:
-        [
+        Your output should be a valid JSON object holding the list of issues in the following format:
+        {{"issues": [
             {{
                 "id": "h1",
                 "type": "html",
@@ -51,8 +68,9 @@ def create_analyze_html_task(agent: Any, html_content: str, url: str) -> Task:
                 "line": 78
             }},
             ...
-        ]
+        ]}}
         """,
         agent=agent,
-        expected_output="A JSON-formatted list of html issues, each containing 'id', 'type', 'severity', 'message', 'element', and 'line' fields."
+        response_model=IssueReport,
+        expected_output="A JSON object whose 'issues' list holds the html issues, each containing 'id', 'type', 'severity', 'message', 'element', and 'line' fields."
     )
\ No newline at end of file
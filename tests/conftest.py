@@ -0,0 +1,6 @@
+import os
+
+# core.llm builds its provider clients on import; nothing here reaches them
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("CREWAI_DISABLE_TELEMETRY", "true")
+os.environ.setdefault("OTEL_SDK_DISABLED", "true")
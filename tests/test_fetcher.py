@@ -0,0 +1,123 @@
+"""
+Tests of PageFetcher (utils.fetcher): the size limit, conditional requests,
+decoding and the bookkeeping of clients and hosts, against the local server of
+benchmarks.stub_server.
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from benchmarks.stub_server import StubServer
+from utils.fetcher import PageFetcher, PageTooLargeError, detect_encoding
+
+PAGE = "<html><head><title>Café</title></head><body><p>Bonjour</p></body></html>"
+
+
+@pytest.fixture
+def stub():
+    with StubServer({"/page.html": PAGE}) as server:
+        yield server
+
+
+async def fetch(fetcher: PageFetcher, url: str, **validators):
+    try:
+        return await fetcher.fetch(url, **validators)
+    finally:
+        await fetcher.aclose()
+
+
+def test_page_is_decoded_with_its_validators(stub):
+    page = asyncio.run(fetch(PageFetcher(), stub.url("/page.html")))
+
+    assert (page.status_code, page.text, page.encoding) == (200, PAGE, "utf-8")
+    assert page.size == len(PAGE.encode("utf-8"))
+    assert page.etag and page.last_modified and not page.not_modified
+
+
+def test_page_larger_than_the_limit_is_refused(stub):
+    stub.set_page("/large.html", "<p>text</p>" * 1000)
+
+    with pytest.raises(PageTooLargeError):
+        asyncio.run(fetch(PageFetcher(max_bytes=1000), stub.url("/large.html")))
+
+
+def test_page_without_content_length_stops_at_the_limit(stub):
+    stub.set_page("/large.html", "<p>text</p>" * 100_000, content_length=False)
+
+    with pytest.raises(PageTooLargeError):
+        asyncio.run(fetch(PageFetcher(max_bytes=1000), stub.url("/large.html")))
+    stub.set_page("/small.html", PAGE, content_length=False)
+    assert asyncio.run(fetch(PageFetcher(max_bytes=1000), stub.url("/small.html"))).text == PAGE
+
+
+@pytest.mark.parametrize("validator", ["etag", "last_modified"])
+def test_unchanged_page_is_not_downloaded_again(stub, validator):
+    url = stub.url("/page.html")
+    first = asyncio.run(fetch(PageFetcher(), url))
+
+    again = asyncio.run(fetch(PageFetcher(), url, **{validator: getattr(first, validator)}))
+    assert (again.status_code, again.not_modified, again.text) == (304, True, "")
+    assert again.etag == first.etag
+    assert stub.not_modified == 1
+
+
+def test_changed_page_is_downloaded_again(stub):
+    url = stub.url("/page.html")
+    first = asyncio.run(fetch(PageFetcher(), url))
+    stub.set_page("/page.html", PAGE.replace("Bonjour", "Bonsoir"))
+
+    again = asyncio.run(fetch(PageFetcher(), url, etag=first.etag))
+    assert again.status_code == 200 and "Bonsoir" in again.text
+    assert again.etag != first.etag
+
+
+def test_error_status_is_raised(stub):
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(fetch(PageFetcher(), stub.url("/missing.html")))
+
+
+def test_hosts_are_forgotten_once_idle(stub):
+    fetcher = PageFetcher(per_host=2)
+
+    async def fetch_many():
+        await asyncio.gather(*(fetcher.fetch(stub.url("/page.html")) for _ in range(5)))
+        hosts = dict(fetcher._hosts)
+        await fetcher.aclose()
+        return hosts
+
+    assert asyncio.run(fetch_many()) == {}
+    assert stub.requests["/page.html"] == 5
+
+
+def test_client_of_a_finished_event_loop_is_closed(stub):
+    fetcher = PageFetcher()
+
+    async def fetch_and_keep_client():
+        await fetcher.fetch(stub.url("/page.html"))
+        return fetcher._client
+
+    first = asyncio.run(fetch_and_keep_client())
+    second = asyncio.run(fetch_and_keep_client())
+    assert second is not first
+    assert first.is_closed and not second.is_closed
+    asyncio.run(fetcher.aclose())
+
+
+def test_shared_client_is_left_open():
+    client = httpx.AsyncClient()
+    asyncio.run(PageFetcher(client).aclose())
+    assert not client.is_closed
+
+
+@pytest.mark.parametrize("content, content_type, encoding", [
+    (b"\xef\xbb\xbf<p>x</p>", "text/html; charset=iso-8859-1", "utf-8-sig"),
+    (b"<p>x</p>", "text/html; charset=ISO-8859-1", "cp1252"),
+    (b"<p>x</p>", "text/html; charset=unknown", "utf-8"),
+    (b'<meta charset="shift_jis"><p>x</p>', "text/html", "shift_jis"),
+    (b'<meta http-equiv="Content-Type" content="text/html; charset=koi8-r">', None, "koi8-r"),
+    (b'<meta charset="utf-16"><p>x</p>', None, "utf-8"),
+    (b"<p>x</p>", None, "utf-8"),
+])
+def test_detect_encoding(content, content_type, encoding):
+    assert detect_encoding(content, content_type) == encoding
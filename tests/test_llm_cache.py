@@ -0,0 +1,270 @@
+"""
+Tests of CachingLLM (core.llm): the response cache and the coalescing of
+concurrent identical calls, against a fake LLM counting the calls it gets.
+"""
+from crewai import BaseLLM
+from pydantic import PrivateAttr
+from typing import Any, Dict, List, Optional, Tuple
+import threading
+import time
+
+import pytest
+
+from core.cache import MemoryResultCache
+from core.deadline import AnalysisCancelledError, start_deadline
+from core.llm import CachingLLM
+from crew.output import AgentIssue, IssueReport
+
+PROMPT = [{"role": "system", "content": "You review HTML."}, {"role": "user", "content": "L1: <img src='a.png'>"}]
+
+
+class CountingLLM(BaseLLM):
+    """
+    Answers "answer <n>" to its n-th call, or an IssueReport when one is requested.
+
+    The calls can be held until released, and fail with the exceptions queued
+    in failures, one per call.
+    """
+
+    _prompts: List[Any] = PrivateAttr(default_factory=list)
+    _failures: List[BaseException] = PrivateAttr(default_factory=list)
+    _started: threading.Event = PrivateAttr(default_factory=threading.Event)
+    _release: threading.Event = PrivateAttr(default_factory=threading.Event)
+
+    def __init__(self, model: str = "gpt-test", hold: bool = False, **kwargs: Any):
+        super().__init__(model=model, temperature=0.2, **kwargs)
+        if not hold:
+            self._release.set()
+
+    def call(self, messages: Any, tools: Optional[List[Dict]] = None, callbacks: Optional[List[Any]] = None,
+             available_functions: Optional[Dict[str, Any]] = None, from_task: Any = None,
+             from_agent: Any = None, response_model: Any = None) -> Any:
+        self._prompts.append(messages)
+        self._started.set()
+        self._release.wait(5)
+        if self._failures:
+            raise self._failures.pop(0)
+        if response_model is not None:
+            return response_model(issues=[AgentIssue(type="html", severity="warning",
+                                                     message=f"Issue {len(self._prompts)}", line=1)])
+        return f"answer {len(self._prompts)}"
+
+    @property
+    def calls(self) -> int:
+        return len(self._prompts)
+
+    def supports_function_calling(self) -> bool:
+        return False
+
+    def supports_stop_words(self) -> bool:
+        return True
+
+    def get_context_window_size(self) -> int:
+        return 8192
+
+
+def make_llm(inner: CountingLLM, cached: bool = True) -> CachingLLM:
+    return CachingLLM(inner, cache=MemoryResultCache(ttl=60, max_entries=100) if cached else None)
+
+
+def run_in_threads(llm: CachingLLM, count: int,
+                   deadline: Optional[float] = None) -> Tuple[List[threading.Thread], List[Any]]:
+    """
+    Makes the PROMPT call from count threads at once.
+
+    Returns:
+        Tuple[List[threading.Thread], List[Any]]: The threads, and the answer
+            or exception of each, filled in as they finish
+    """
+    results: List[Any] = [None] * count
+
+    def run(index: int) -> None:
+        if deadline is not None:
+            start_deadline(deadline)
+        try:
+            results[index] = llm.call(PROMPT)
+        except BaseException as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def wait_for_waiters(llm: CachingLLM, count: int) -> None:
+    """
+    Waits until count calls reached the wrapper, and a little more for them to block.
+    """
+    limit = time.monotonic() + 5
+    while llm.stats()["calls"] < count and time.monotonic() < limit:
+        time.sleep(0.005)
+    time.sleep(0.05)
+
+
+def test_miss_then_hit():
+    inner = CountingLLM()
+    llm = make_llm(inner)
+
+    assert llm.call(PROMPT) == "answer 1"
+    assert llm.call(PROMPT) == "answer 1"
+
+    assert inner.calls == 1
+    stats = llm.stats()
+    assert stats["calls"] == 2
+    assert stats["hits"] == 1
+    assert stats["hit_rate"] == 0.5
+    assert stats["tokens_saved"] > 0
+
+
+def test_failures_are_not_cached():
+    inner = CountingLLM()
+    inner._failures.append(RuntimeError("provider down"))
+    llm = make_llm(inner)
+
+    with pytest.raises(RuntimeError):
+        llm.call(PROMPT)
+    assert llm.call(PROMPT) == "answer 2"
+    assert inner.calls == 2
+
+
+def test_key_ignores_whitespace_only():
+    llm = make_llm(CountingLLM())
+    spaced = [{"role": "system", "content": "You   review\nHTML. "}, PROMPT[1]]
+
+    assert llm.cache_key(spaced) == llm.cache_key(PROMPT)
+    assert llm.cache_key(PROMPT[1]["content"]) == llm.cache_key([PROMPT[1]])
+    assert llm.cache_key([PROMPT[0], {"role": "user", "content": "L1: <img src='b.png'>"}]) != llm.cache_key(PROMPT)
+    assert llm.cache_key([{"role": "assistant", "content": PROMPT[1]["content"]}]) != llm.cache_key([PROMPT[1]])
+
+
+def test_key_depends_on_model_and_response_model():
+    cache = MemoryResultCache(ttl=60, max_entries=100)
+    first, second = CountingLLM("gpt-test"), CountingLLM("gpt-other")
+    llm, other = CachingLLM(first, cache=cache), CachingLLM(second, cache=cache)
+
+    assert llm.cache_key(PROMPT) != other.cache_key(PROMPT)
+    assert llm.cache_key(PROMPT) != llm.cache_key(PROMPT, IssueReport)
+
+    # One cache shared by two models: each answers its own calls
+    assert llm.call(PROMPT) == "answer 1"
+    assert other.call(PROMPT) == "answer 1"
+    assert isinstance(llm.call(PROMPT, response_model=IssueReport), IssueReport)
+    assert (first.calls, second.calls) == (2, 1)
+
+
+def test_structured_answer_round_trip():
+    inner = CountingLLM()
+    llm = make_llm(inner)
+
+    answer = llm.call(PROMPT, response_model=IssueReport)
+    cached = llm.call(PROMPT, response_model=IssueReport)
+
+    assert inner.calls == 1
+    assert isinstance(cached, IssueReport)
+    assert cached is not answer
+    assert cached == answer
+    assert cached.issues[0].message == "Issue 1"
+
+
+def test_calls_with_tools_are_passed_through():
+    inner = CountingLLM()
+    llm = make_llm(inner)
+
+    llm.call(PROMPT, tools=[{"name": "search"}])
+    llm.call(PROMPT, tools=[{"name": "search"}])
+
+    assert inner.calls == 2
+    assert llm.stats()["calls"] == 0
+
+
+def test_concurrent_calls_are_coalesced():
+    inner = CountingLLM(hold=True)
+    llm = make_llm(inner, cached=False)
+
+    threads, results = run_in_threads(llm, 5)
+    wait_for_waiters(llm, 5)
+    inner._release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert inner.calls == 1
+    assert results == ["answer 1"] * 5
+    assert llm.stats()["coalesced"] == 4
+
+
+def test_failure_of_the_leader_reaches_the_waiters():
+    inner = CountingLLM(hold=True)
+    inner._failures.append(RuntimeError("provider down"))
+    llm = make_llm(inner)
+
+    threads, results = run_in_threads(llm, 4)
+    wait_for_waiters(llm, 4)
+    inner._release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert inner.calls == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+    # Nothing was cached: the next call reaches the provider
+    assert llm.call(PROMPT) == "answer 2"
+
+
+def test_cancelled_leader_hands_the_call_to_a_waiter():
+    inner = CountingLLM(hold=True)
+    inner._failures.append(AnalysisCancelledError("the client disconnected"))
+    llm = make_llm(inner)
+
+    threads, results = run_in_threads(llm, 4)
+    wait_for_waiters(llm, 4)
+    inner._release.set()
+    for thread in threads:
+        thread.join(5)
+
+    # The leader gave up, one waiter made the call again for the others
+    assert inner.calls == 2
+    assert sum(isinstance(result, AnalysisCancelledError) for result in results) == 1
+    assert sorted(result for result in results if isinstance(result, str)) == ["answer 2"] * 3
+
+
+def test_waiters_give_up_at_their_deadline():
+    inner = CountingLLM(hold=True)
+    llm = make_llm(inner)
+
+    leader, leader_result = run_in_threads(llm, 1)
+    assert inner._started.wait(5)
+    start = time.monotonic()
+    waiter, waiter_result = run_in_threads(llm, 1, deadline=0.1)
+    waiter[0].join(5)
+    assert isinstance(waiter_result[0], AnalysisCancelledError)
+    assert time.monotonic() - start < 2
+
+    # The leader still gets its answer
+    inner._release.set()
+    leader[0].join(5)
+    assert leader_result == ["answer 1"]
+    assert inner.calls == 1
+
+
+def test_slow_cache_lookup_does_not_hold_up_other_calls():
+    other = [PROMPT[0], {"role": "user", "content": "L1: <p>Other page</p>"}]
+    release = threading.Event()
+
+    class SlowCache(MemoryResultCache):
+        def get(self, key):
+            if key == slow_key:
+                release.wait(5)
+            return super().get(key)
+
+    llm = CachingLLM(CountingLLM(), cache=SlowCache(ttl=60, max_entries=100))
+    slow_key = llm.cache_key(PROMPT)
+    threads, results = run_in_threads(llm, 1)
+    wait_for_waiters(llm, 1)
+
+    # The first call is still reading the cache
+    start = time.monotonic()
+    assert llm.call(other) == "answer 1"
+    assert time.monotonic() - start < 1
+    release.set()
+    threads[0].join(5)
+    assert results == ["answer 2"]
@@ -0,0 +1,164 @@
+"""
+Tests of LLMRouter (core.router): escalation from the cheap model, retries,
+failover and rate limits, against the local OpenAI-compatible endpoint of
+benchmarks.fake_openai.
+"""
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+import contextvars
+import threading
+import time
+
+import pytest
+
+from benchmarks.fake_openai import FakeModel, FakeOpenAIServer
+from core.deadline import AnalysisCancelledError, start_deadline
+from core.router import LLMRouter, RateLimitTimeoutError, TokenBucket
+from crew.output import IssueReport, is_valid_report
+import core.llm
+
+PROMPT = [{"role": "user", "content": "Review the page. L1: <img src='a.png'>"}]
+TASK = SimpleNamespace(name="html", id=1, description="")
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    """
+    Starts a fake endpoint and points core.llm.create_model at it.
+
+    Yields a function that configures the behaviour of its models, see FakeModel.
+    """
+    server = FakeOpenAIServer().start()
+    monkeypatch.setattr(core.llm, "LLM_BASE_URL", server.base_url)
+
+    def configure(**models: FakeModel) -> FakeOpenAIServer:
+        server.models.update(models)
+        return server
+
+    yield configure
+    server.stop()
+
+
+def make_router(names: List[str], default_model: str, rate_limits: Optional[Dict[str, Any]] = None,
+                **kwargs: Any) -> LLMRouter:
+    kwargs.setdefault("retry_base_delay", 0.01)
+    return LLMRouter({name: core.llm.create_model(name) for name in names}, default_model,
+                     rate_limits=rate_limits, is_valid=is_valid_report, **kwargs)
+
+
+def test_valid_cheap_answer_is_kept(fake_openai):
+    server = fake_openai()
+    router = make_router(["cheap", "strong"], "strong", cheap_model="cheap")
+
+    assert is_valid_report(router.call(PROMPT, from_task=TASK))
+    assert (server.count("cheap"), server.count("strong")) == (1, 0)
+
+
+def test_broken_cheap_answer_is_escalated(fake_openai):
+    server = fake_openai(cheap=FakeModel(broken=1.0))
+    router = make_router(["cheap", "strong"], "strong", cheap_model="cheap")
+
+    assert is_valid_report(router.call(PROMPT, from_task=TASK))
+    assert (server.count("cheap"), server.count("strong")) == (1, 1)
+
+
+def test_structured_answer_that_does_not_validate_is_escalated(fake_openai):
+    server = fake_openai(cheap=FakeModel(broken=1.0))
+    router = make_router(["cheap", "strong"], "strong", cheap_model="cheap")
+
+    report = router.call(PROMPT, from_task=TASK, response_model=IssueReport)
+    assert isinstance(report, IssueReport)
+    assert (server.count("cheap"), server.count("strong")) == (1, 1)
+
+
+def test_large_prompts_skip_the_cheap_model(fake_openai):
+    server = fake_openai()
+    router = make_router(["cheap", "strong"], "strong", cheap_model="cheap", cheap_max_tokens=100)
+
+    router.call([{"role": "user", "content": "<p>text</p>" * 100}], from_task=TASK)
+    assert (server.count("cheap"), server.count("strong")) == (0, 1)
+
+
+def test_evaluators_are_routed_to_their_model(fake_openai):
+    server = fake_openai()
+    router = make_router(["strong", "ux-model"], "strong", evaluator_models={"ux": "ux-model"})
+
+    router.call(PROMPT, from_task=SimpleNamespace(name="ux", id=2, description=""))
+    router.call(PROMPT, from_task=TASK)
+    assert (server.count("ux-model"), server.count("strong")) == (1, 1)
+
+
+def test_rate_limited_calls_are_retried_then_fail_over(fake_openai):
+    server = fake_openai(flaky=FakeModel(rate_limited=1.0))
+    router = make_router(["flaky", "backup"], "flaky", fallback_models=["backup"], retries=2)
+
+    assert is_valid_report(router.call(PROMPT, from_task=TASK))
+    assert server.count("flaky", 429) == 3
+    assert server.count("backup", 200) == 1
+
+
+def test_retries_wait_for_retry_after(fake_openai):
+    server = fake_openai(flaky=FakeModel(rate_limited=1.0, retry_after=0.3))
+    router = make_router(["flaky"], "flaky", retries=1, retry_max_delay=1.0)
+
+    start = time.monotonic()
+    with pytest.raises(Exception):
+        router.call(PROMPT, from_task=TASK)
+    assert time.monotonic() - start >= 0.3
+    assert server.count("flaky", 429) == 2
+
+
+def test_server_errors_fail_over_once_retries_are_spent(fake_openai):
+    server = fake_openai(broken=FakeModel(errors=1.0))
+    router = make_router(["broken", "backup"], "broken", fallback_models=["backup"], retries=1)
+
+    assert is_valid_report(router.call(PROMPT, from_task=TASK))
+    assert (server.count("broken", 500), server.count("backup", 200)) == (2, 1)
+
+
+def test_exhausted_rate_limit_fails_over(fake_openai):
+    server = fake_openai()
+    router = make_router(["strong", "backup"], "strong", fallback_models=["backup"],
+                         rate_limits={"strong": (1, 1_000_000)}, rate_limit_timeout=0.1)
+
+    router.call(PROMPT, from_task=TASK)
+    start = time.monotonic()
+    router.call(PROMPT, from_task=TASK)
+    assert time.monotonic() - start < 1
+    assert (server.count("strong"), server.count("backup")) == (1, 1)
+
+
+def test_cancelled_request_makes_no_call(fake_openai):
+    server = fake_openai()
+    router = make_router(["strong"], "strong")
+
+    # The deadline stays in a context of its own, like that of a request
+    context = contextvars.copy_context()
+    context.run(start_deadline).cancel("disconnect")
+    with pytest.raises(AnalysisCancelledError):
+        context.run(router.call, PROMPT, from_task=TASK)
+    assert server.count("strong") == 0
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(600)
+    bucket.take(600, time.monotonic() + 1)
+
+    start = time.monotonic()
+    bucket.take(1, time.monotonic() + 1)
+    assert 0.05 <= time.monotonic() - start < 0.5
+    with pytest.raises(RateLimitTimeoutError):
+        bucket.take(300, time.monotonic() + 1)
+
+
+def test_token_bucket_wait_stops_when_the_request_is_cancelled():
+    bucket = TokenBucket(1)
+    bucket.take(1, time.monotonic() + 1)
+    context = contextvars.copy_context()
+    deadline = context.run(start_deadline)
+    threading.Timer(0.1, deadline.cancel, args=("disconnect",)).start()
+
+    start = time.monotonic()
+    with pytest.raises(AnalysisCancelledError):
+        context.run(bucket.take, 1, time.monotonic() + 120)
+    assert time.monotonic() - start < 2
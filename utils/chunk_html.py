@@ -0,0 +1,488 @@
+from bs4 import BeautifulSoup, NavigableString, Tag
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import re
+import zlib
+
+from core.config import CHUNK_TOKEN_BUDGET, CHUNK_TOKEN_BUDGETS, TEMPLATE_MIN_REPEATS
+from utils.templates import ShapeMemo, repeated_siblings
+from utils.views import DocumentView, FULL_VIEW
+
+# Elements that delimit the sections of a page. A section that fits in a chunk is
+# never split across two chunks.
+STRUCTURAL_TAGS = frozenset(["header", "nav", "main", "section", "article", "aside", "footer"])
+
+# Rough number of characters per token for minified HTML
+CHARS_PER_TOKEN = 4
+
+WHITESPACE = re.compile(r"\s+")
+
+# Longest line of a chunk, in tokens. Larger elements are written as their
+# opening tag followed by their children, which keeps line numbers precise.
+LINE_TOKENS = 100
+
+# Once a chunk is half full, it also ends after any line whose checksum is a
+# multiple of ANCHOR_EVERY. Boundaries then depend on content rather than on
+# position, so an edit near the top of a page only changes the chunks around it.
+ANCHOR_EVERY = 8
+
+# Lines of the copies of a repeated template listed in its placeholder comment
+MAX_LISTED_COPIES = 20
+
+# The line numbers in a placeholder comment, left out of the chunk fingerprint
+PLACEHOLDER_LINES = re.compile(r"(<!-- \d+ more <\w+> with the same structure)[^>]*(-->)")
+
+
+@dataclass
+class Block:
+    """
+    One line of a chunk: an element or text, with the source line it starts on.
+
+    The opening line of a split structural section also records the section name
+    and how many lines the section spans.
+    """
+    html: str
+    line: Optional[int] = None
+    section: Optional[str] = None
+    span: int = 1
+
+
+@dataclass
+class RepeatedTemplate:
+    """
+    Sibling elements sharing one structure, of which the agents only see the first.
+
+    Attributes:
+        elements: (source line, opening tag) of the element shown to the agents
+            and of each of its descendants, in document order
+        copies: The same for every other copy, aligned with elements
+    """
+    elements: List[Tuple[Optional[int], str]]
+    copies: List[List[Tuple[Optional[int], str]]]
+
+    @property
+    def lines(self) -> List[int]:
+        return [line for line, _ in self.elements if line]
+
+    def locate(self, issue: Dict) -> Optional[int]:
+        """
+        Returns the index in elements of the element an issue is about, None if
+        the issue is not about the element shown or one of its descendants.
+        """
+        element = issue.get("element")
+        needles = _element_needles(element) if isinstance(element, str) and element.strip() else []
+        line = issue.get("line")
+        on_line = [index for index, (source_line, _) in enumerate(self.elements)
+                   if line and source_line == line]
+        if on_line:
+            if not needles:
+                # On compact markup the copies share lines, a line alone cannot tell them apart
+                shared = {source_line for source_line, _ in self.copies[0]} if self.copies else set()
+                return on_line[0] if line not in shared else None
+            return next((index for index in on_line if all(needle in self.elements[index][1]
+                                                           for needle in needles)), None)
+        # Elements rendered inside the line of their parent: match on attribute values
+        if len(needles) > 1:
+            return next((index for index, (_, opening) in enumerate(self.elements)
+                         if all(needle in opening for needle in needles)), None)
+        return None
+
+
+@dataclass
+class HtmlChunk:
+    """
+    A piece of a cleaned page sized to fit in one prompt.
+
+    Every line of content holds one element and starts with the line it comes
+    from in the original document, e.g. "L23: <img src='logo.png'>". The
+    fingerprint hashes the content without those line numbers, so a chunk keeps
+    its fingerprint when an edit elsewhere in the page shifts its lines.
+    templates are the repeated templates collapsed in the chunk, see
+    expand_templates.
+    """
+    index: int
+    total: int
+    content: str
+    lines: List[Optional[int]] = field(default_factory=list)
+    sections: List[str] = field(default_factory=list)
+    fingerprint: str = ""
+    templates: List[RepeatedTemplate] = field(default_factory=list)
+
+    def describe(self) -> str:
+        """
+        Returns a short description of where the chunk sits in the page.
+        """
+        if self.total == 1:
+            return "the whole page"
+        # No position: the same section of two pages gets the same prompt
+        description = "one part of the page"
+        if self.sections:
+            description += f" ({', '.join(self.sections)})"
+        return description
+
+
+def token_budget_for(model_name: str) -> int:
+    """
+    Returns the HTML token budget of a single prompt for the given model.
+
+    Args:
+        model_name: Model name as configured in OPENAI_MODEL
+
+    Returns:
+        int: Token budget, CHUNK_TOKEN_BUDGET for unknown models
+    """
+    return CHUNK_TOKEN_BUDGETS.get(model_name.split("/")[-1], CHUNK_TOKEN_BUDGET)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Returns a cheap estimate of the number of tokens in text.
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _escape(text: str) -> str:
+    """
+    Escapes text for HTML output.
+    """
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _opening_tag(tag: Tag) -> str:
+    """
+    Returns the opening tag of an element, attributes included.
+    """
+    attributes = []
+    for name, value in tag.attrs.items():
+        if isinstance(value, list):
+            value = " ".join(value)
+        attributes.append(f' {name}="{_escape(value).replace(chr(34), "&quot;")}"')
+    return f"<{tag.name}{''.join(attributes)}>"
+
+
+class _Templates:
+    """
+    Collapses the repeated templates met while rendering one document.
+    """
+
+    def __init__(self, min_repeats: int):
+        self.min_repeats = min_repeats
+        self.memo: ShapeMemo = {}
+        self.found: List[RepeatedTemplate] = []
+
+    def group(self, tag: Tag, view: DocumentView) -> Dict[int, List[Tag]]:
+        """
+        Returns the other copies of each child of tag that is the first of a template, by id().
+        """
+        children = [child for child in tag.children if isinstance(child, Tag) and not view.removes(child)]
+        return {id(group[0]): group[1:] for group in repeated_siblings(children, self.min_repeats, self.memo)}
+
+    def collapse(self, shown: Tag, copies: List[Tag]) -> str:
+        """
+        Records a template and returns the comment standing for its copies.
+        """
+        self.found.append(RepeatedTemplate(_elements(shown), [_elements(copy) for copy in copies]))
+        lines = [f"L{copy.sourceline}" for copy in copies[:MAX_LISTED_COPIES] if copy.sourceline]
+        if len(copies) > MAX_LISTED_COPIES:
+            lines.append(f"and {len(copies) - MAX_LISTED_COPIES} more")
+        at = f" at {', '.join(lines)}" if lines else ""
+        return f"<!-- {len(copies)} more <{shown.name}> with the same structure{at} -->"
+
+
+def _elements(tag: Tag) -> List[Tuple[Optional[int], str]]:
+    """
+    Returns (source line, opening tag) of an element and of each of its descendants.
+    """
+    return [(element.sourceline, _opening_tag(element)) for element in [tag, *tag.find_all(True)]]
+
+
+class _Frame:
+    """
+    An element being rendered by _render, with what its children rendered to so far.
+    """
+    __slots__ = ("tag", "remaining", "copies", "collapsed", "children", "fits", "size", "has_text")
+
+    def __init__(self, tag: Tag, view: DocumentView, templates: Optional[_Templates]):
+        self.tag = tag
+        self.remaining = iter(tag.children)
+        self.copies = templates.group(tag, view) if templates is not None else {}
+        self.collapsed = {id(copy) for group in self.copies.values() for copy in group}
+        self.children = []
+        self.fits = True
+        self.size = 0
+        self.has_text = False
+
+    def add(self, child, html: Optional[str], blocks: List[Block]) -> None:
+        self.children.append((child, html, blocks))
+        if html is None:
+            self.fits = False
+        else:
+            self.size += len(html)
+
+
+def _render(tag: Tag, limit: int, view: DocumentView,
+            templates: Optional[_Templates] = None) -> Optional[Tuple[Optional[str], List[Block], bool]]:
+    """
+    Serializes a tree minified, splitting it into lines where it is too large.
+
+    Every node is serialized once, bottom-up, leaving out what the view drops.
+    An element whose markup fits in limit characters is returned whole as
+    (html, [], has_text). A larger element is returned as (None, blocks,
+    has_text): its opening tag, for context, followed by the blocks of its
+    children. has_text tells whether the element holds any text, rendered or
+    not. Returns None when the view drops the element. With templates, only
+    the first copy of a repeated template is rendered, followed by a comment
+    standing for the others. The tree is walked with an explicit stack, so
+    deeply nested pages do not hit the recursion limit.
+    """
+    stack = [_Frame(tag, view, templates)]
+    while True:
+        frame = stack[-1]
+        child = next(frame.remaining, None)
+        if child is None:
+            # All children rendered: render the element itself and hand it to its parent
+            stack.pop()
+            rendered = _render_element(frame, limit, view)
+            if not stack:
+                return rendered
+            parent = stack[-1]
+            if rendered is None:
+                continue
+            html, blocks, child_text = rendered
+            parent.has_text = parent.has_text or child_text
+            parent.add(frame.tag, html, blocks)
+            if id(frame.tag) in parent.copies:
+                placeholder = templates.collapse(frame.tag, parent.copies[id(frame.tag)])
+                parent.add(placeholder, placeholder, [])
+        elif isinstance(child, Tag):
+            if id(child) not in frame.collapsed and not view.removes(child):
+                stack.append(_Frame(child, view, templates))
+        elif type(child) is NavigableString:
+            text = WHITESPACE.sub(" ", _escape(child))
+            if not text.strip():
+                continue
+            frame.has_text = True
+            if not view.text:
+                continue
+            if len(text) > limit:
+                # A single oversized text node: cut it into limit-sized slices
+                frame.add(child, None, [Block(text[start:start + limit]) for start in range(0, len(text), limit)])
+            else:
+                frame.add(child, text, [])
+
+
+def _render_element(frame: _Frame, limit: int,
+                    view: DocumentView) -> Optional[Tuple[Optional[str], List[Block], bool]]:
+    """
+    Renders an element from the rendering of its children, see _render.
+    """
+    tag, children, has_text = frame.tag, frame.children, frame.has_text
+    is_document = isinstance(tag, BeautifulSoup)
+    if not is_document:
+        if tag.name in view.empty_tags and not has_text:
+            return None
+        if view.only_tags is not None and tag.name not in view.only_tags and not children:
+            return None
+
+    opening = "" if is_document else _opening_tag(tag)
+    closing = "" if is_document or tag.is_empty_element else f"</{tag.name}>"
+    if frame.fits and not is_document and frame.size + len(opening) + len(closing) <= limit:
+        return opening + "".join(html for _, html, _ in children) + closing, [], has_text
+
+    blocks = [] if is_document else [Block(opening, tag.sourceline)]
+    for child, html, child_blocks in children:
+        if html is None:
+            blocks.extend(child_blocks)
+        elif isinstance(child, Tag):
+            blocks.append(Block(html.strip(), child.sourceline,
+                                child.name if child.name in STRUCTURAL_TAGS else None))
+        else:
+            blocks.append(Block(html.strip()))
+    if not is_document and tag.name in STRUCTURAL_TAGS:
+        blocks[0].section = tag.name
+        blocks[0].span = len(blocks)
+    return None, blocks, has_text
+
+
+def chunk_html(soup: BeautifulSoup, token_budget: int, view: DocumentView = FULL_VIEW,
+               min_repeats: int = TEMPLATE_MIN_REPEATS) -> List[HtmlChunk]:
+    """
+    Splits a document, as seen through a view, into chunks of at most token_budget tokens.
+
+    The document is minified and written one element per line, each line
+    prefixed with the element's source line so that issues can be mapped back to
+    the original document. Lines are packed into chunks in document order, and a
+    structural section (header, nav, main, section, ...) that fits in a chunk is
+    moved to a fresh chunk rather than split across two. Chunk boundaries are
+    content-defined (see ANCHOR_EVERY). Runs of at least min_repeats sibling
+    elements sharing one structure are written as their first element followed
+    by a comment giving the lines of the others (see utils.templates). The
+    document itself is left untouched.
+
+    Args:
+        soup: Parsed document, see utils.clean_html.parse_html
+        token_budget: Maximum number of tokens of HTML per chunk
+        view: What to keep of the document, see utils.views. The default keeps
+            everything, for documents already cleaned with utils.clean_html.
+        min_repeats: Fewest copies of a template that are collapsed, 0 to keep every copy
+
+    Returns:
+        List[HtmlChunk]: The chunks in document order, empty for an empty document
+    """
+    limit = min(token_budget, LINE_TOKENS) * CHARS_PER_TOKEN
+    templates = _Templates(min_repeats) if min_repeats else None
+    _, blocks, _ = _render(soup, limit, view, templates)
+
+    # Text nodes have no line of their own: use the closest one before them
+    last_line = None
+    texts = []
+    for block in blocks:
+        block.line = block.line or last_line
+        last_line = block.line
+        texts.append(f"L{block.line}: {block.html}" if block.line else block.html)
+    tokens = [estimate_tokens(text) for text in texts]
+
+    chunks: List[Dict] = []
+    current = {"lines": [], "source": [], "sections": [], "tokens": 0, "digest": hashlib.sha256()}
+    for index, block in enumerate(blocks):
+        needed = tokens[index]
+        if block.span > 1:
+            section_tokens = sum(tokens[index:index + block.span])
+            if section_tokens <= token_budget:
+                needed = section_tokens
+
+        if current["lines"] and current["tokens"] + needed > token_budget:
+            chunks.append(current)
+            current = {"lines": [], "source": [], "sections": [], "tokens": 0, "digest": hashlib.sha256()}
+        current["lines"].append(texts[index])
+        current["source"].append(block.line)
+        current["tokens"] += tokens[index]
+        # Placeholders list the lines of the copies, which must not move the boundaries
+        stable = PLACEHOLDER_LINES.sub(r"\1 \2", block.html) if "<!--" in block.html else block.html
+        current["digest"].update(stable.encode() + b"\n")
+        if block.section and block.section not in current["sections"]:
+            current["sections"].append(block.section)
+
+        if current["tokens"] * 2 >= token_budget and zlib.crc32(stable.encode()) % ANCHOR_EVERY == 0:
+            chunks.append(current)
+            current = {"lines": [], "source": [], "sections": [], "tokens": 0, "digest": hashlib.sha256()}
+
+    if current["lines"]:
+        chunks.append(current)
+
+    result = [
+        HtmlChunk(index=index, total=len(chunks), content="\n".join(chunk["lines"]),
+                  lines=chunk["source"], sections=chunk["sections"],
+                  fingerprint=chunk["digest"].hexdigest())
+        for index, chunk in enumerate(chunks)
+    ]
+    if templates is not None:
+        _assign_templates(result, templates.found)
+    return result
+
+
+def _assign_templates(chunks: List[HtmlChunk], templates: List[RepeatedTemplate]) -> None:
+    """
+    Attaches each template to the chunks holding the element shown for it.
+    """
+    for template in templates:
+        lines = set(template.lines)
+        holders = [chunk for chunk in chunks if lines.intersection(chunk.lines)]
+        if not holders and template.lines:
+            # Rendered inside the line of an ancestor: the last chunk starting before it
+            first = min(template.lines)
+            holders = [chunk for chunk in chunks if any(line and line <= first for line in chunk.lines)][-1:]
+        for chunk in holders:
+            chunk.templates.append(template)
+
+
+def _element_needles(element: str) -> List[str]:
+    """
+    Returns substrings that identify an element quoted by an agent.
+
+    Agents reorder attributes and switch quotes, so the element is matched on its
+    tag name and attribute values rather than on its exact markup.
+    """
+    tag = BeautifulSoup(element, "html.parser").find(True)
+    if tag is None:
+        return []
+    needles = [f"<{tag.name}"]
+    for value in tag.attrs.values():
+        if isinstance(value, list):
+            value = " ".join(value)
+        if value:
+            needles.append(f'"{value}"')
+    return needles
+
+
+def map_issue_lines(issues: List[Dict], chunk: HtmlChunk) -> List[Dict]:
+    """
+    Maps the line numbers of issues found in a chunk onto the original document.
+
+    A line that matches one of the chunk's "L<n>:" prefixes is kept. Otherwise
+    the issue's element is looked up in the chunk and the line of the element
+    that contains it is used. Issues that cannot be placed get no line rather
+    than a wrong one.
+
+    Args:
+        issues: Issues reported for the chunk
+        chunk: The chunk the issues were reported for
+
+    Returns:
+        List[Dict]: The same issues with their line numbers mapped
+    """
+    known_lines = {line for line in chunk.lines if line}
+    content_lines = chunk.content.split("\n")
+
+    for issue in issues:
+        line = issue.get("line")
+        if isinstance(line, int) and line in known_lines:
+            continue
+
+        issue["line"] = None
+        element = issue.get("element")
+        if not isinstance(element, str) or not element.strip():
+            continue
+        needles = _element_needles(element)
+        for text, source_line in zip(content_lines, chunk.lines):
+            if source_line and needles and all(needle in text for needle in needles):
+                issue["line"] = source_line
+                break
+    return issues
+
+
+def expand_templates(issues: List[Dict], chunk: HtmlChunk) -> List[Dict]:
+    """
+    Copies the issues found on the element shown for a repeated template onto its other copies.
+
+    Each copy of an issue gets the line and the opening tag of the matching
+    element of its copy, and the issue id suffixed with the copy number
+    (".2", ".3", ...). Issues not about a collapsed template are left as they are.
+
+    Args:
+        issues: Issues reported for the chunk, their lines mapped (see map_issue_lines)
+        chunk: The chunk the issues were reported for
+
+    Returns:
+        List[Dict]: The issues, each followed by its copies
+    """
+    if not chunk.templates:
+        return issues
+    expanded = []
+    for issue in issues:
+        expanded.append(issue)
+        for template in chunk.templates:
+            index = template.locate(issue)
+            if index is None:
+                continue
+            for number, copy in enumerate(template.copies, 2):
+                line, opening = copy[index]
+                expanded.append({
+                    **issue,
+                    "id": f"{issue['id']}.{number}" if issue.get("id") else issue.get("id"),
+                    "element": opening if issue.get("element") else issue.get("element"),
+                    "line": line,
+                })
+            break
+    return expanded
@@ -1,6 +1,120 @@
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, CData, Comment, NavigableString, Tag
+from bs4.builder import builder_registry
+from typing import Optional
 
-def clean_html(html_content: str) -> str:
+from core.config import HTML_PARSER
+
+# Tags dropped together with their whole subtree
+REMOVED_TAGS = frozenset(["iframe", "script", "noscript", "style", "meta", "link"])
+
+# Tags dropped when they contain no visible text
+EMPTY_TAGS = frozenset(["div", "span"])
+
+# Inline styles that hide an element
+HIDDEN_STYLES = ("display: none", "visibility: hidden")
+
+# String types that count as text, the same ones Tag.text looks at
+TEXT_TYPES = (NavigableString, CData)
+
+FALLBACK_PARSER = "html.parser"
+
+
+def resolve_parser(parser: Optional[str] = None) -> str:
+    """
+    Returns the BeautifulSoup parser to use.
+
+    Args:
+        parser: Requested parser name, defaults to HTML_PARSER
+
+    Returns:
+        str: The requested parser if it is installed, html.parser otherwise
+    """
+    parser = parser or HTML_PARSER
+    if builder_registry.lookup(parser) is None:
+        return FALLBACK_PARSER
+    return parser
+
+
+def parse_html(html_content: str, parser: Optional[str] = None) -> BeautifulSoup:
+    """
+    Parses HTML content with the configured parser.
+
+    Args:
+        html_content: Raw HTML content
+        parser: BeautifulSoup parser to use, see resolve_parser
+
+    Returns:
+        BeautifulSoup: The document tree
+    """
+    return BeautifulSoup(html_content, resolve_parser(parser))
+
+
+def clean_tree(soup: BeautifulSoup) -> BeautifulSoup:
+    """
+    Cleans a parsed document in place, in a single bottom-up pass over the tree.
+
+    Every node is visited once. Removed tags are dropped before their subtree is
+    walked, comments are extracted as they are met, and whether an element holds
+    any text is passed up from its children instead of being recomputed per
+    element, so the cost stays linear in the size of the document. As before,
+    an element hidden by an inline style still counts as text for its ancestors
+    when deciding whether a div or span is empty.
+
+    Args:
+        soup: Parsed document, see parse_html
+
+    Returns:
+        BeautifulSoup: The same, now cleaned, document tree
+    """
+    # Each frame is [tag, iterator over its children, whether it holds text]. The
+    # children are copied to a list because they are removed while iterating.
+    stack = [[soup, iter(list(soup.contents)), False]]
+    while stack:
+        frame = stack[-1]
+        child = next(frame[1], None)
+
+        if child is None:
+            # All children visited: decide on the tag itself
+            stack.pop()
+            tag, _, has_text = frame
+            if tag is soup:
+                continue
+            if tag.name in EMPTY_TAGS and not has_text:
+                tag.decompose()
+                continue
+            style = tag.get("style")
+            if style and any(hidden in style for hidden in HIDDEN_STYLES):
+                tag.decompose()
+            if has_text:
+                stack[-1][2] = True
+        elif isinstance(child, Tag):
+            if child.name in REMOVED_TAGS:
+                child.decompose()
+            else:
+                stack.append([child, iter(list(child.contents)), False])
+        elif isinstance(child, Comment):
+            child.extract()
+        elif type(child) in TEXT_TYPES and child.strip():
+            frame[2] = True
+
+    return soup
+
+
+def clean_soup(html_content: str, parser: Optional[str] = None) -> BeautifulSoup:
+    """
+    Parses HTML content and cleans it, see clean_tree.
+
+    Args:
+        html_content: Raw HTML content
+        parser: BeautifulSoup parser to use, see resolve_parser
+
+    Returns:
+        BeautifulSoup: The cleaned document tree
+    """
+    return clean_tree(parse_html(html_content, parser))
+
+
+def clean_html(html_content: str, parser: Optional[str] = None) -> str:
     """
     Cleans unnecessary elements from HTML content for QA testing.
     
@@ -10,25 +124,4 @@ def clean_html(html_content: str) -> str:
     - Non-functional scripts and styles
     - Print-specific styles, noscript content, and decorative elements
     """
-    
-    soup = BeautifulSoup(html_content, "html.parser")
-
-    # Remove unwanted tags
-    for tag in soup(["iframe", "script", "noscript", "style", "meta", "link"]):
-        tag.decompose()
-
-    # Remove comments
-    for comment in soup.find_all(string=lambda text: isinstance(text, str) and text.startswith("<!--")):
-        comment.extract()
-
-    # Remove empty divs and spans
-    for tag in soup.find_all(["div", "span"]):
-        if not tag.text.strip():
-            tag.decompose()
-
-    # Remove hidden elements
-    for tag in soup.find_all(style=True):
-        if "display: none" in tag["style"] or "visibility: hidden" in tag["style"]:
-            tag.decompose()
-
-    return str(soup.prettify())
+    return str(clean_soup(html_content, parser).prettify())
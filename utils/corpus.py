@@ -0,0 +1,239 @@
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
+from urllib.parse import quote
+import gzip
+import os
+import zlib
+
+from core.config import FETCH_MAX_BYTES
+from utils.fetcher import detect_encoding
+
+# Files of a directory corpus that are read as pages
+HTML_EXTENSIONS = (".html", ".htm", ".xhtml")
+
+# Bytes read at a time when skipping the rest of a record
+READ_SIZE = 1024 * 1024
+
+
+@dataclass
+class Document:
+    """
+    One page of a local corpus, read from a file or an archive record.
+
+    Attributes:
+        id: Identifies the document within its corpus: the path relative to the
+            corpus directory, or the WARC-Record-ID of an archive record
+        url: URL the page is analyzed under
+        content: The raw body, None when the page is larger than the size limit
+        content_type: Content-Type the page was served with, if known
+        size: Size of the body in bytes
+    """
+    id: str
+    url: str
+    content: Optional[bytes]
+    content_type: Optional[str] = None
+    size: int = 0
+
+    def text(self) -> str:
+        """
+        Returns the body decoded like a fetched page, see utils.fetcher.detect_encoding.
+        """
+        content = self.content or b""
+        return content.decode(detect_encoding(content, self.content_type), errors="replace")
+
+
+def iter_directory(path: str, base_url: str, max_bytes: int = FETCH_MAX_BYTES) -> Iterator[Document]:
+    """
+    Yields the HTML files under a directory, in a stable order, one at a time.
+
+    Args:
+        path: The directory
+        base_url: URL the directory stands for; a file is analyzed under
+            base_url followed by its relative path
+        max_bytes: Files larger than this are yielded without content
+    """
+    base_url = base_url.rstrip("/") + "/"
+    for root, directories, files in os.walk(path):
+        # Sorted in place so that os.walk descends in order too
+        directories.sort()
+        for name in sorted(files):
+            if not name.lower().endswith(HTML_EXTENSIONS):
+                continue
+            file_path = os.path.join(root, name)
+            yield _read_file(file_path, os.path.relpath(file_path, path), base_url, max_bytes)
+
+
+def _read_file(file_path: str, relative: str, base_url: str, max_bytes: int) -> Document:
+    relative = relative.replace(os.sep, "/")
+    size = os.path.getsize(file_path)
+    content = None
+    if size <= max_bytes:
+        with open(file_path, "rb") as file:
+            content = file.read()
+    return Document(relative, base_url + quote(relative), content, "text/html", size)
+
+
+def _read_headers(stream: BinaryIO) -> Tuple[Optional[str], Dict[str, str]]:
+    """
+    Reads a start line and headers up to the blank line that ends them.
+
+    Returns:
+        Tuple[Optional[str], Dict[str, str]]: The start line, None at the end of
+            the stream, and the headers with lowercased names
+    """
+    line = stream.readline()
+    while line in (b"\r\n", b"\n"):
+        line = stream.readline()
+    if not line:
+        return None, {}
+    start = line.decode("latin-1").strip()
+    headers = {}
+    for line in iter(stream.readline, b""):
+        if line in (b"\r\n", b"\n"):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return start, headers
+
+
+def _skip(stream: BinaryIO, length: int) -> None:
+    while length > 0:
+        skipped = len(stream.read(min(length, READ_SIZE)))
+        if not skipped:
+            return
+        length -= skipped
+
+
+def _dechunk(body: bytes) -> bytes:
+    """
+    Decodes a body sent with Transfer-Encoding: chunked.
+    """
+    decoded = []
+    position = 0
+    while position < len(body):
+        end = body.find(b"\r\n", position)
+        if end < 0:
+            break
+        size = int(body[position:end].split(b";")[0] or b"0", 16)
+        if size == 0:
+            break
+        decoded.append(body[end + 2:end + 2 + size])
+        position = end + 2 + size + 2
+    return b"".join(decoded)
+
+
+def _read_http_head(stream: BinaryIO, length: int) -> Tuple[int, Dict[str, str], int]:
+    """
+    Reads the status line and headers of the HTTP response stored in a WARC
+    response record, leaving the stream at the start of its body.
+
+    Args:
+        stream: The WARC file, at the start of the record block
+        length: Size of the record block
+
+    Returns:
+        Tuple[int, Dict[str, str], int]: Status, headers with lowercased names
+            and the number of bytes read
+    """
+    read = 0
+    status = 0
+    headers: Dict[str, str] = {}
+    first = True
+    while read < length:
+        line = stream.readline(length - read)
+        if not line:
+            break
+        read += len(line)
+        if line in (b"\r\n", b"\n"):
+            break
+        text = line.decode("latin-1").strip()
+        if first:
+            parts = text.split(" ", 2)
+            status = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
+            first = False
+            continue
+        name, _, value = text.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return status, headers, read
+
+
+def _decode_body(headers: Dict[str, str], body: bytes) -> bytes:
+    """
+    Undoes the transfer and content encodings of an archived HTTP response body.
+    """
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        body = _dechunk(body)
+    encoding = headers.get("content-encoding", "").lower()
+    if encoding in ("gzip", "x-gzip", "deflate"):
+        try:
+            # 32 + 15 window bits: gzip or zlib header, detected
+            body = zlib.decompress(body, 47 if encoding != "deflate" else zlib.MAX_WBITS)
+        except zlib.error:
+            pass
+    return body
+
+
+def iter_warc(path: str, max_bytes: int = FETCH_MAX_BYTES) -> Iterator[Document]:
+    """
+    Yields the HTML pages archived in a WARC file, reading one record at a time.
+
+    Response records with a 200 status and resource records are read, as long
+    as their content type is HTML; every other record is skipped. The status
+    and content type are known before the body is read, so large images,
+    videos or error pages are skipped without being read. Files ending in .gz
+    are decompressed on the fly.
+
+    Args:
+        path: The WARC file, possibly gzipped
+        max_bytes: HTML pages with a larger body are yielded without content
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as stream:
+        index = 0
+        while True:
+            start, headers = _read_headers(stream)
+            if start is None:
+                return
+            length = int(headers.get("content-length", "0"))
+            record_type = headers.get("warc-type", "")
+            url = headers.get("warc-target-uri", "").strip("<>")
+            if record_type not in ("response", "resource") or not url:
+                _skip(stream, length)
+                continue
+            index += 1
+
+            content_type = headers.get("content-type", "")
+            http_headers: Dict[str, str] = {}
+            if record_type == "response":
+                status, http_headers, read = _read_http_head(stream, length)
+                length -= read
+                content_type = http_headers.get("content-type", "")
+                if status != 200:
+                    _skip(stream, length)
+                    continue
+            if "html" not in content_type.lower():
+                _skip(stream, length)
+                continue
+
+            document_id = headers.get("warc-record-id", "").strip("<>") or f"record-{index}"
+            if length > max_bytes:
+                _skip(stream, length)
+                yield Document(document_id, url, None, content_type, length)
+                continue
+            body = _decode_body(http_headers, stream.read(length))
+            yield Document(document_id, url, body, content_type, len(body))
+
+
+def iter_corpus(path: str, base_url: str) -> Iterator[Document]:
+    """
+    Yields the pages of a directory, of a WARC file or of a single HTML file.
+
+    Args:
+        path: Where the corpus is
+        base_url: URL of the directory, for directory corpora, see iter_directory
+    """
+    if os.path.isdir(path):
+        return iter_directory(path, base_url)
+    if path.endswith((".warc", ".warc.gz")):
+        return iter_warc(path)
+    return iter([_read_file(path, os.path.basename(path), base_url.rstrip("/") + "/", FETCH_MAX_BYTES)])
@@ -0,0 +1,117 @@
+from bs4 import BeautifulSoup, NavigableString, Tag
+from dataclasses import asdict, dataclass
+from typing import Dict
+
+from utils.clean_html import HIDDEN_STYLES, TEXT_TYPES
+
+# Elements whose text is never shown
+INVISIBLE_TAGS = frozenset(["script", "style", "noscript", "template", "head", "title"])
+
+FORM_CONTROLS = frozenset(["input", "select", "textarea"])
+MEDIA_TAGS = frozenset(["video", "audio", "embed", "object"])
+
+
+@dataclass
+class PageFeatures:
+    """
+    Counts describing what a page holds, used to decide which evaluators to run.
+
+    Attributes:
+        elements: Number of elements
+        forms: Number of <form> elements
+        form_controls: Inputs (hidden ones excepted), selects and textareas
+        interactive: Form controls, buttons and elements made clickable or
+            focusable (onclick, tabindex, role="button")
+        links: Number of <a href> elements
+        images: Number of <img> and <svg> elements
+        media: Number of video, audio, embed and object elements
+        iframes: Number of <iframe> elements
+        scripts: Number of <script> elements, inline ones included
+        stylesheets: Number of <style> and <link rel="stylesheet"> elements
+        text_chars: Characters of visible text, whitespace excluded
+    """
+    elements: int = 0
+    forms: int = 0
+    form_controls: int = 0
+    interactive: int = 0
+    links: int = 0
+    images: int = 0
+    media: int = 0
+    iframes: int = 0
+    scripts: int = 0
+    stylesheets: int = 0
+    text_chars: int = 0
+
+    @property
+    def resources(self) -> int:
+        """
+        Elements that make the browser download or run something.
+        """
+        return self.images + self.media + self.iframes + self.scripts + self.stylesheets
+
+    @property
+    def text_density(self) -> float:
+        """
+        Characters of visible text per element: high for documents, low for apps.
+        """
+        return self.text_chars / self.elements if self.elements else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {**asdict(self), "resources": self.resources, "text_density": round(self.text_density, 2)}
+
+
+def _hidden(tag: Tag) -> bool:
+    style = tag.get("style")
+    return bool(style) and any(hidden in style for hidden in HIDDEN_STYLES)
+
+
+def extract_features(soup: BeautifulSoup) -> PageFeatures:
+    """
+    Counts the features of a parsed page in a single traversal.
+
+    Args:
+        soup: Parsed document, see utils.clean_html.parse_html
+
+    Returns:
+        PageFeatures: The counts
+    """
+    features = PageFeatures()
+    # (node, whether it is visible), children pushed in reverse to keep document order
+    stack = [(child, True) for child in reversed(soup.contents)]
+    while stack:
+        node, visible = stack.pop()
+        if isinstance(node, NavigableString):
+            if visible and type(node) in TEXT_TYPES:
+                features.text_chars += len("".join(node.split()))
+            continue
+        if not isinstance(node, Tag):
+            continue
+
+        name = node.name
+        features.elements += 1
+        child_visible = visible and name not in INVISIBLE_TAGS and not _hidden(node)
+        stack.extend((child, child_visible) for child in reversed(node.contents))
+
+        if name == "form":
+            features.forms += 1
+        elif name in FORM_CONTROLS:
+            if not (name == "input" and str(node.get("type", "")).lower() == "hidden"):
+                features.form_controls += 1
+                features.interactive += 1
+        elif name == "button" or node.get("role") == "button" or node.has_attr("onclick") \
+                or node.has_attr("tabindex"):
+            features.interactive += 1
+
+        if name == "a" and node.has_attr("href"):
+            features.links += 1
+        elif name in ("img", "svg"):
+            features.images += 1
+        elif name in MEDIA_TAGS:
+            features.media += 1
+        elif name == "iframe":
+            features.iframes += 1
+        elif name == "script":
+            features.scripts += 1
+        elif name == "style" or (name == "link" and "stylesheet" in (node.get("rel") or [])):
+            features.stylesheets += 1
+    return features
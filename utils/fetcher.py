@@ -0,0 +1,259 @@
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Optional
+from urllib.parse import urlsplit
+import asyncio
+import codecs
+import importlib.util
+import re
+import httpx
+
+from core.config import (
+    FETCH_TIMEOUT, FETCH_MAX_CONNECTIONS, FETCH_PER_HOST_CONCURRENCY, FETCH_MAX_BYTES, FETCH_HTTP2
+)
+
+# Byte order marks, checked before anything else as browsers do
+BOMS = ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+
+# Encodings declared in a <meta> tag, looked for in the first bytes of a page
+META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9_:.-]+)""", re.IGNORECASE)
+META_PRESCAN_BYTES = 1024
+
+# Labels that browsers decode as windows-1252
+WINDOWS_1252_LABELS = frozenset(["iso-8859-1", "latin1", "latin-1", "us-ascii", "ascii"])
+
+
+class PageTooLargeError(Exception):
+    """
+    Raised when a page is larger than the fetcher's byte limit.
+    """
+
+
+@dataclass
+class FetchedPage:
+    """
+    A page downloaded by PageFetcher.
+
+    Attributes:
+        url: URL the page was requested with
+        status_code: HTTP status of the final response
+        text: The decoded body, empty when not_modified is set
+        encoding: Encoding the body was decoded with
+        etag: ETag validator sent by the server
+        last_modified: Last-Modified validator sent by the server
+        not_modified: Whether the server answered 304 to a conditional request
+        size: Size of the body in bytes
+    """
+    url: str
+    status_code: int
+    text: str = ""
+    encoding: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    not_modified: bool = False
+    size: int = 0
+
+
+def create_client() -> httpx.AsyncClient:
+    """
+    Creates a pooled HTTP client for fetching pages.
+
+    The client keeps connections alive, follows redirects and speaks HTTP/2 when
+    FETCH_HTTP2 is on and the h2 package is installed.
+    """
+    return httpx.AsyncClient(
+        timeout=FETCH_TIMEOUT,
+        limits=httpx.Limits(max_connections=FETCH_MAX_CONNECTIONS,
+                            max_keepalive_connections=FETCH_MAX_CONNECTIONS),
+        http2=FETCH_HTTP2 and importlib.util.find_spec("h2") is not None,
+        follow_redirects=True,
+    )
+
+
+def _known_encoding(label: Optional[str]) -> Optional[str]:
+    """
+    Returns the Python codec for an encoding label, or None if it is unknown.
+    """
+    if not label:
+        return None
+    label = label.strip().strip("\"'").lower()
+    if label in WINDOWS_1252_LABELS:
+        return "cp1252"
+    try:
+        return codecs.lookup(label).name
+    except LookupError:
+        return None
+
+
+def detect_encoding(content: bytes, content_type: Optional[str] = None) -> str:
+    """
+    Returns the encoding of an HTML body without decoding it.
+
+    A byte order mark wins, then the charset of the Content-Type header, then a
+    <meta> charset declaration near the top of the page, and finally UTF-8.
+
+    Args:
+        content: The raw body
+        content_type: Value of the Content-Type header
+
+    Returns:
+        str: Name of a Python codec
+    """
+    for bom, encoding in BOMS:
+        if content.startswith(bom):
+            return encoding
+    if content_type:
+        for parameter in content_type.split(";")[1:]:
+            name, _, value = parameter.partition("=")
+            if name.strip().lower() == "charset":
+                encoding = _known_encoding(value)
+                if encoding:
+                    return encoding
+    match = META_CHARSET.search(content[:META_PRESCAN_BYTES])
+    if match:
+        encoding = _known_encoding(match.group(1).decode("ascii", "ignore"))
+        # A page that could be read to find the tag is not UTF-16
+        if encoding and not encoding.startswith("utf-16"):
+            return encoding
+    return "utf-8"
+
+
+@dataclass
+class _HostLimit:
+    """
+    The request slots of one host, and the number of requests using or waiting for them.
+    """
+    semaphore: asyncio.Semaphore
+    users: int = 0
+
+
+class PageFetcher:
+    """
+    Fetches pages through a shared client, with a concurrency limit per host.
+
+    The client's connection pool is reused across pages, while the per-host limit
+    keeps a batch from flooding a single site. Bodies are streamed and the
+    download stops as soon as a page exceeds max_bytes.
+    """
+
+    def __init__(self, client: Optional[httpx.AsyncClient] = None,
+                 per_host: int = FETCH_PER_HOST_CONCURRENCY, max_bytes: int = FETCH_MAX_BYTES):
+        """
+        Initialize the fetcher.
+
+        Args:
+            client: Client whose connection pool is shared by every fetch. By
+                default one is created with create_client on first use.
+            per_host: Number of requests allowed in flight to the same host
+            max_bytes: Largest page body downloaded, in bytes
+        """
+        self._client = client
+        self._owns_client = client is None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.per_host = max(1, per_host)
+        self.max_bytes = max_bytes
+        self._hosts: Dict[str, _HostLimit] = {}
+
+    async def get_client(self) -> httpx.AsyncClient:
+        """
+        Returns the shared client, created on first use.
+        """
+        loop = asyncio.get_running_loop()
+        if self._owns_client and self._loop is not loop:
+            # Pooled connections belong to the event loop that opened them
+            stale, self._client = self._client, create_client()
+            self._hosts = {}
+            if stale is not None:
+                try:
+                    await stale.aclose()
+                except RuntimeError:
+                    # Its connections went away with their event loop
+                    pass
+        self._loop = loop
+        return self._client
+
+    async def aclose(self) -> None:
+        """
+        Closes the client if the fetcher created it.
+        """
+        if self._owns_client and self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+    @asynccontextmanager
+    async def _host_limit(self, url: str) -> AsyncIterator[None]:
+        """
+        Holds one of the per_host request slots of the URL's host.
+
+        A host is only tracked while it has requests in flight or waiting, so
+        the fetcher does not keep an entry for every host it ever fetched from.
+        """
+        host = urlsplit(url).netloc.lower()
+        limit = self._hosts.get(host)
+        if limit is None:
+            limit = self._hosts[host] = _HostLimit(asyncio.Semaphore(self.per_host))
+        limit.users += 1
+        try:
+            async with limit.semaphore:
+                yield
+        finally:
+            limit.users -= 1
+            if limit.users == 0 and self._hosts.get(host) is limit:
+                del self._hosts[host]
+
+    async def fetch(self, url: str, etag: Optional[str] = None,
+                    last_modified: Optional[str] = None) -> FetchedPage:
+        """
+        Downloads a page, revalidating it when validators of a previous copy are given.
+
+        Args:
+            url: URL of the page
+            etag: ETag of the copy already known, sent as If-None-Match
+            last_modified: Last-Modified of that copy, sent as If-Modified-Since
+
+        Returns:
+            FetchedPage: The decoded page, or a page with not_modified set when
+            the server reports the known copy as current
+
+        Raises:
+            PageTooLargeError: If the page is larger than max_bytes
+            httpx.HTTPStatusError: If the server answered with an error status
+            httpx.RequestError: If the request itself failed
+        """
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        client = await self.get_client()
+        async with self._host_limit(url):
+            async with client.stream("GET", url, headers=headers) as response:
+                validators = {"etag": response.headers.get("etag"),
+                              "last_modified": response.headers.get("last-modified")}
+                if response.status_code == 304 and headers:
+                    return FetchedPage(url=url, status_code=304, not_modified=True,
+                                       etag=validators["etag"] or etag,
+                                       last_modified=validators["last_modified"] or last_modified)
+                response.raise_for_status()
+
+                length = response.headers.get("content-length", "")
+                if length.isdigit() and int(length) > self.max_bytes:
+                    raise PageTooLargeError(f"Page is {length} bytes, the limit is {self.max_bytes}")
+                body = bytearray()
+                async for data in response.aiter_bytes():
+                    body += data
+                    if len(body) > self.max_bytes:
+                        # Leaving the stream closes the connection mid-download
+                        raise PageTooLargeError(f"Page is larger than the limit of {self.max_bytes} bytes")
+
+        content = bytes(body)
+        encoding = detect_encoding(content, response.headers.get("content-type"))
+        return FetchedPage(url=url, status_code=response.status_code,
+                           text=content.decode(encoding, errors="replace"), encoding=encoding,
+                           size=len(content), **validators)
+
+
+# Fetcher shared by every request for the lifetime of the app, closed by main.py
+page_fetcher = PageFetcher()
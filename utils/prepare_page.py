@@ -0,0 +1,135 @@
+from bs4 import BeautifulSoup
+from typing import Dict, List, Optional, Sequence
+import threading
+
+from core.metrics import span
+from rules.engine import RuleEngine, rule_engine
+from utils.clean_html import parse_html
+from utils.chunk_html import HtmlChunk, chunk_html
+from utils.features import PageFeatures, extract_features
+from utils.views import VIEWS, LAYOUT_VIEW
+
+
+class PageSnapshot:
+    """
+    A fetched page, parsed once and shared by every evaluator of a request.
+
+    The parsed document keeps the source line of every element and is never
+    modified after parsing. Each evaluator reads the page through a view (see
+    utils.views), chunked on first use and then kept for the rest of the
+    request, so evaluators that share a view share its chunks too.
+
+    A snapshot pickles without its parsed document: one prepared in another
+    process (see prepare_detached) only has the views and features computed
+    before it was sent.
+    """
+
+    def __init__(self, soup: BeautifulSoup, token_budget: int, rule_issues: Optional[List[Dict]] = None):
+        """
+        Initialize the snapshot.
+
+        Args:
+            soup: The parsed page, which must not be modified afterwards
+            token_budget: Maximum number of tokens per chunk
+            rule_issues: Issues found by the rule engine on the page
+        """
+        self.soup = soup
+        self.token_budget = token_budget
+        self.rule_issues = rule_issues or []
+        self._views: Dict[str, List[HtmlChunk]] = {}
+        self._features: Optional[PageFeatures] = None
+        # Views may be requested from the event loop and the analysis thread
+        self._lock = threading.Lock()
+
+    def view(self, name: str) -> List[HtmlChunk]:
+        """
+        Returns the chunks of the page as seen through a view.
+
+        Args:
+            name: Name of the view, a key of utils.views.VIEWS
+
+        Returns:
+            List[HtmlChunk]: The chunks in document order, empty for an empty view
+        """
+        with self._lock:
+            if name not in self._views:
+                if self.soup is None:
+                    raise ValueError(f"View {name} was not prepared before the page left its process")
+                with span("views"):
+                    self._views[name] = chunk_html(self.soup, self.token_budget, VIEWS[name])
+            return self._views[name]
+
+    @property
+    def features(self) -> PageFeatures:
+        """
+        What the page holds (forms, images, resources, ...), extracted on first use.
+        """
+        with self._lock:
+            if self._features is None:
+                if self.soup is None:
+                    raise ValueError("Features were not extracted before the page left its process")
+                with span("features"):
+                    self._features = extract_features(self.soup)
+            return self._features
+
+    def __getstate__(self) -> Dict:
+        state = self.__dict__.copy()
+        state["soup"] = None
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def chunks(self) -> List[HtmlChunk]:
+        """
+        The chunks of the visible page, empty when the page shows nothing.
+        """
+        return self.view(LAYOUT_VIEW.name)
+
+
+def prepare_page(html_content: str, token_budget: int, engine: Optional[RuleEngine] = None,
+                 parser: Optional[str] = None) -> PageSnapshot:
+    """
+    Parses a page once and runs the deterministic rules on it.
+
+    Args:
+        html_content: Raw HTML of the page
+        token_budget: Maximum number of tokens per chunk
+        engine: Rule engine to run, defaults to rules.engine.rule_engine
+        parser: BeautifulSoup parser, defaults to HTML_PARSER
+
+    Returns:
+        PageSnapshot: The page, ready for the evaluators
+    """
+    with span("parse_html"):
+        soup = parse_html(html_content, parser)
+    with span("rules"):
+        rule_issues = (engine or rule_engine).run(soup)
+    return PageSnapshot(soup, token_budget, rule_issues)
+
+
+def prepare_detached(html_content: str, token_budget: int, views: Sequence[str],
+                     parser: Optional[str] = None) -> PageSnapshot:
+    """
+    Prepares a page with its views and features, to be sent to another process.
+
+    Meant to run in a process pool: everything that needs the parsed document
+    is done here, so the snapshot is complete once pickled without it.
+
+    Args:
+        html_content: Raw HTML of the page
+        token_budget: Maximum number of tokens per chunk
+        views: Names of the views the evaluators will read
+        parser: BeautifulSoup parser, defaults to HTML_PARSER
+
+    Returns:
+        PageSnapshot: The page, see prepare_page
+    """
+    page = prepare_page(html_content, token_budget, parser=parser)
+    for name in views:
+        page.view(name)
+    page.features
+    return page
@@ -0,0 +1,33 @@
+from typing import List, Tuple
+import xml.etree.ElementTree as ET
+
+
+def parse_sitemap(xml_content: str) -> Tuple[List[str], List[str]]:
+    """
+    Parses a sitemap or a sitemap index.
+
+    Args:
+        xml_content: Content of the sitemap.xml file
+
+    Returns:
+        Tuple[List[str], List[str]]: Page URLs of a <urlset> and nested sitemap
+        URLs of a <sitemapindex>, in document order
+
+    Raises:
+        ValueError: If the content is not a sitemap
+    """
+    try:
+        root = ET.fromstring(xml_content.strip())
+    except ET.ParseError as e:
+        raise ValueError(f"Invalid sitemap XML: {str(e)}")
+
+    # Ignore the sitemap namespace, some generators omit or change it
+    root_name = root.tag.rsplit("}", 1)[-1]
+    if root_name not in ("urlset", "sitemapindex"):
+        raise ValueError(f"Not a sitemap: unexpected root element <{root_name}>")
+
+    locations = [element.text.strip() for element in root.iter()
+                 if element.tag.rsplit("}", 1)[-1] == "loc" and element.text and element.text.strip()]
+    if root_name == "sitemapindex":
+        return [], locations
+    return locations, []
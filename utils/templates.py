@@ -0,0 +1,119 @@
+from bs4 import Tag
+from typing import Dict, List, Sequence, Tuple
+import hashlib
+
+from utils.clean_html import TEXT_TYPES
+
+# Attributes whose value is part of the structure of an element, not its content
+STRUCTURAL_ATTRIBUTES = frozenset(["type", "role", "rel"])
+
+# Smallest template worth collapsing, in elements. Smaller ones (e.g. the <li><a>
+# of a menu) cost little and their text is what the evaluators look at.
+TEMPLATE_MIN_ELEMENTS = 3
+
+# Most characters of text per element of a template. Cards, results and rows hold
+# short labels; repeated blocks of prose (e.g. the sections of an article) are
+# content the evaluators must read in full, not templates.
+TEMPLATE_MAX_TEXT_PER_ELEMENT = 50
+
+# id() of an element -> (structure fingerprint, number of elements, characters of text)
+ShapeMemo = Dict[int, Tuple[str, int, int]]
+
+
+def structure_fingerprint(tag: Tag, memo: ShapeMemo) -> Tuple[str, int, int]:
+    """
+    Returns the fingerprint of the structure of an element and its size.
+
+    Two elements get the same fingerprint when they have the same tag names,
+    classes and attribute names all the way down, whatever their text and the
+    values of their other attributes (href, src, ...). Whether an attribute is
+    empty is kept, so an <img alt=""> does not pass for an <img alt="Red shoe">.
+
+    Args:
+        tag: The element
+        memo: Fingerprints computed so far, shared by the calls on one document
+            so that every element is hashed once
+
+    Returns:
+        Tuple[str, int, int]: Hex digest, the number of elements it covers and
+            their characters of text, whitespace excluded
+    """
+    if id(tag) in memo:
+        return memo[id(tag)]
+
+    # Post-order walk with an explicit stack, so deeply nested pages do not hit
+    # the recursion limit. Each frame is [tag, iterator over its children,
+    # parts of its fingerprint, elements, characters of text].
+    stack = [[tag, iter(tag.children), _own_parts(tag), 1, 0]]
+    while True:
+        frame = stack[-1]
+        child = next(frame[1], None)
+        if child is None:
+            stack.pop()
+            element, _, parts, elements, text = frame
+            memo[id(element)] = (hashlib.sha1("\0".join(parts).encode()).hexdigest(), elements, text)
+            if not stack:
+                return memo[id(tag)]
+            child = element
+        elif not isinstance(child, Tag):
+            if type(child) in TEXT_TYPES and child.strip():
+                frame[2].append("#text")
+                frame[4] += len("".join(child.split()))
+            continue
+        elif id(child) not in memo:
+            stack.append([child, iter(child.children), _own_parts(child), 1, 0])
+            continue
+        # A child element is done: add it to its parent
+        fingerprint, size, child_text = memo[id(child)]
+        parent = stack[-1]
+        parent[2].append(fingerprint)
+        parent[3] += size
+        parent[4] += child_text
+
+
+def _own_parts(tag: Tag) -> List[str]:
+    """
+    Returns the parts of the fingerprint of an element that come from the element itself.
+    """
+    parts = [tag.name]
+    for name in sorted(tag.attrs):
+        value = tag.attrs[name]
+        if isinstance(value, list):
+            value = " ".join(sorted(value))
+        if name == "class" or name in STRUCTURAL_ATTRIBUTES:
+            parts.append(f"{name}={value}")
+        else:
+            parts.append(name if value else f"{name}=")
+    return parts
+
+
+def repeated_siblings(children: Sequence[Tag], min_repeats: int, memo: ShapeMemo) -> List[List[Tag]]:
+    """
+    Finds the templates repeated among the children of an element.
+
+    Args:
+        children: The child elements, in document order
+        min_repeats: Fewest copies that make a template, 0 to find none
+        memo: See structure_fingerprint
+
+    Returns:
+        List[List[Tag]]: The copies of each template, in document order, the
+            templates ordered by their first copy
+    """
+    if min_repeats < 2 or len(children) < min_repeats:
+        return []
+
+    # Only elements whose tag and class repeat are worth fingerprinting
+    candidates: Dict[Tuple[str, str], int] = {}
+    for child in children:
+        cheap = (child.name, str(child.get("class")))
+        candidates[cheap] = candidates.get(cheap, 0) + 1
+
+    groups: Dict[str, List[Tag]] = {}
+    for child in children:
+        if candidates[(child.name, str(child.get("class")))] < min_repeats:
+            continue
+        fingerprint, elements, text = structure_fingerprint(child, memo)
+        if elements >= TEMPLATE_MIN_ELEMENTS and text <= elements * TEMPLATE_MAX_TEXT_PER_ELEMENT:
+            groups.setdefault(fingerprint, []).append(child)
+    return [group for group in groups.values() if len(group) >= min_repeats]
@@ -0,0 +1,71 @@
+from bs4 import Tag
+from dataclasses import dataclass
+from typing import FrozenSet, Optional
+
+from utils.clean_html import REMOVED_TAGS, EMPTY_TAGS, HIDDEN_STYLES
+
+# Elements that make the browser load or run something, and the metadata that
+# decides how the page is rendered
+RESOURCE_TAGS = frozenset(["head", "base", "meta", "link", "script", "style", "img", "picture",
+                           "source", "video", "audio", "track", "iframe", "embed", "object"])
+
+
+@dataclass(frozen=True)
+class DocumentView:
+    """
+    A filtered rendering of a parsed page, built for the needs of one evaluator.
+
+    Views never modify the document: utils.chunk_html.chunk_html applies them
+    while serializing, so any number of views can be built from one parse.
+
+    Attributes:
+        name: Name of the view, see VIEWS
+        removed_tags: Elements dropped together with their content
+        kept_meta: Names of <meta name="..."> tags kept even when meta is removed
+        only_tags: When set, only these elements are kept, along with the
+            ancestors needed to place them in the page
+        text: Whether text nodes are kept
+        hidden: Whether elements hidden by an inline style are dropped
+        empty_tags: Elements dropped when they hold no text
+        summary: What the view leaves out, appended to the description of a
+            chunk in the prompts
+    """
+    name: str
+    removed_tags: FrozenSet[str] = frozenset()
+    kept_meta: FrozenSet[str] = frozenset()
+    only_tags: Optional[FrozenSet[str]] = None
+    text: bool = True
+    hidden: bool = False
+    empty_tags: FrozenSet[str] = frozenset()
+    summary: str = ""
+
+    def removes(self, tag: Tag) -> bool:
+        """
+        Returns whether the view drops an element and its content.
+        """
+        if tag.name in self.removed_tags:
+            return not (tag.name == "meta" and tag.get("name") in self.kept_meta)
+        if self.hidden:
+            style = tag.get("style")
+            return bool(style) and any(hidden in style for hidden in HIDDEN_STYLES)
+        return False
+
+
+# Everything, as parsed
+FULL_VIEW = DocumentView("full")
+
+# Visible text and layout, as produced by utils.clean_html: for UX and HTML structure
+LAYOUT_VIEW = DocumentView("layout", removed_tags=REMOVED_TAGS, hidden=True, empty_tags=EMPTY_TAGS,
+                           summary=" without scripts, styles, metadata and hidden elements")
+
+# Visible content with its roles, labels and ARIA attributes. Wrappers without
+# text are kept since they may carry roles, and so is the viewport meta tag.
+SEMANTIC_VIEW = DocumentView("semantic", removed_tags=frozenset(["script", "noscript", "style", "link", "meta"]),
+                             kept_meta=frozenset(["viewport"]), hidden=True,
+                             summary=" without scripts, styles and hidden elements")
+
+# The <head> and every resource the page loads, without text or inline code
+RESOURCES_VIEW = DocumentView("resources", only_tags=RESOURCE_TAGS, text=False,
+                              summary=" reduced to its <head> and the resources it loads, text and inline code left out")
+
+VIEWS = {view.name: view for view in (FULL_VIEW, LAYOUT_VIEW, SEMANTIC_VIEW, RESOURCES_VIEW)}